@@ -0,0 +1,374 @@
+# benchmarks/bench_crawl.py
+"""
+Офлайн-бенчмарк обхода: вместо Wayback Machine запускается локальный
+стенд (benchmarks/wayback_stub.py) с корпусом Shift_JIS/EUC-JP/UTF-8
+страниц, и через него проходит полный конвейер — семена из CDX
+(страницы, Resume-Key, 429), загрузка снимков, разбор, сохранение.
+
+Отчёт:
+  - сквозная скорость, URL/с, и пиковый RSS процесса;
+  - задержки этапов (среднее, p50, p95) по гистограмме Tracer;
+  - отдельные замеры: Parser (мс/страница по кодировкам),
+    Storage (Bloom: add_visited/is_visited, мкс/URL),
+    Scheduler.enqueue_url (мкс/URL), WaybackCDXClient (записей/с,
+    JSON-страницы и построчный поток).
+
+Результат сохраняется в benchmarks/results/<время>-<коммит>.json
+и сравнивается с предыдущим сохранённым.
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_crawl [--domains 4] [--pages 150] [--depth 2]
+"""
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import logging
+import argparse
+import resource
+import tempfile
+import subprocess
+import multiprocessing
+from typing import Dict, List, Optional
+
+from config import load_config
+from crawler.scheduler import Scheduler
+from crawler.fetcher import Fetcher
+from crawler.parser import Parser
+from crawler.parse_pool import ParsePool
+from crawler.storage import Storage
+from crawler.stats import Stats
+from crawler.tracing import Tracer
+from crawler.congestion import AdaptiveLimiter
+from crawler.dedup import ContentDedup
+from crawler.wayback_cdx import WaybackCDXClient
+from crawler.encoding import CharsetDecoder
+from crawler.utils import configure_wayback
+from .corpus import ENCODINGS, Corpus
+from . import wayback_stub
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), 'results')
+
+def quantile(bounds: List[float], counts: List[int], q: float) -> float:
+    """
+    Оценка квантиля по корзинам гистограммы: верхняя граница корзины.
+    """
+    total = sum(counts)
+    if not total:
+        return 0.0
+    rank = q * total
+    cumulative = 0
+    for bound, n in zip(bounds + [bounds[-1]], counts):
+        cumulative += n
+        if cumulative >= rank:
+            return bound
+    return bounds[-1]
+
+def stage_report(tracer: Tracer) -> Dict[str, dict]:
+    histogram = tracer.stage_seconds
+    report = {}
+    for (stage,), (counts, total, count) in sorted(histogram.series.items()):
+        report[stage] = {
+            'count': count,
+            'mean_ms': round(total / count * 1000, 3) if count else 0.0,
+            'p50_ms': round(quantile(histogram.bounds, counts, 0.5) * 1000, 3),
+            'p95_ms': round(quantile(histogram.bounds, counts, 0.95) * 1000, 3),
+        }
+    return report
+
+def peak_rss_mb() -> float:
+    # ru_maxrss: килобайты в Linux, байты в macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == 'darwin' else rss / 1024
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+def start_stub(port: int, corpus: Corpus, cdx_429_every: int, snapshot_429_rate: float):
+    ctx = multiprocessing.get_context('spawn')
+    process = ctx.Process(
+        target=wayback_stub.run, args=(port, corpus),
+        kwargs={'cdx_429_every': cdx_429_every, 'snapshot_429_rate': snapshot_429_rate},
+        daemon=True
+    )
+    process.start()
+    deadline = time.monotonic() + 15
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.2).close()
+            return process
+        except OSError:
+            time.sleep(0.1)
+    process.terminate()
+    raise RuntimeError(f"Wayback stub did not start on port {port}")
+
+def bench_config(args, workdir: str, corpus: Corpus):
+    """
+    config.yaml, перенаправленный на стенд и временный каталог.
+    """
+    cfg = load_config(args.config)
+    base = f"http://127.0.0.1:{args.port}"
+
+    domains_file = os.path.join(workdir, 'domains.txt')
+    with open(domains_file, 'w') as f:
+        f.write('\n'.join(corpus.domain_names) + '\n')
+
+    cfg.cache_dir = cfg.storage.cache_dir = os.path.join(workdir, 'cache')
+    cfg.storage.results_dir = os.path.join(workdir, 'results')
+    cfg.storage.page_cache = False
+    cfg.cdx.base_url = f"{base}/cdx/search/cdx"
+    cfg.cdx.wayback_base = f"{base}/web"
+    cfg.cdx.target_domains_file = domains_file
+    cfg.cdx.index_dir = os.path.join(workdir, 'cdx_index')
+    cfg.cdx.page_size = args.cdx_page_size
+    cfg.cdx.max_pages = 0
+    cfg.cdx.backoff_factor = 0.1
+    cfg.cdx.from_date, cfg.cdx.to_date = "20040101000000", "20041231235959"
+    cfg.fetch.rate_limit = 0.001
+    cfg.fetch.host_rate_limits = {'127.0.0.1': 0.001}
+    cfg.fetch.backoff_base = 0.05
+    cfg.fetch.backoff_max = 1
+    cfg.scheduler.seeds = []
+    cfg.scheduler.max_depth = cfg.max_depth = args.depth
+    cfg.scheduler.frontier_path = os.path.join(workdir, 'frontier.sqlite3')
+    cfg.scheduler.log_every = 0
+    cfg.parser.workers = args.parse_workers
+    cfg.warc.enabled = False
+    return cfg
+
+def make_limiter(cfg, stats: Stats) -> Optional[AdaptiveLimiter]:
+    if not cfg.concurrency.enabled:
+        return None
+    return AdaptiveLimiter(
+        initial_window=cfg.concurrency.initial_window,
+        min_window=cfg.concurrency.min_window,
+        max_window=cfg.concurrency.max_window,
+        increase=cfg.concurrency.increase,
+        decrease=cfg.concurrency.decrease,
+        latency_spike=cfg.concurrency.latency_spike,
+        cooldown=cfg.concurrency.cooldown,
+        stats=stats
+    )
+
+async def bench_end_to_end(cfg, domains: List[str]) -> dict:
+    stats = Stats()
+    storage = Storage(cfg.storage, stats)
+    storage.start()
+    tracer = Tracer(stats.metrics, '', 0)
+    fetcher = Fetcher(cfg.fetch, make_limiter(cfg, stats), stats, None, None, tracer)
+    await fetcher._ensure_session()
+    parser = Parser(cfg.parser, domains)
+    parse_pool = ParsePool(cfg.parser, parser)
+    dedup = None
+    if cfg.dedup.enabled:
+        dedup = ContentDedup(cfg.dedup.max_entries, cfg.dedup.near_duplicates,
+                             cfg.dedup.near_distance, cfg.dedup.shingle_size)
+    scheduler = Scheduler(cfg.scheduler, cfg.cdx, storage, fetcher, parser, stats, parse_pool, dedup,
+                          tracer=tracer)
+
+    started = time.perf_counter()
+    run_task = asyncio.create_task(scheduler.run())
+    while scheduler.bootstrap_task is None:
+        await asyncio.sleep(0.01)
+    await scheduler.bootstrap_task
+    bootstrap_seconds = time.perf_counter() - started
+    await scheduler.queue.join()
+    elapsed = time.perf_counter() - started
+    await scheduler.shutdown()
+    await run_task
+
+    processed = await stats.get('processed_urls')
+    return {
+        'urls': processed,
+        'seconds': round(elapsed, 3),
+        'urls_per_second': round(processed / elapsed, 1) if elapsed else 0.0,
+        'bootstrap_seconds': round(bootstrap_seconds, 3),
+        'matches': await stats.get('match_count'),
+        'errors': await stats.get('error_count'),
+        'fetch_failures': await stats.get('fetch_failures'),
+        'charset_misdecodes': await stats.get('charset_misdecodes'),
+        'stages': stage_report(tracer),
+    }
+
+def bench_parser(cfg, corpus: Corpus, pages: int) -> Dict[str, dict]:
+    """
+    Декодирование (CharsetDecoder без кэша по хостам) и разбор, мс/страница.
+    """
+    parser = Parser(cfg.parser, corpus.domain_names)
+    decoder = CharsetDecoder(cfg.fetch.sniff_bytes, cfg.fetch.detect_bytes, cache_size=0)
+    base = cfg.cdx.wayback_base
+    report = {}
+    for offset, encoding in enumerate(ENCODINGS):
+        samples = []
+        for index in range(offset, pages * len(ENCODINGS), len(ENCODINGS)):
+            domain = corpus.domain_names[index % len(corpus.domain_names)]
+            page = corpus.page(domain, index % corpus.pages)
+            samples.append((page, f"{base}/20040101000000id_/http://{domain}/p{index}.html"))
+
+        started = time.perf_counter()
+        texts = [decoder.decode(page.body, page.content_type).text for page, _ in samples]
+        decode_ms = (time.perf_counter() - started) / len(samples) * 1000
+
+        started = time.perf_counter()
+        for (page, url), text in zip(samples, texts):
+            parser.parse(text, url)
+        parse_ms = (time.perf_counter() - started) / len(samples) * 1000
+        report[encoding] = {'decode_ms': round(decode_ms, 4), 'parse_ms': round(parse_ms, 4)}
+    return report
+
+def bench_storage(cfg, workdir: str, count: int) -> dict:
+    stats = Stats()
+    cfg.storage.cache_dir = os.path.join(workdir, 'storage-bench')
+    storage = Storage(cfg.storage, stats)
+    urls = [f"http://d{i % 97}.bench.jp/p{i}.html" for i in range(count)]
+
+    started = time.perf_counter()
+    for url in urls:
+        storage.add_visited(url)
+    add_us = (time.perf_counter() - started) / count * 1e6
+
+    started = time.perf_counter()
+    for url in urls:
+        storage.is_visited(url)
+    check_us = (time.perf_counter() - started) / count * 1e6
+    storage.close()
+    return {'add_visited_us': round(add_us, 3), 'is_visited_us': round(check_us, 3)}
+
+async def bench_enqueue(cfg, workdir: str, count: int) -> dict:
+    """
+    Scheduler.enqueue_url: канонизация, Bloom, постановка в HostFrontier.
+    """
+    stats = Stats()
+    cfg.storage.cache_dir = os.path.join(workdir, 'enqueue-bench')
+    cfg.scheduler.queue_size = count * 2
+    storage = Storage(cfg.storage, stats)
+    fetcher = Fetcher(cfg.fetch, None, stats)
+    parser = Parser(cfg.parser)
+    results = {}
+    for label, frontier_path in (('memory', ''), ('sqlite', os.path.join(workdir, 'enqueue.sqlite3'))):
+        cfg.scheduler.frontier_path = frontier_path
+        scheduler = Scheduler(cfg.scheduler, cfg.cdx, storage, fetcher, parser, stats)
+        urls = [f"{cfg.cdx.wayback_base}/20040101000000id_/http://d{i % 13}.bench.jp/{label}/p{i}.html"
+                for i in range(count)]
+        started = time.perf_counter()
+        for url in urls:
+            await scheduler.enqueue_url(url, priority=1, depth=1)
+        results[f"{label}_us"] = round((time.perf_counter() - started) / count * 1e6, 3)
+        await scheduler.queue.close()
+        await scheduler.queue.close_store()
+    storage.close()
+    return results
+
+async def bench_cdx(cfg, domains: List[str]) -> dict:
+    import aiohttp
+    report = {}
+    async with aiohttp.ClientSession() as session:
+        client = WaybackCDXClient(
+            session, max_retries=cfg.cdx.max_retries, backoff_factor=cfg.cdx.backoff_factor,
+            request_timeout=cfg.cdx.request_timeout, max_pages=0, page_size=cfg.cdx.page_size,
+            collapse=cfg.cdx.collapse, base_url=cfg.cdx.base_url, wayback_base=cfg.cdx.wayback_base
+        )
+        for mode in ('json', 'stream'):
+            records = 0
+            started = time.perf_counter()
+            for domain in domains:
+                if mode == 'json':
+                    async for page in client.iter_snapshot_pages(domain):
+                        records += len(page)
+                else:
+                    async for _ in client.stream_snapshots(domain):
+                        records += 1
+            elapsed = time.perf_counter() - started
+            report[mode] = {'records': records, 'records_per_second': round(records / elapsed, 1)}
+    return report
+
+def previous_result(directory: str) -> Optional[dict]:
+    try:
+        names = sorted(name for name in os.listdir(directory) if name.endswith('.json'))
+    except FileNotFoundError:
+        return None
+    if not names:
+        return None
+    with open(os.path.join(directory, names[-1]), 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def flatten(data: dict, prefix: str = '') -> Dict[str, float]:
+    values = {}
+    for key, value in data.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            values.update(flatten(value, name + '.'))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            values[name] = value
+    return values
+
+def print_report(result: dict, previous: Optional[dict]):
+    old = flatten(previous['results']) if previous else {}
+    if previous:
+        print(f"compared with {previous['revision']} ({previous['timestamp']})")
+    for name, value in flatten(result['results']).items():
+        line = f"  {name:45s} {value:>12}"
+        before = old.get(name)
+        if before:
+            line += f"   {(value - before) / before * 100:+7.1f}%"
+        print(line)
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument('--config', default='config.yaml')
+    ap.add_argument('--port', type=int, default=8731)
+    ap.add_argument('--domains', type=int, default=4)
+    ap.add_argument('--pages', type=int, default=150, help='Страниц на домен')
+    ap.add_argument('--size', type=int, default=8000, help='Размер текста страницы в символах')
+    ap.add_argument('--depth', type=int, default=2)
+    ap.add_argument('--parse-workers', type=int, default=0)
+    ap.add_argument('--cdx-page-size', type=int, default=100)
+    ap.add_argument('--cdx-429-every', type=int, default=5, help='Каждый N-й запрос к CDX получает 429')
+    ap.add_argument('--snapshot-429-rate', type=float, default=0.01)
+    ap.add_argument('--micro-count', type=int, default=20000, help='URL для замеров Storage и enqueue')
+    ap.add_argument('--micro-pages', type=int, default=100, help='Страниц каждой кодировки для замера Parser')
+    ap.add_argument('--results-dir', default=RESULTS_DIR)
+    ap.add_argument('--no-save', action='store_true')
+    args = ap.parse_args()
+
+    logging.basicConfig(level=logging.ERROR)
+    corpus = Corpus(args.domains, args.pages, size=args.size)
+    stub = start_stub(args.port, corpus, args.cdx_429_every, args.snapshot_429_rate)
+    try:
+        with tempfile.TemporaryDirectory(prefix='jtk-bench-') as workdir:
+            cfg = bench_config(args, workdir, corpus)
+            configure_wayback(cfg.cdx.wayback_base)
+            results = {
+                'end_to_end': asyncio.run(bench_end_to_end(cfg, corpus.domain_names)),
+                'parser': bench_parser(cfg, corpus, args.micro_pages),
+                'storage': bench_storage(cfg, workdir, args.micro_count),
+                'enqueue': asyncio.run(bench_enqueue(cfg, workdir, args.micro_count)),
+                'cdx': asyncio.run(bench_cdx(cfg, corpus.domain_names)),
+            }
+            results['peak_rss_mb'] = round(peak_rss_mb(), 1)
+    finally:
+        stub.terminate()
+        stub.join()
+
+    result = {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'revision': git_revision(),
+        'params': {key: value for key, value in vars(args).items() if key not in ('results_dir', 'no_save')},
+        'results': results,
+    }
+    print_report(result, previous_result(args.results_dir))
+    if not args.no_save:
+        os.makedirs(args.results_dir, exist_ok=True)
+        path = os.path.join(args.results_dir, f"{time.strftime('%Y%m%d-%H%M%S')}-{result['revision']}.json")
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(result, f, indent=2, ensure_ascii=False)
+        print(f"saved to {path}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+# benchmarks/bench_keywords.py
+"""
+Сравнение времени поиска ключевых слов на страницу:
+прежний цикл (одно регулярное выражение на строку keywords.txt)
+против однопроходного KeywordMatcher.
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_keywords [--pages 200] [--size 50000]
+"""
+import re
+import time
+import random
+import argparse
+from typing import List
+
+from crawler.keywords import KeywordMatcher
+
+FILLER_EN = ("the page was archived in 2004 and shows a guestbook with several "
+             "messages about photos links and a counter ").split()
+FILLER_JA = list("これは古い掲示板のページです画像と書き込みがありますよろしくお願いします")
+
+def load_keywords(path: str) -> List[str]:
+    with open(path, 'r', encoding='utf-8') as f:
+        return [line.strip() for line in f if line.strip() and not line.startswith('#')]
+
+def legacy_patterns(keywords: List[str]) -> List[re.Pattern]:
+    patterns = []
+    for line in keywords:
+        pat = re.escape(line).replace(r'\ ', r'\s+')
+        patterns.append(re.compile(rf"\b{pat}\b", re.IGNORECASE))
+    return patterns
+
+def legacy_findall(patterns: List[re.Pattern], text: str) -> List[str]:
+    matches = []
+    for pat in patterns:
+        for m in pat.findall(text):
+            matches.append(m)
+    return matches
+
+def make_page(rng: random.Random, keywords: List[str], size: int) -> str:
+    parts = []
+    length = 0
+    while length < size:
+        roll = rng.random()
+        if roll < 0.01:
+            chunk = rng.choice(keywords)
+        elif roll < 0.5:
+            chunk = rng.choice(FILLER_EN)
+        else:
+            chunk = ''.join(rng.choice(FILLER_JA) for _ in range(rng.randint(2, 12)))
+        parts.append(chunk)
+        length += len(chunk) + 1
+    return ' '.join(parts)
+
+def timed(fn, pages: List[str]) -> float:
+    started = time.perf_counter()
+    for page in pages:
+        fn(page)
+    return (time.perf_counter() - started) / len(pages) * 1000
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument('--keywords', default='keywords.txt')
+    ap.add_argument('--pages', type=int, default=200)
+    ap.add_argument('--size', type=int, default=50000, help='Размер страницы в символах')
+    ap.add_argument('--seed', type=int, default=1)
+    args = ap.parse_args()
+
+    keywords = load_keywords(args.keywords)
+    rng = random.Random(args.seed)
+    pages = [make_page(rng, keywords, args.size) for _ in range(args.pages)]
+
+    patterns = legacy_patterns(keywords)
+    matcher = KeywordMatcher(keywords)
+
+    legacy_ms = timed(lambda text: legacy_findall(patterns, text), pages)
+    matcher_ms = timed(matcher.findall, pages)
+
+    print(f"keywords: {len(keywords)}, pages: {len(pages)}, page size: {args.size} chars")
+    print(f"legacy per-pattern loop: {legacy_ms:8.3f} ms/page")
+    print(f"KeywordMatcher:          {matcher_ms:8.3f} ms/page")
+    print(f"speedup:                 {legacy_ms / matcher_ms:8.2f}x")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+# benchmarks/corpus.py
+"""
+Детерминированный корпус страниц для бенчмарков: несколько доменов,
+на каждом pages страниц, связанных относительными ссылками. Страница
+однозначно задаётся (домен, номер), поэтому стенд генерирует её
+по запросу и не хранит корпус в памяти.
+
+Кодировки чередуются: Shift_JIS, EUC-JP и UTF-8. Charset объявлен
+в заголовке Content-Type, только в <meta> или нигде — как на старых
+японских сайтах.
+"""
+import random
+import hashlib
+from typing import List, NamedTuple, Optional, Tuple
+
+ENCODINGS = ('shift_jis', 'euc-jp', 'utf-8')
+
+# Где объявлена кодировка страницы
+DECLARE_HEADER = 'header'
+DECLARE_META = 'meta'
+DECLARE_NONE = 'none'
+
+FILLER_JA = ("これは古い掲示板のページです 画像と書き込みがあります よろしくお願いします "
+             "管理人 日記 更新 リンク集 掲示板 写真 怖い話 投稿 ありがとう 昨日 今日").split()
+FILLER_EN = "guestbook counter link photo diary update bbs top back next".split()
+
+class CorpusPage(NamedTuple):
+    body: bytes
+    encoding: str
+    declared: str                 # DECLARE_*
+    content_type: str             # значение заголовка Content-Type
+
+class Corpus:
+    def __init__(self, domains: int = 8, pages: int = 250, links: int = 6, size: int = 8000,
+                 keyword_rate: float = 0.05, keywords: Optional[List[str]] = None, seed: int = 1):
+        self.domain_names = [f"d{i}.bench.jp" for i in range(domains)]
+        self.pages = pages
+        self.links = links
+        self.size = size
+        self.keyword_rate = keyword_rate
+        self.keywords = keywords or ["white face", "ghostly smile"]
+        self.seed = seed
+
+    def _rng(self, domain: str, index: int) -> random.Random:
+        key = hashlib.blake2b(f"{self.seed}:{domain}:{index}".encode(), digest_size=8).digest()
+        return random.Random(int.from_bytes(key, 'big'))
+
+    def urls(self, domain: str) -> List[str]:
+        return [f"http://{domain}/p{i}.html" for i in range(self.pages)]
+
+    @staticmethod
+    def locate(url: str) -> Optional[Tuple[str, int]]:
+        """
+        (домен, номер страницы) для URL корпуса или None.
+        """
+        rest = url.split('://', 1)[-1]
+        domain, _, path = rest.partition('/')
+        if not (path.startswith('p') and path.endswith('.html')):
+            return None
+        try:
+            return domain.lower(), int(path[1:-5])
+        except ValueError:
+            return None
+
+    def page(self, domain: str, index: int) -> CorpusPage:
+        rng = self._rng(domain, index)
+        encoding = ENCODINGS[index % len(ENCODINGS)]
+        declared = (DECLARE_HEADER, DECLARE_META, DECLARE_NONE)[(index // len(ENCODINGS)) % 3]
+
+        words: List[str] = []
+        length = 0
+        while length < self.size:
+            roll = rng.random()
+            if roll < self.keyword_rate:
+                word = rng.choice(self.keywords)
+            elif roll < 0.3:
+                word = rng.choice(FILLER_EN)
+            else:
+                word = rng.choice(FILLER_JA)
+            words.append(word)
+            length += len(word) + 1
+
+        links = ''.join(
+            f'<li><a href="p{rng.randrange(self.pages)}.html">{rng.choice(FILLER_JA)}</a></li>'
+            for _ in range(self.links)
+        )
+        meta = f'<meta http-equiv="Content-Type" content="text/html; charset={encoding}">' \
+            if declared == DECLARE_META else ''
+        html = (
+            f'<html><head>{meta}<title>{domain} {index}</title></head><body>'
+            f'<h1>{rng.choice(FILLER_JA)}</h1><p>{" ".join(words)}</p><ul>{links}</ul>'
+            f'</body></html>'
+        )
+        content_type = f'text/html; charset={encoding}' if declared == DECLARE_HEADER else 'text/html'
+        return CorpusPage(html.encode(encoding, 'replace'), encoding, declared, content_type)
+
+    def digest(self, domain: str, index: int) -> str:
+        # Содержимое определяется (домен, номер), поэтому digest можно
+        # получить без генерации страницы
+        return hashlib.blake2b(f"{self.seed}:{domain}:{index}".encode(), digest_size=20).hexdigest().upper()[:32]
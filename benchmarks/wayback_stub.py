@@ -0,0 +1,120 @@
+# benchmarks/wayback_stub.py
+"""
+Локальный стенд вместо Wayback Machine для бенчмарков.
+
+  GET /cdx/search/cdx  — CDX API: output=json (страницы с заголовком
+      и ключом продолжения в конце) и построчный вывод, limit,
+      showResumeKey/resumeKey, заголовок Resume-Key; каждый
+      cdx_429_every-й запрос получает 429 с Retry-After.
+  GET /web/<ts>id_/<url> — снимок страницы корпуса (benchmarks/corpus.py);
+      доля snapshot_429_rate запросов получает 429 с Retry-After.
+
+Каждая страница корпуса снята captures раз с одинаковым digest,
+чтобы работал пропуск неизменившихся снимков (cdx.dedup_digests).
+
+Запуск отдельно (из корня репозитория):
+    python -m benchmarks.wayback_stub [--port 8731]
+"""
+import json
+import random
+import argparse
+from aiohttp import web
+from .corpus import Corpus
+
+class WaybackStub:
+    def __init__(self, corpus: Corpus, captures: int = 2, cdx_429_every: int = 5,
+                 snapshot_429_rate: float = 0.0, retry_after: float = 1, seed: int = 1):
+        self.corpus = corpus
+        self.captures = captures
+        self.cdx_429_every = cdx_429_every
+        self.snapshot_429_rate = snapshot_429_rate
+        self.retry_after = retry_after
+        self.rng = random.Random(seed)
+        self.cdx_requests = 0
+        self.snapshot_requests = 0
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get('/cdx/search/cdx', self.cdx)
+        app.router.add_get(r'/web/{timestamp:\d+}{modifier:[a-z]{2}_}/{url:.+}', self.snapshot)
+        return app
+
+    def _rate_limited(self) -> web.Response:
+        return web.Response(status=429, headers={'Retry-After': str(self.retry_after)}, text='Too Many Requests')
+
+    def _rows(self, domain: str):
+        for index in range(self.corpus.pages):
+            original = f"http://{domain}/p{index}.html"
+            urlkey = f"jp,bench,{domain.split('.')[0]})/p{index}.html"
+            digest = self.corpus.digest(domain, index)
+            for capture in range(self.captures):
+                timestamp = f"2004{capture + 1:02d}01000000"
+                yield [urlkey, timestamp, original, '200', 'text/html', digest]
+
+    async def cdx(self, request: web.Request) -> web.Response:
+        self.cdx_requests += 1
+        if self.cdx_429_every and self.cdx_requests % self.cdx_429_every == 0:
+            return self._rate_limited()
+
+        query = request.query
+        domain = query.get('url', '').split('/')[0].lower()
+        if domain not in self.corpus.domain_names:
+            rows = []
+        else:
+            rows = list(self._rows(domain))
+        limit = int(query.get('limit', 0) or 0) or len(rows) or 1
+        offset = int(query.get('resumeKey', 0) or 0)
+        page = rows[offset:offset + limit]
+        next_key = str(offset + limit) if offset + limit < len(rows) else None
+
+        fields = query.get('fl', 'urlkey,timestamp,original,statuscode,mimetype,digest').split(',')
+        columns = ['urlkey', 'timestamp', 'original', 'statuscode', 'mimetype', 'digest']
+        order = [columns.index(name) for name in fields if name in columns]
+        page = [[row[i] for i in order] for row in page]
+
+        headers = {'Resume-Key': next_key} if next_key else {}
+        if query.get('output') == 'json':
+            data = [[columns[i] for i in order]] + page
+            if next_key:
+                data += [[], [next_key]]
+            return web.Response(text=json.dumps(data), content_type='application/json', headers=headers)
+
+        text = ''.join(' '.join(row) + '\n' for row in page)
+        if next_key:
+            text += '\n' + next_key + '\n'
+        return web.Response(text=text, content_type='text/plain', headers=headers)
+
+    async def snapshot(self, request: web.Request) -> web.Response:
+        self.snapshot_requests += 1
+        if self.snapshot_429_rate and self.rng.random() < self.snapshot_429_rate:
+            return self._rate_limited()
+
+        # aiohttp схлопывает "//" в пути, поэтому берётся сырой путь
+        url = request.raw_path.split('_/', 1)[1]
+        located = Corpus.locate(url)
+        if located is None or located[0] not in self.corpus.domain_names or located[1] >= self.corpus.pages:
+            return web.Response(status=404, text='Not Found')
+        page = self.corpus.page(*located)
+        return web.Response(body=page.body, headers={'Content-Type': page.content_type})
+
+def run(port: int, corpus: Corpus, **kwargs):
+    """
+    Запускает стенд и блокирует поток (удобно как target процесса).
+    """
+    web.run_app(WaybackStub(corpus, **kwargs).app(), host='127.0.0.1', port=port,
+                print=None, access_log=None)
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument('--port', type=int, default=8731)
+    ap.add_argument('--domains', type=int, default=8)
+    ap.add_argument('--pages', type=int, default=250)
+    ap.add_argument('--captures', type=int, default=2)
+    ap.add_argument('--cdx-429-every', type=int, default=5)
+    ap.add_argument('--snapshot-429-rate', type=float, default=0.0)
+    args = ap.parse_args()
+    run(args.port, Corpus(args.domains, args.pages), captures=args.captures,
+        cdx_429_every=args.cdx_429_every, snapshot_429_rate=args.snapshot_429_rate)
+
+if __name__ == '__main__':
+    main()
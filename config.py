@@ -1,8 +1,8 @@
 # config.py (с валидацией)
 import yaml
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from typing import Any
-from typing import List, Tuple
+from typing import Dict, List, Tuple
 from pathlib import Path
 
 @dataclass
@@ -13,17 +13,63 @@ class CDXConfig:
     target_domains_file: str
     max_retries: int
     page_size: int
+    max_parallel_domains: int = 3  # Сколько доменов опрашивать в CDX одновременно
+    stream: bool = False           # Построчное чтение CDX вместо JSON-страниц целиком
+    stream_batch: int = 1000       # Сколько семян передавать в очередь за раз в потоковом режиме
+    from_date: str = "20040101000000"
+    to_date: str = "20041231235959"
+    index_dir: str = ""            # Каталог локального CDX-индекса ("" = без индекса)
+    index_ttl_days: float = 30     # Сколько дней индекс считается свежим
+    collapse: str = "urlkey"       # Свёртка в запросе CDX: urlkey, digest или "" (без свёртки)
+    dedup_digests: bool = True     # Не ставить в очередь снимки с уже встречавшимся содержимым
+    base_url: str = "https://web.archive.org/cdx/search/cdx"  # Адрес CDX API
+    wayback_base: str = "http://web.archive.org/web"          # Префикс адресов снимков (<base>/<ts>id_/<url>)
 
 @dataclass
 class LogConfig:
     path: str
     max_bytes: int
     backup_count: int
+    level: str = "INFO"            # Уровень корневого логгера
+    file_level: str = "INFO"
+    console_level: str = "INFO"
+    levels: Dict[str, str] = field(default_factory=dict)  # Уровни отдельных логгеров, например {"Scheduler": "WARNING"}
+    summary_interval: float = 10   # Период сводки о ходе обхода (сек)
 
 @dataclass
 class FetchConfig:
     user_agents_file: str
-    rate_limit: float
+    rate_limit: float                 # Интервал между запросами к одному хосту (сек)
+    host_rate_limits: Dict[str, float] = field(default_factory=dict)  # Интервалы для отдельных хостов
+    host_burst: int = 1               # Сколько запросов к хосту можно сделать подряд без паузы
+    pool_size: int = 100              # Всего соединений в пуле
+    pool_size_per_host: int = 16      # Соединений на один хост
+    keepalive_timeout: float = 30     # Сколько держать простаивающее соединение (сек)
+    dns_cache_ttl: int = 300          # Кэш DNS (сек, 0 = выключен)
+    connect_timeout: float = 10       # Таймаут установки соединения (сек)
+    read_timeout: float = 30          # Таймаут ожидания данных из сокета (сек)
+    total_timeout: float = 120        # Общий предел на один запрос (сек)
+    max_retries: int = 3              # Повторов при сетевых ошибках и 429/5xx
+    backoff_base: float = 0.5         # База экспоненциальной задержки (сек)
+    backoff_max: float = 30           # Максимальная задержка между повторами (сек)
+    retry_after_max: float = 120      # Дольше ждать по Retry-After не стоит: URL считается неудачным (сек)
+    sniff_bytes: int = 4096           # Где искать <meta charset> (байт от начала)
+    detect_bytes: int = 16384         # Сколько байт отдавать детектору кодировки
+    charset_cache_size: int = 10000   # Хостов в кэше определённых кодировок
+    max_body_mb: float = 5            # Предел размера тела ответа (0 = без ограничения)
+    truncate_oversized: bool = True   # Длинное тело обрезать до предела (false — отбрасывать)
+    read_chunk_kb: int = 64           # Размер части при чтении тела
+
+@dataclass
+class ConcurrencyConfig:
+    enabled: bool = True
+    initial_window: int = 4      # Стартовое число одновременных запросов
+    min_window: int = 1
+    max_window: int = 32         # Верхняя граница окна (и число воркеров)
+    increase: float = 1.0        # Аддитивный рост окна за «раунд» успешных ответов
+    decrease: float = 0.5        # Множитель окна при 429/503/всплеске задержки
+    latency_spike: float = 3.0   # Всплеск: задержка выше базовой в столько раз
+    cooldown: float = 2.0        # Минимальный интервал между уменьшениями окна (сек)
 
 @dataclass
 class StorageConfig:
@@ -31,25 +77,70 @@ class StorageConfig:
     bloom_error_rate: float
     cache_ttl_days: int
     cache_dir: str 
+    auto_save_interval: int = 300   # Период компакции снимка посещённых URL (сек)
+    page_cache_max_mb: int = 1024   # Предел размера кэша страниц (0 = без ограничения)
+    page_cache_sweep_interval: int = 600  # Период очистки кэша страниц (сек)
+    page_cache: bool = True         # Искать страницы в кэше перед загрузкой из сети
+    batch_size: int = 1000          # Сколько совпадений сбрасывать на диск за раз
+    results_dir: str = "results"    # Каталог JSONL-сегментов с совпадениями
+    results_segment_mb: int = 256   # Размер сегмента, после которого начинается новый
 
 @dataclass
 class ParserConfig:
     patterns_file: str     # Было: patterns_file
     url_filters: str       # Новое поле
     case_sensitive: bool
+    backend: str = 'bs4'   # Бэкенд извлечения HTML: 'bs4' или 'lxml'
+    workers: int = 0       # Процессов для разбора страниц (0 = в event loop)
+    queue_per_worker: int = 2  # Страниц «в полёте» на один процесс
 
 @dataclass
 class SchedulerConfig:
     
     seeds: List[str]
-    poison_pill: str
     max_concurrent: int
     max_depth: int
     queue_size: int
     cdx: CDXConfig 
 
     debug: bool = False
+    frontier_path: str = ""   # SQLite-файл очереди URL: вытеснение на диск и продолжение после перезапуска ("" = только в памяти)
+    log_every: int = 100      # Строка INFO о каждом N-м обработанном URL (1 = о каждом, 0 = без них)
+    poison_pill: str = ""     # Устарело и не используется: воркеры останавливает HostFrontier.close(); оставлено для старых config.yaml
+
+
+@dataclass
+class DedupConfig:
+    enabled: bool = True           # Не разбирать повторно страницы с тем же телом
+    max_entries: int = 10000       # Сколько последних результатов разбора хранить
+    near_duplicates: bool = False  # Искать почти одинаковые страницы по SimHash
+    near_distance: int = 3         # Допустимое расстояние Хэмминга между SimHash
+    shingle_size: int = 3          # Слов в шингле для SimHash
 
+@dataclass
+class WarcConfig:
+    enabled: bool = False          # Записывать ответы сервера в WARC
+    output_dir: str = "warc"       # Каталог для .warc.gz
+    prefix: str = "jtk"            # Префикс имён файлов
+    max_file_size_mb: int = 1024   # Размер файла, после которого начинается новый
+
+@dataclass
+class MetricsConfig:
+    enabled: bool = False          # HTTP-эндпоинт /metrics в формате Prometheus
+    host: str = "127.0.0.1"
+    port: int = 9108               # В режиме --shards шард i слушает port + i
+
+@dataclass
+class TracingConfig:
+    enabled: bool = False          # Длительности этапов обработки URL (гистограммы в metrics)
+    trace_file: str = "logs/trace.jsonl"  # Разбивка по этапам для доли URL ("" = не писать)
+    sample_rate: float = 0.01      # Доля URL, попадающих в trace_file
+    loop_lag_interval: float = 0.5 # Период замера задержки event loop (сек, 0 = выключен)
+    loop_lag_warn: float = 0.25    # Задержка, о которой пишется предупреждение (сек)
+    profile_dir: str = "profiles"  # Каталог профилей (collapsed stacks); запись по SIGUSR1
+    profile_hz: int = 100          # Частота снятия стеков
+    profile_duration: float = 30   # Длительность одной записи (сек)
+    profile_interval: float = 0    # Записывать профиль каждые N сек (0 = только по сигналу)
 
 @dataclass
 class Config:
@@ -66,6 +157,11 @@ class Config:
     parser: ParserConfig
     scheduler: SchedulerConfig
     cdx: CDXConfig
+    concurrency: ConcurrencyConfig = field(default_factory=ConcurrencyConfig)
+    warc: WarcConfig = field(default_factory=WarcConfig)
+    dedup: DedupConfig = field(default_factory=DedupConfig)
+    metrics: MetricsConfig = field(default_factory=MetricsConfig)
+    tracing: TracingConfig = field(default_factory=TracingConfig)
 
 def validate_positive(value, name):
     if value <= 0:
@@ -79,7 +175,16 @@ def validate_config(raw: dict):
     validate_positive(raw['auto_save_interval'], 'auto_save_interval')
     validate_positive(raw['batch_size'], 'batch_size')
     validate_positive(raw['fetch']['rate_limit'], 'fetch.rate_limit')
+    for host, interval in (raw['fetch'].get('host_rate_limits') or {}).items():
+        validate_positive(interval, f'fetch.host_rate_limits.{host}')
+    for key in ('connect_timeout', 'read_timeout', 'total_timeout'):
+        if key in raw['fetch']:
+            validate_positive(raw['fetch'][key], f'fetch.{key}')
+    if raw['fetch'].get('max_retries', 0) < 0:
+        raise ValueError("fetch.max_retries must be >= 0")
     validate_positive(raw['storage']['bloom_capacity'], 'storage.bloom_capacity')
+    if raw['parser'].get('workers', 0) < 0:
+        raise ValueError("parser.workers must be >= 0")
     if not (0 < raw['storage']['bloom_error_rate'] < 1):
         raise ValueError("storage.bloom_error_rate must be between 0 and 1")
 
@@ -99,7 +204,12 @@ def load_config(path: str = 'config.yaml') -> Config:
         cache_dir=raw['cache_dir'],
         log=LogConfig(**raw['log']),
         fetch=FetchConfig(**raw['fetch']),
-        storage=StorageConfig(**raw['storage']),
+        storage=StorageConfig(**raw['storage'], auto_save_interval=raw['auto_save_interval'], batch_size=raw['batch_size']),
         parser=ParserConfig(**raw['parser']),
-        scheduler=SchedulerConfig(**raw['scheduler'], cdx=CDXConfig(**raw['cdx']))
+        scheduler=SchedulerConfig(**raw['scheduler'], cdx=CDXConfig(**raw['cdx'])),
+        concurrency=ConcurrencyConfig(**raw.get('concurrency', {})),
+        warc=WarcConfig(**raw.get('warc', {})),
+        dedup=DedupConfig(**raw.get('dedup', {})),
+        metrics=MetricsConfig(**raw.get('metrics', {})),
+        tracing=TracingConfig(**raw.get('tracing', {}))
     )
@@ -0,0 +1,271 @@
+# crawler/cdx_index.py
+import os
+import re
+import gzip
+import json
+import time
+import heapq
+import bisect
+import logging
+import tempfile
+from typing import IO, Iterator, List, Optional, Tuple
+from .wayback_cdx import CDXRecord
+
+class CDXIndex:
+    """
+    Local sorted CDX index for one domain and date range.
+
+    Layout (all files share the <domain>_<from>_<to>[_<tag>] prefix):
+      - .journal    — CDXJ lines appended while paginating, unsorted;
+      - .state.json — last followed resume key, completion flag, timestamps;
+      - .cdxj.gz    — sorted, deduplicated CDXJ lines in gzip members of
+                      block_lines lines each (the file is a valid .gz);
+      - .idx        — one line per block: first key, offset and length.
+
+    CDXJ line: "<urlkey> <timestamp> {json}". Lookups binary-search the
+    block index, then decompress a single block.
+    """
+
+    def __init__(self, index_dir: str, domain: str, from_date: str, to_date: str,
+                 block_lines: int = 3000, tag: str = ""):
+        safe_domain = re.sub(r'[^A-Za-z0-9._-]', '_', domain)
+        name = f"{safe_domain}_{from_date}_{to_date}"
+        if tag:
+            name += f"_{re.sub(r'[^A-Za-z0-9._-]', '_', tag)}"
+        self.prefix = os.path.join(index_dir, name)
+        self.journal_path = self.prefix + ".journal"
+        self.state_path = self.prefix + ".state.json"
+        self.data_path = self.prefix + ".cdxj.gz"
+        self.idx_path = self.prefix + ".idx"
+        self.block_lines = block_lines
+        self.logger = logging.getLogger("CDXIndex")
+
+        os.makedirs(index_dir, exist_ok=True)
+        self.state = self._load_state()
+        self._journal: Optional[IO[str]] = None
+        self._block_keys: Optional[List[str]] = None
+        self._blocks: List[Tuple[int, int]] = []
+
+    # --- state ---------------------------------------------------------
+
+    def _load_state(self) -> dict:
+        try:
+            with open(self.state_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {"resume_key": None, "complete": False, "updated": 0, "records": 0}
+
+    def _save_state(self):
+        self.state["updated"] = time.time()
+        tmp_path = self.state_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.state, f)
+        os.replace(tmp_path, self.state_path)
+
+    @property
+    def resume_key(self) -> Optional[str]:
+        return self.state.get("resume_key")
+
+    @property
+    def has_journal(self) -> bool:
+        return os.path.exists(self.journal_path) and os.path.getsize(self.journal_path) > 0
+
+    def is_fresh(self, max_age_days: float) -> bool:
+        """
+        The index is usable without network if it was completed recently enough.
+        """
+        if not self.state.get("complete") or not os.path.exists(self.data_path):
+            return False
+        return time.time() - self.state.get("updated", 0) < max_age_days * 86400
+
+    def reset(self):
+        self.close()
+        for path in (self.journal_path, self.state_path, self.data_path, self.idx_path):
+            if os.path.exists(path):
+                os.remove(path)
+        self.state = self._load_state()
+        self._block_keys = None
+
+    # --- building ------------------------------------------------------
+
+    def append(self, records: List[CDXRecord]):
+        """
+        Appends records to the journal. They become durable together with
+        the next checkpoint().
+        """
+        if self._journal is None:
+            self._journal = open(self.journal_path, 'a', encoding='utf-8')
+        write = self._journal.write
+        for record in records:
+            write(self.format_line(record))
+            write('\n')
+
+    def checkpoint(self, resume_key: Optional[str]):
+        """
+        Flushes the journal and records the key of the next page to fetch.
+        The state is written only after the journal, so a saved resume key
+        never points past records that were lost.
+        """
+        if self._journal is not None:
+            self._journal.flush()
+            os.fsync(self._journal.fileno())
+        self.state["resume_key"] = resume_key
+        self._save_state()
+
+    def iter_journal(self) -> Iterator[CDXRecord]:
+        if not os.path.exists(self.journal_path):
+            return
+        with open(self.journal_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                record = self.parse_line(line)
+                if record is not None:
+                    yield record
+
+    def finalize(self, run_lines: int = 500000):
+        """
+        Sorts the journal into the compressed block file (external merge
+        sort over temporary runs of run_lines lines), writes the block index
+        and marks the index complete.
+        """
+        self.close()
+        if not os.path.exists(self.journal_path):
+            open(self.journal_path, 'w').close()
+        runs: List[str] = []
+        try:
+            with open(self.journal_path, 'r', encoding='utf-8') as f:
+                while True:
+                    chunk = [line for _, line in zip(range(run_lines), f)]
+                    if not chunk:
+                        break
+                    # A line cut short by a crash has no trailing newline
+                    chunk = [line for line in chunk if line.endswith('\n')]
+                    chunk.sort()
+                    fd, run_path = tempfile.mkstemp(prefix='cdxrun-', dir=os.path.dirname(self.prefix))
+                    with os.fdopen(fd, 'w', encoding='utf-8') as run:
+                        run.writelines(chunk)
+                    runs.append(run_path)
+
+            handles = [open(path, 'r', encoding='utf-8') for path in runs]
+            try:
+                count = self._write_blocks(heapq.merge(*handles))
+            finally:
+                for handle in handles:
+                    handle.close()
+        finally:
+            for path in runs:
+                os.remove(path)
+
+        os.remove(self.journal_path)
+        self.state.update({"resume_key": None, "complete": True, "records": count})
+        self._save_state()
+        self._block_keys = None
+        self.logger.info(f"Built local CDX index {self.data_path}: {count} records")
+
+    def _write_blocks(self, lines: Iterator[str]) -> int:
+        tmp_data = self.data_path + ".tmp"
+        tmp_idx = self.idx_path + ".tmp"
+        count = 0
+        previous = None
+        block: List[str] = []
+        with open(tmp_data, 'wb') as data, open(tmp_idx, 'w', encoding='utf-8') as idx:
+
+            def flush_block():
+                payload = gzip.compress(''.join(block).encode('utf-8'))
+                offset = data.tell()
+                data.write(payload)
+                idx.write(f"{self._key_of(block[0])}\t{offset}\t{len(payload)}\n")
+                block.clear()
+
+            for line in lines:
+                if line == previous:
+                    continue
+                previous = line
+                block.append(line)
+                count += 1
+                if len(block) >= self.block_lines:
+                    flush_block()
+            if block:
+                flush_block()
+
+        os.replace(tmp_data, self.data_path)
+        os.replace(tmp_idx, self.idx_path)
+        return count
+
+    def close(self):
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+
+    # --- reading -------------------------------------------------------
+
+    def _load_block_index(self):
+        if self._block_keys is not None:
+            return
+        self._block_keys, self._blocks = [], []
+        with open(self.idx_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                key, offset, length = line.rstrip('\n').split('\t')
+                self._block_keys.append(key)
+                self._blocks.append((int(offset), int(length)))
+
+    def _read_block(self, i: int) -> List[str]:
+        offset, length = self._blocks[i]
+        with open(self.data_path, 'rb') as f:
+            f.seek(offset)
+            return gzip.decompress(f.read(length)).decode('utf-8').splitlines()
+
+    def iter_records(self) -> Iterator[CDXRecord]:
+        with gzip.open(self.data_path, 'rt', encoding='utf-8') as f:
+            for line in f:
+                record = self.parse_line(line)
+                if record is not None:
+                    yield record
+
+    def find(self, urlkey: str, timestamp: Optional[str] = None) -> Optional[CDXRecord]:
+        """
+        Returns the first record for urlkey (and timestamp, if given) or None.
+        """
+        if not os.path.exists(self.idx_path):
+            return None
+        self._load_block_index()
+        prefix = f"{urlkey} {timestamp} " if timestamp else f"{urlkey} "
+
+        # The first matching line is in the last block starting at or before
+        # the prefix, or at the very start of the following block
+        i = max(bisect.bisect_right(self._block_keys, prefix) - 1, 0)
+        for block_no in (i, i + 1):
+            if block_no >= len(self._blocks):
+                break
+            lines = self._read_block(block_no)
+            pos = bisect.bisect_left(lines, prefix)
+            if pos < len(lines):
+                if lines[pos].startswith(prefix):
+                    return self.parse_line(lines[pos])
+                return None
+        return None
+
+    def contains(self, urlkey: str, timestamp: Optional[str] = None) -> bool:
+        return self.find(urlkey, timestamp) is not None
+
+    # --- line format ---------------------------------------------------
+
+    @staticmethod
+    def _key_of(line: str) -> str:
+        urlkey, timestamp, _ = line.split(' ', 2)
+        return f"{urlkey} {timestamp} "
+
+    @staticmethod
+    def format_line(record: CDXRecord) -> str:
+        fields = record._asdict()
+        urlkey = fields.pop("urlkey")
+        timestamp = fields.pop("timestamp")
+        return f"{urlkey} {timestamp} {json.dumps(fields, ensure_ascii=False, separators=(',', ':'))}"
+
+    @staticmethod
+    def parse_line(line: str) -> Optional[CDXRecord]:
+        try:
+            urlkey, timestamp, payload = line.rstrip('\n').split(' ', 2)
+            fields = json.loads(payload)
+            return CDXRecord(urlkey=urlkey, timestamp=timestamp, **fields)
+        except (ValueError, TypeError):
+            return None
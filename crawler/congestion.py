@@ -0,0 +1,141 @@
+# crawler/congestion.py
+import time
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import Optional
+
+# Ответы, означающие перегрузку на стороне сервера
+OVERLOAD_STATUSES = (429, 503)
+
+class RequestSlot:
+    """
+    Место в окне одновременных запросов. Вызывающий код сообщает статус
+    ответа через record() сразу после получения заголовков.
+    """
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.status: Optional[int] = None
+        self.latency: Optional[float] = None
+        self.retry_after: Optional[float] = None
+
+    def record(self, status: int, retry_after: Optional[float] = None):
+        self.status = status
+        self.latency = time.monotonic() - self.started
+        self.retry_after = retry_after
+
+class AdaptiveLimiter:
+    """
+    AIMD-регулятор числа одновременных запросов, общий для Fetcher и CDX-клиента.
+
+      - пока ответы успешны и задержка близка к базовой, окно растёт
+        на increase за каждые window завершённых запросов (≈ за RTT);
+      - на 429/503, сетевую ошибку или всплеск задержки (latency_spike ×
+        базовая EWMA) окно умножается на decrease, не чаще раза в cooldown секунд;
+      - Retry-After приостанавливает выдачу новых мест для всех запросов.
+    """
+
+    def __init__(
+        self,
+        initial_window: float = 4,
+        min_window: int = 1,
+        max_window: int = 32,
+        increase: float = 1.0,
+        decrease: float = 0.5,
+        latency_spike: float = 3.0,
+        cooldown: float = 2.0,
+        stats=None
+    ):
+        self.window = float(initial_window)
+        self.min_window = min_window
+        self.max_window = max_window
+        self.increase = increase
+        self.decrease = decrease
+        self.latency_spike = latency_spike
+        self.cooldown = cooldown
+        self.stats = stats
+        self.logger = logging.getLogger("AdaptiveLimiter")
+
+        self.in_flight = 0
+        self.baseline_latency: Optional[float] = None
+        self._samples = 0
+        self._last_decrease = 0.0
+        self._paused_until = 0.0
+        self._cond = asyncio.Condition()
+
+    @property
+    def limit(self) -> int:
+        return max(self.min_window, int(self.window))
+
+    @asynccontextmanager
+    async def slot(self):
+        """
+        async with limiter.slot() as slot: ... slot.record(response.status)
+        """
+        await self._acquire()
+        slot = RequestSlot()
+        failed = False
+        try:
+            yield slot
+        except Exception:
+            # Сетевая ошибка или таймаут до получения ответа — признак перегрузки;
+            # исключения после record() оцениваются по статусу ответа
+            failed = slot.status is None
+            raise
+        finally:
+            self._complete(slot, failed)
+            async with self._cond:
+                self._cond.notify_all()
+            if self.stats is not None:
+                await self.stats.set_gauge("concurrency_window", self.limit)
+                await self.stats.set_gauge("in_flight_requests", self.in_flight)
+
+    def pause(self, seconds: float):
+        """
+        Приостанавливает выдачу новых мест (например, по Retry-After).
+        """
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    async def _acquire(self):
+        async with self._cond:
+            while True:
+                delay = self._paused_until - time.monotonic()
+                if delay <= 0 and self.in_flight < self.limit:
+                    self.in_flight += 1
+                    return
+                # Ожидание ограничено секундой на случай пропущенного уведомления
+                timeout = min(delay, 1.0) if delay > 0 else 1.0
+                try:
+                    await asyncio.wait_for(self._cond.wait(), timeout=timeout)
+                except asyncio.TimeoutError:
+                    pass
+
+    def _complete(self, slot: RequestSlot, failed: bool):
+        self.in_flight -= 1
+        if failed or slot.status in OVERLOAD_STATUSES:
+            if slot.retry_after:
+                self.pause(slot.retry_after)
+            self._on_congestion()
+        elif slot.latency is not None:
+            self._on_success(slot.latency)
+
+    def _on_success(self, latency: float):
+        baseline = self.baseline_latency
+        if baseline is not None and self._samples >= 10 and latency > baseline * self.latency_spike:
+            self._on_congestion()
+            return
+
+        # Базовая задержка обновляется только по «здоровым» ответам
+        self.baseline_latency = latency if baseline is None else baseline * 0.9 + latency * 0.1
+        self._samples += 1
+        self.window = min(self.max_window, self.window + self.increase / max(self.window, 1))
+
+    def _on_congestion(self):
+        now = time.monotonic()
+        if now - self._last_decrease < self.cooldown:
+            return
+        self._last_decrease = now
+        previous = self.limit
+        self.window = max(float(self.min_window), self.window * self.decrease)
+        self.logger.info(f"Congestion detected, window {previous} -> {self.limit}")
@@ -0,0 +1,156 @@
+# crawler/dedup.py
+import re
+import hashlib
+import logging
+from collections import OrderedDict
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+ParseResult = Tuple[List[str], List[str]]
+
+_TAG_RE = re.compile(r'<[^>]*>')
+_WORD_RE = re.compile(r'\w+')
+
+class PageFingerprint(NamedTuple):
+    digest: bytes               # blake2b тела страницы
+    simhash: Optional[int]      # 64-битный SimHash или None, если поиск похожих выключен
+
+def simhash(text: str, shingle_size: int = 3, sample_above: int = 512, sample_rate: int = 4) -> int:
+    """
+    64-битный SimHash по множеству шинглов из shingle_size слов (без тегов).
+    На больших страницах учитывается каждый sample_rate-й шингл (по значению хэша).
+
+    Вместо 64 сложений на каждый шингл единицы в каждом разряде считаются
+    «вертикально»: planes[k] хранит k-й бит счётчика всех 64 разрядов сразу,
+    так что добавление хэша стоит нескольких побитовых операций.
+    """
+    words = _WORD_RE.findall(_TAG_RE.sub(' ', text).lower())
+    if len(words) < shingle_size:
+        words = words + [''] * (shingle_size - len(words))
+    # blake2b, а не hash(): отпечаток не зависит от процесса и PYTHONHASHSEED
+    features = {
+        int.from_bytes(hashlib.blake2b(' '.join(shingle).encode('utf-8', 'surrogatepass'), digest_size=8).digest(), 'little')
+        for shingle in zip(*(words[i:] for i in range(shingle_size)))
+    }
+    # Согласованная выборка: у похожих страниц выбираются одни и те же шинглы
+    if len(features) > sample_above:
+        features = {value for value in features if value % sample_rate == 0}
+
+    planes: List[int] = []
+    for value in features:
+        carry = value
+        k = 0
+        while carry:
+            if k == len(planes):
+                planes.append(0)
+            plane = planes[k]
+            planes[k] = plane ^ carry
+            carry &= plane
+            k += 1
+
+    # Разряд результата равен 1, если единиц в нём больше половины
+    half = len(features) // 2
+    result = 0
+    for bit in range(64):
+        count = 0
+        for k, plane in enumerate(planes):
+            count |= ((plane >> bit) & 1) << k
+        if count > half:
+            result |= 1 << bit
+    return result
+
+class ContentDedup:
+    """
+    Пропуск разбора повторяющихся страниц.
+
+      - точные дубликаты: по хэшу тела хранится результат разбора
+        последних max_entries страниц — совпадения и ссылки в том виде,
+        как они записаны в HTML (Parser.scan), без привязки к адресу;
+      - почти дубликаты (near_duplicates): SimHash страницы ищется среди
+        ранее разобранных с расстоянием Хэмминга не больше near_distance.
+        Отпечаток делится на near_distance + 1 полос: у похожих страниц
+        хотя бы одна полоса совпадает, поэтому сравниваются только
+        отпечатки из общих корзин.
+
+    Результат почти дубликата берётся у похожей страницы как есть, то есть
+    совпадения в отличающихся фрагментах будут пропущены — поэтому этот
+    режим включается отдельно.
+    """
+
+    # Сколько отпечатков держать в одной корзине полосы
+    BUCKET_LIMIT = 64
+
+    def __init__(self, max_entries: int = 10000, near_duplicates: bool = False,
+                 near_distance: int = 3, shingle_size: int = 3):
+        self.max_entries = max_entries
+        self.near_duplicates = near_duplicates
+        self.near_distance = near_distance
+        self.shingle_size = shingle_size
+        self.logger = logging.getLogger("ContentDedup")
+
+        self._exact: "OrderedDict[bytes, ParseResult]" = OrderedDict()
+        self._near: "OrderedDict[int, ParseResult]" = OrderedDict()
+
+        bands = near_distance + 1
+        self._band_bits = 64 // bands
+        self._band_mask = (1 << self._band_bits) - 1
+        self._bands = bands
+        self._buckets: Dict[Tuple[int, int], List[int]] = {}
+
+        # Средняя длительность разбора для оценки сэкономленного времени
+        self.avg_parse_time: Optional[float] = None
+
+    def fingerprint(self, content: str) -> PageFingerprint:
+        digest = hashlib.blake2b(content.encode('utf-8', 'surrogatepass'), digest_size=16).digest()
+        fp = simhash(content, self.shingle_size) if self.near_duplicates else None
+        return PageFingerprint(digest, fp)
+
+    def lookup(self, fp: PageFingerprint) -> Tuple[Optional[str], Optional[ParseResult]]:
+        """
+        Возвращает (вид совпадения, результат): ('exact', ...), ('near', ...) или (None, None).
+        """
+        result = self._exact.get(fp.digest)
+        if result is not None:
+            self._exact.move_to_end(fp.digest)
+            return 'exact', result
+
+        if fp.simhash is not None:
+            for key in self._band_keys(fp.simhash):
+                for other in self._buckets.get(key, ()):
+                    if (other ^ fp.simhash).bit_count() <= self.near_distance:
+                        self._near.move_to_end(other)
+                        return 'near', self._near[other]
+        return None, None
+
+    def add(self, fp: PageFingerprint, result: ParseResult, parse_time: float):
+        result = (list(result[0]), list(result[1]))
+        self._exact[fp.digest] = result
+        if len(self._exact) > self.max_entries:
+            self._exact.popitem(last=False)
+
+        if fp.simhash is not None and fp.simhash not in self._near:
+            self._near[fp.simhash] = result
+            for key in self._band_keys(fp.simhash):
+                bucket = self._buckets.setdefault(key, [])
+                bucket.append(fp.simhash)
+                if len(bucket) > self.BUCKET_LIMIT:
+                    bucket.pop(0)
+            if len(self._near) > self.max_entries:
+                old, _ = self._near.popitem(last=False)
+                self._drop_from_buckets(old)
+
+        if self.avg_parse_time is None:
+            self.avg_parse_time = parse_time
+        else:
+            self.avg_parse_time = self.avg_parse_time * 0.9 + parse_time * 0.1
+
+    def _band_keys(self, value: int):
+        bits = self._band_bits
+        return [(band, (value >> (band * bits)) & self._band_mask) for band in range(self._bands)]
+
+    def _drop_from_buckets(self, value: int):
+        for key in self._band_keys(value):
+            bucket = self._buckets.get(key)
+            if bucket and value in bucket:
+                bucket.remove(value)
+                if not bucket:
+                    del self._buckets[key]
@@ -0,0 +1,216 @@
+# crawler/encoding.py
+"""
+Определение кодировки и декодирование HTML-страниц.
+
+Порядок определения (как в браузерах, но без разбора документа):
+  1. BOM (UTF-8, UTF-16);
+  2. charset из заголовка Content-Type;
+  3. <meta charset>, <meta http-equiv="Content-Type"> или XML-декларация
+     в первых sniff_bytes байтах;
+  4. кодировка, ранее определённая для того же сайта (кэш по хосту);
+  5. детектор: cchardet (C), если установлен, иначе пробное строгое
+     декодирование первых detect_bytes байт как UTF-8, EUC-JP и CP932.
+
+Тело декодируется один раз. Если выбранная кодировка не подошла
+(строгое декодирование упало), страница считается неверно объявленной:
+она декодируется первой подходящей из UTF-8, EUC-JP, CP932, а если
+не подошла ни одна — выбранной кодировкой с заменой ошибочных байт.
+"""
+import re
+import time
+import codecs
+from collections import OrderedDict
+from typing import NamedTuple, Optional, Sequence, Tuple
+
+try:
+    import cchardet  # faust-cchardet — необязательная зависимость
+except ImportError:
+    cchardet = None
+
+from .metrics import MetricsRegistry
+
+# Откуда взята кодировка
+SOURCE_BOM = 'bom'
+SOURCE_HEADER = 'header'
+SOURCE_META = 'meta'
+SOURCE_CACHE = 'cache'
+SOURCE_DETECTOR = 'detector'
+SOURCE_DEFAULT = 'default'
+SOURCE_FALLBACK = 'fallback'      # выбранная кодировка не подошла
+
+# Кодировки для пробного декодирования. EUC-JP проверяется раньше CP932:
+# текст в EUC-JP почти всегда «декодируется» как CP932 (полуширинная катакана),
+# а текст в Shift_JIS как EUC-JP — нет
+TRIAL_ENCODINGS = ('utf-8', 'euc_jp', 'cp932')
+
+# Метки, которые браузеры понимают шире, чем кодеки Python с тем же именем:
+# Shift_JIS на японских сайтах — это CP932 (Windows-31J), Latin-1 — CP1252
+ALIASES = {
+    'shift_jis': 'cp932', 'shift-jis': 'cp932', 'sjis': 'cp932', 'x-sjis': 'cp932',
+    'ms_kanji': 'cp932', 'csshiftjis': 'cp932', 'windows-31j': 'cp932', 'x-ms-cp932': 'cp932',
+    'euc-jp': 'euc_jp', 'x-euc-jp': 'euc_jp', 'cseucpkdfmtjapanese': 'euc_jp',
+    'iso-8859-1': 'cp1252', 'latin1': 'cp1252', 'us-ascii': 'cp1252', 'ascii': 'cp1252',
+    'x-user-defined': 'cp1252',
+}
+
+_BOMS = (
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'),
+)
+
+# charset= внутри тега <meta> покрывает и <meta charset>, и http-equiv
+_META_RE = re.compile(rb'<meta\s[^>]*?charset\s*=\s*["\']?\s*([a-zA-Z0-9_.:+-]+)', re.IGNORECASE)
+_XML_RE = re.compile(rb'^\s*<\?xml[^>]*?encoding\s*=\s*["\']([a-zA-Z0-9_.:+-]+)', re.IGNORECASE)
+
+class Decoded(NamedTuple):
+    text: str
+    encoding: str           # имя кодека Python
+    source: str             # SOURCE_*
+    misdecoded: bool        # выбранная кодировка не подошла
+    replaced: bool          # в тексте есть замены ошибочных байт
+
+def normalize_charset(label: str) -> Optional[str]:
+    """
+    Имя кодека Python для метки кодировки или None, если метка неизвестна.
+    """
+    label = label.strip().strip('"\'').lower()
+    if not label:
+        return None
+    try:
+        return codecs.lookup(ALIASES.get(label, label)).name
+    except LookupError:
+        return None
+
+def charset_from_content_type(content_type: str) -> Optional[str]:
+    for param in content_type.split(';')[1:]:
+        name, _, value = param.partition('=')
+        if name.strip().lower() == 'charset':
+            return normalize_charset(value)
+    return None
+
+def sniff_bom(body: bytes) -> Optional[str]:
+    for bom, encoding in _BOMS:
+        if body.startswith(bom):
+            return encoding
+    return None
+
+def sniff_meta(head: bytes) -> Optional[str]:
+    """
+    Кодировка из <meta> или XML-декларации в начале документа.
+    """
+    match = _XML_RE.search(head) or _META_RE.search(head)
+    if match is None:
+        return None
+    encoding = normalize_charset(match.group(1).decode('ascii', 'replace'))
+    # Объявление в ASCII-совместимом тексте не может быть UTF-16
+    if encoding is not None and encoding.startswith('utf-16'):
+        return 'utf-8'
+    return encoding
+
+def try_decode(data: bytes, encodings: Sequence[str], final: bool = True) -> Optional[Tuple[str, str]]:
+    """
+    Строгое декодирование первой подходящей кодировкой: (текст, кодировка) или None.
+    При final=False обрезанный в конце символ ошибкой не считается.
+    """
+    for encoding in encodings:
+        try:
+            return codecs.getincrementaldecoder(encoding)().decode(data, final), encoding
+        except UnicodeDecodeError:
+            continue
+    return None
+
+def detect(sample: bytes) -> Optional[str]:
+    """
+    Кодировка по содержимому; None для текста только из ASCII.
+    """
+    if sample.isascii():
+        return None
+    if cchardet is not None:
+        encoding = normalize_charset(cchardet.detect(sample).get('encoding') or '')
+        if encoding is not None:
+            return encoding
+    result = try_decode(sample, TRIAL_ENCODINGS, final=False)
+    return result[1] if result is not None else None
+
+class CharsetDecoder:
+    """
+    Декодер страниц с кэшем кодировок по хосту: на старых сайтах все
+    страницы обычно в одной кодировке, и детектор запускается один раз
+    на сайт, а не на каждую страницу без объявленной кодировки.
+
+    Время определения кодировки (без самого декодирования) пишется
+    в гистограмму jtk_charset_detect_seconds{source}.
+    """
+
+    def __init__(self, sniff_bytes: int = 4096, detect_bytes: int = 16384, cache_size: int = 10000,
+                 metrics: Optional[MetricsRegistry] = None):
+        self.sniff_bytes = sniff_bytes
+        self.detect_bytes = detect_bytes
+        self.cache_size = cache_size
+        self._hosts: "OrderedDict[str, str]" = OrderedDict()
+        metrics = metrics if metrics is not None else MetricsRegistry()
+        self.detect_seconds = metrics.histogram(
+            'charset_detect_seconds', 'Time spent choosing a page charset, by source', ('source',),
+            buckets=(0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01))
+
+    def cached(self, host: str) -> Optional[str]:
+        encoding = self._hosts.get(host)
+        if encoding is not None:
+            self._hosts.move_to_end(host)
+        return encoding
+
+    def _remember(self, host: str, encoding: str):
+        if not host or self.cache_size <= 0:
+            return
+        self._hosts[host] = encoding
+        self._hosts.move_to_end(host)
+        if len(self._hosts) > self.cache_size:
+            self._hosts.popitem(last=False)
+
+    def choose(self, body: bytes, content_type: str = '', host: str = '') -> Tuple[str, str]:
+        """
+        (кодировка, источник) без декодирования тела.
+        """
+        encoding = sniff_bom(body)
+        if encoding is not None:
+            return encoding, SOURCE_BOM
+        encoding = charset_from_content_type(content_type)
+        if encoding is not None:
+            return encoding, SOURCE_HEADER
+        encoding = sniff_meta(body[:self.sniff_bytes])
+        if encoding is not None:
+            return encoding, SOURCE_META
+        if host:
+            encoding = self.cached(host)
+            if encoding is not None:
+                return encoding, SOURCE_CACHE
+        encoding = detect(body[:self.detect_bytes])
+        if encoding is not None:
+            return encoding, SOURCE_DETECTOR
+        return 'utf-8', SOURCE_DEFAULT
+
+    def decode(self, body: bytes, content_type: str = '', host: str = '', final: bool = True) -> Decoded:
+        """
+        final=False — тело обрезано, и неполный последний символ отбрасывается.
+        """
+        started = time.perf_counter()
+        encoding, source = self.choose(body, content_type, host)
+        self.detect_seconds.observe(time.perf_counter() - started, source)
+
+        try:
+            text = codecs.getincrementaldecoder(encoding)().decode(body, final)
+        except UnicodeDecodeError:
+            if source == SOURCE_CACHE:
+                self._hosts.pop(host, None)
+            result = try_decode(body, [e for e in TRIAL_ENCODINGS if e != encoding], final)
+            if result is None:
+                text = codecs.getincrementaldecoder(encoding)('replace').decode(body, final)
+                return Decoded(text, encoding, SOURCE_FALLBACK, True, True)
+            text, encoding = result
+            self._remember(host, encoding)
+            return Decoded(text, encoding, SOURCE_FALLBACK, True, False)
+
+        if source in (SOURCE_HEADER, SOURCE_META, SOURCE_DETECTOR):
+            self._remember(host, encoding)
+        return Decoded(text, encoding, source, False, False)
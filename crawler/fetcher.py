@@ -4,27 +4,75 @@ import aiohttp
 import random
 import asyncio
 import logging
+import contextlib
 from aiohttp import ClientSession, ClientError
-from typing import List, Tuple
-from .utils import rotate_user_agent  # если у вас есть такая утилита
+from typing import Awaitable, Callable, List, Optional, Tuple
+from .utils import BINARY_SNIFF_BYTES, host_of, is_valid_mime_type, looks_binary, rotate_user_agent, parse_retry_after, unwrap_wayback
+from .congestion import RequestSlot
+from .encoding import CharsetDecoder
+from .metrics import MetricsRegistry
+from .tracing import span
+
+# Статусы, после которых запрос имеет смысл повторить
+RETRY_STATUSES = (429, 500, 502, 503, 504)
 
 class Fetcher:
-    def __init__(self, cfg):
+    def __init__(self, cfg, limiter=None, stats=None, page_store=None, warc_writer=None, tracer=None):
         """
         cfg — это инстанс FetchConfig, в котором есть:
           - user_agents_file: str
-          - rate_limit: float
-          # При необходимости можно добавить другие поля в FetchConfig 
-          # и обращаться к ним через cfg.<field>
+          - rate_limit: float (интервал между запросами к одному хосту,
+            соблюдается планировщиком, а не здесь)
+          - настройки транспорта: размеры пула соединений, keep-alive,
+            кэш DNS, таймауты и параметры повторов (см. FetchConfig)
+        stats — Stats для учёта исходов каждой попытки (необязательно);
+          в его реестр metrics пишутся длительность попыток, объём
+          загруженных данных, число запросов «в полёте» и статусы по доменам.
+        page_store — PageStore: страница сначала ищется в нём, а успешно
+          загруженные страницы сохраняются туда (необязательно).
+        warc_writer — WarcWriter: каждый полученный из сети ответ, кроме
+          отброшенных до чтения тела, записывается в WARC (необязательно).
+        tracer — Tracer: этапы dns/connect/request отмечаются хуками
+          aiohttp, чтение и декодирование тела — span() (необязательно).
+
+        Тело декодируется один раз через CharsetDecoder (crawler/encoding.py)
+        с кэшем кодировок по домену исходного сайта; источник кодировки
+        считается в stats как charset_<источник>, неверно объявленные
+        кодировки — как charset_misdecodes.
+
+        Тело читается частями по read_chunk_kb. Ответы не HTML по Content-Type
+        отбрасываются до чтения, с двоичной сигнатурой в начале тела — после
+        первого килобайта; тело длиннее max_body_mb обрезается (truncate_oversized)
+        или отбрасывается. Счётчики: fetch_skipped_<причина>, fetch_bytes_saved.
         """
         self.cfg = cfg
         self.user_agents = self._load_user_agents(cfg.user_agents_file)
         self.rate_limit = cfg.rate_limit
-        # если вы хотите ограничивать максимальное число одновременных запросов
-        # можно передать max_concurrent из основного конфига через аргумент
-        # self.semaphore = asyncio.Semaphore(cfg.max_concurrent)
+        # Общий с CDX-клиентом AIMD-регулятор одновременных запросов (AdaptiveLimiter)
+        self.limiter = limiter
+        self.stats = stats
+        self.page_store = page_store
+        self.warc_writer = warc_writer
+        self.tracer = tracer
         self.session: ClientSession | None = None
 
+        metrics = stats.metrics if stats is not None else MetricsRegistry()
+        self.fetch_seconds = metrics.histogram(
+            'fetch_duration_seconds', 'Duration of one fetch attempt, headers and body')
+        self.fetched_bytes = metrics.counter(
+            'fetched_bytes_total', 'Bytes of response bodies downloaded')
+        self.in_flight = metrics.gauge(
+            'fetch_in_flight', 'Requests currently in progress')
+        self.max_body_bytes = int(cfg.max_body_mb * 1024 * 1024)
+        self.chunk_size = cfg.read_chunk_kb * 1024
+        self.saved_bytes = metrics.counter(
+            'fetch_skipped_bytes_total', 'Bytes not downloaded because a response was dropped or truncated',
+            ('reason',))
+        self.decoder = CharsetDecoder(cfg.sniff_bytes, cfg.detect_bytes, cfg.charset_cache_size, metrics)
+        self.responses = metrics.counter(
+            'fetch_responses_total', 'Responses by original site domain and HTTP status',
+            ('domain', 'status'), max_series=5000)
+
     def _load_user_agents(self, user_agents_file: str) -> List[str]:
         """
         Загружает список User-Agent из файла, по одному на строку.
@@ -42,42 +90,217 @@ class Fetcher:
         Ленивая инициализация aiohttp.ClientSession
         """
         if self.session is None:
-            self.session = aiohttp.ClientSession()
+            cfg = self.cfg
+            connector = aiohttp.TCPConnector(
+                limit=cfg.pool_size,
+                limit_per_host=cfg.pool_size_per_host,
+                use_dns_cache=cfg.dns_cache_ttl > 0,
+                ttl_dns_cache=cfg.dns_cache_ttl or None,
+                keepalive_timeout=cfg.keepalive_timeout
+            )
+            timeout = aiohttp.ClientTimeout(
+                total=cfg.total_timeout,
+                connect=cfg.connect_timeout,
+                sock_read=cfg.read_timeout
+            )
+            trace_configs = [self.tracer.trace_config()] if self.tracer is not None else None
+            self.session = aiohttp.ClientSession(connector=connector, timeout=timeout, trace_configs=trace_configs)
 
-    async def fetch(self, url: str) -> Tuple[str | None, str]:
+    async def fetch(
+        self,
+        url: str,
+        host_gate: Optional[Callable[[str], Awaitable[None]]] = None
+    ) -> Tuple[str | None, str]:
         """
-        Выполняет GET-запрос по URL.
+        Выполняет GET-запрос по URL с повторами.
         Возвращает кортеж (content, final_url).
         Если запрос не удался — content будет None.
+
+        Сетевые ошибки, таймауты и статусы из RETRY_STATUSES повторяются
+        до cfg.max_retries раз с экспоненциальной задержкой со случайным
+        разбросом; Retry-After сервера имеет приоритет. Если сервер просит
+        ждать дольше retry_after_max, URL сразу считается неудачным.
+
+        host_gate(url) вызывается перед каждым повтором: так повторы
+        расходуют тот же бюджет хоста, что и новые URL (HostFrontier.acquire).
         """
+        if self.page_store is not None:
+            with span('cache'):
+                cached = await self.page_store.get(url)
+            if cached is not None:
+                await self._count("page_cache_hits")
+                return cached
+            await self._count("page_cache_misses")
+
         await self._ensure_session()
 
-        # Ограничение числа одновременных запросов, если нужно.
-        # Если semaphore не нужен, можно удалить этот блок.
-        # async with self.semaphore:
-        try:
-            headers = {'User-Agent': rotate_user_agent(self.user_agents)}
-            async with self.session.get(url, headers=headers) as response:
-                if response.status != 200:
-                    logging.warning(f"Request to {url} failed with status {response.status}")
-                    return None, str(response.url)
+        final_url = url
+        for attempt in range(self.cfg.max_retries + 1):
+            retry_after = None
+            await self._count("fetch_attempts")
+            try:
+                async with self._request_slot() as slot:
+                    self.in_flight.inc()
+                    try:
+                        with self.fetch_seconds.time():
+                            status, content, final_url, retry_after = await self._get(url, slot)
+                    finally:
+                        self.in_flight.dec()
+                await self._count(f"fetch_status_{status}")
+                self.responses.inc(1, host_of(unwrap_wayback(url)), str(status))
+
+                if status == 200:
+                    if content is None:
+                        return None, final_url
+                    if self.page_store is not None:
+                        with span('cache_store'):
+                            await self.page_store.put(url, content, final_url)
+                    return content, final_url
+                if status not in RETRY_STATUSES:
+                    logging.warning(f"Request to {url} failed with status {status}")
+                    return None, final_url
+                reason = f"status {status}"
+
+            except (ClientError, asyncio.TimeoutError) as e:
+                await self._count(f"fetch_error_{type(e).__name__}")
+                reason = f"{type(e).__name__}: {e}"
+
+            if attempt == self.cfg.max_retries:
+                logging.error(f"Giving up on {url} after {attempt + 1} attempts ({reason})")
+                await self._count("fetch_failures")
+                return None, final_url
+            if retry_after is not None and retry_after > self.cfg.retry_after_max:
+                logging.warning(f"Giving up on {url}: Retry-After {retry_after:.0f}s exceeds retry_after_max ({reason})")
+                await self._count("fetch_retry_after_exceeded")
+                await self._count("fetch_failures")
+                return None, final_url
+
+            delay = self._backoff(attempt, retry_after)
+            logging.debug(f"Retrying {url} in {delay:.1f}s ({reason})")
+            await self._count("fetch_retries")
+            await asyncio.sleep(delay)
+            if host_gate is not None:
+                await host_gate(url)
+
+        return None, final_url
+
+    def _backoff(self, attempt: int, retry_after: float | None) -> float:
+        """
+        Задержка перед повтором: Retry-After (не больше retry_after_max) или
+        «full jitter» в пределах backoff_base * 2^attempt, но не больше backoff_max.
+        """
+        if retry_after is not None:
+            return min(retry_after, self.cfg.retry_after_max)
+        return random.uniform(0, min(self.cfg.backoff_max, self.cfg.backoff_base * (2 ** attempt)))
+
+    async def _count(self, key: str, amount: int = 1):
+        if self.stats is not None:
+            await self.stats.increment(key, amount)
+
+    def _request_slot(self):
+        if self.limiter is not None:
+            return self.limiter.slot()
+        return contextlib.nullcontext(RequestSlot())
+
+    async def _get(self, url: str, slot) -> Tuple[int, str | None, str, float | None]:
+        """
+        Одна попытка запроса. Возвращает (status, content, final_url, retry_after).
+        Для ответа 200, отброшенного по типу, сигнатуре или размеру, content = None.
+        """
+        headers = {'User-Agent': rotate_user_agent(self.user_agents)}
+        async with self.session.get(url, headers=headers) as response:
+            retry_after = parse_retry_after(response.headers.get('Retry-After'))
+            slot.record(response.status, retry_after)
+            final_url = str(response.url)
+            content_type = response.headers.get('Content-Type', '')
+
+            # Не HTML (картинки, архивы, text/plain) отбрасывается по заголовкам,
+            # до чтения тела; без Content-Type решает начало тела
+            if response.status == 200 and content_type and not is_valid_mime_type(content_type):
+                await self._skip(response, "mime", response.content_length or 0)
+                return response.status, None, final_url, None
+
+            if self.warc_writer is None and response.status != 200:
+                return response.status, None, final_url, retry_after
 
-                content = await response.text()
-                final_url = str(response.url)
+            with span('body'):
+                body, truncated = await self._read_body(response, sniff=response.status == 200)
+            if body is None:
+                return response.status, None, final_url, None
+            if self.warc_writer is not None:
+                with span('warc'):
+                    await self.warc_writer.write_response_async(
+                        final_url,
+                        response.status,
+                        response.reason,
+                        f"{response.version.major}.{response.version.minor}",
+                        [(k.decode('latin-1'), v.decode('latin-1')) for k, v in response.raw_headers],
+                        body,
+                        truncated
+                    )
 
-                # Задержка между запросами, чтобы не перегружать сервер
-                if self.rate_limit > 0:
-                    await asyncio.sleep(self.rate_limit)
+            if response.status != 200:
+                return response.status, None, final_url, retry_after
 
-                return content, final_url
+            with span('decode'):
+                decoded = self.decoder.decode(body, content_type, host_of(unwrap_wayback(url)), final=not truncated)
+            await self._count(f"charset_{decoded.source}")
+            if decoded.misdecoded:
+                await self._count("charset_misdecodes")
+            if decoded.replaced:
+                await self._count("charset_replaced")
 
-        except ClientError as e:
-            logging.error(f"Network error while fetching {url}: {e}")
-            return None, url
-        
-        if not response or response.status != 200:
-            logger.warning(f"Bad response for {domain}: {response}")
-            return None
+            # Темп запросов к каждому хосту задаёт HostFrontier в планировщике
+            return response.status, decoded.text, final_url, None
+
+    async def _read_body(self, response: aiohttp.ClientResponse, sniff: bool) -> Tuple[bytes | None, bool]:
+        """
+        Читает тело частями, не больше max_body_mb. Возвращает (body, truncated).
+        body = None, если ответ отброшен: при sniff первые BINARY_SNIFF_BYTES
+        байт (или всё тело, если оно короче) похожи на двоичный файл, либо
+        тело больше предела, а truncate_oversized выключен. Длинное тело
+        при truncate_oversized обрезается до предела.
+        """
+        limit = self.max_body_bytes
+        length = response.content_length
+        if limit and length is not None and length > limit and not self.cfg.truncate_oversized:
+            await self._skip(response, "oversized", length)
+            return None, False
+
+        chunks: List[bytes] = []
+        size = 0
+        async for chunk in response.content.iter_chunked(self.chunk_size):
+            chunks.append(chunk)
+            size += len(chunk)
+            self.fetched_bytes.inc(len(chunk))
+            # Части могут быть короче сигнатуры: решение — по накопленному началу
+            if sniff and size >= BINARY_SNIFF_BYTES:
+                sniff = False
+                if looks_binary(b''.join(chunks)[:BINARY_SNIFF_BYTES]):
+                    await self._skip(response, "binary", (length or 0) - size)
+                    return None, False
+            if limit and size > limit:
+                if not self.cfg.truncate_oversized:
+                    await self._skip(response, "oversized", (length or 0) - size)
+                    return None, False
+                await self._skip(response, "truncated", (length or 0) - size)
+                return b''.join(chunks)[:limit], True
+        body = b''.join(chunks)
+        if sniff and looks_binary(body):
+            await self._skip(response, "binary", 0)
+            return None, False
+        return body, False
+
+    async def _skip(self, response: aiohttp.ClientResponse, reason: str, saved: int):
+        """
+        Прекращает чтение ответа: соединение закрывается, а не дочитывается.
+        saved — сколько байт не пришлось загружать (по Content-Length, если он известен).
+        """
+        response.close()
+        await self._count(f"fetch_skipped_{reason}")
+        if saved > 0:
+            await self._count("fetch_bytes_saved", saved)
+            self.saved_bytes.inc(saved, reason)
 
     async def close(self):
         """
@@ -85,3 +308,5 @@ class Fetcher:
         """
         if self.session:
             await self.session.close()
+        if self.warc_writer is not None:
+            self.warc_writer.close()
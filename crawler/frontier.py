@@ -0,0 +1,339 @@
+# crawler/frontier.py
+import time
+import heapq
+import asyncio
+import itertools
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Deque, Dict, List, Optional, Sequence, Tuple
+from .utils import host_of, match_domain, unwrap_wayback
+from .frontier_store import FrontierStore
+
+@dataclass(order=True)
+class PrioritizedItem:
+    priority: int
+    depth: int
+    url: str = field(compare=False)
+    id: int = field(default=0, compare=False)  # строка в FrontierStore (0 — без хранилища)
+
+class TokenBucket:
+    """
+    Ведро токенов: rate запросов в секунду, не больше burst подряд.
+    """
+
+    def __init__(self, rate: float, burst: float = 1):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def next_available(self, now: float) -> float:
+        """
+        Момент времени, когда будет доступен очередной токен.
+        """
+        self._refill(now)
+        if self.tokens >= 1:
+            return now
+        return now + (1 - self.tokens) / self.rate
+
+    def consume(self, now: float):
+        self._refill(now)
+        self.tokens -= 1
+
+class _HostQueue:
+    """
+    Очереди одного сетевого хоста, по одной на «ключ справедливости»
+    (домен-семя), с обходом ключей по кругу.
+    """
+
+    def __init__(self, bucket: TokenBucket):
+        self.bucket = bucket
+        self.queues: Dict[str, List[Tuple[int, int, int, PrioritizedItem]]] = {}
+        self.ring: Deque[str] = deque()
+        self.size = 0
+
+    def push(self, key: str, entry):
+        heap = self.queues.get(key)
+        if heap is None:
+            heap = self.queues[key] = []
+            self.ring.append(key)
+        heapq.heappush(heap, entry)
+        self.size += 1
+
+    def pop(self) -> PrioritizedItem:
+        key = self.ring.popleft()
+        heap = self.queues[key]
+        item = heapq.heappop(heap)[-1]
+        if heap:
+            self.ring.append(key)
+        else:
+            del self.queues[key]
+        self.size -= 1
+        return item
+
+class HostFrontier:
+    """
+    Очередь URL с учётом хостов вместо одной глобальной PriorityQueue.
+
+      - вежливость: у каждого сетевого хоста (например, web.archive.org)
+        своё ведро токенов, скорость задаётся интервалом между запросами;
+      - справедливость: внутри хоста URL разложены по доменам-семенам
+        (для снимков Wayback — по домену исходного URL) и выдаются по кругу,
+        поэтому крупный домен вроде 2ch.net не вытесняет остальные;
+      - внутри домена сохраняется порядок по (priority, depth).
+
+    get() отдаёт первый URL, чей хост может принять запрос прямо сейчас,
+    и ждёт только если таких нет ни у одного хоста.
+
+    Без хранилища maxsize ограничивает очередь и put() ждёт свободного места.
+    С FrontierStore maxsize — размер оперативного окна: лишние URL
+    вытесняются на диск, а когда окно пустеет наполовину, оттуда
+    подгружаются лучшие по приоритету. Незавершённые URL переживают
+    перезапуск (см. restore()).
+    """
+
+    def __init__(
+        self,
+        maxsize: int = 0,
+        default_interval: float = 1.0,
+        host_intervals: Optional[Dict[str, float]] = None,
+        burst: float = 1,
+        seed_domains: Sequence[str] = (),
+        store: Optional[FrontierStore] = None
+    ):
+        self.maxsize = maxsize
+        self.default_interval = default_interval
+        self.host_intervals = {h.lower(): v for h, v in (host_intervals or {}).items()}
+        self.burst = burst
+        self.seed_domains = sorted({d.lower() for d in seed_domains}, key=len, reverse=True)
+        self.store = store
+
+        self._hosts: Dict[str, _HostQueue] = {}
+        self._buckets: Dict[str, TokenBucket] = {}
+        # (момент готовности, порядковый номер, хост) для хостов с URL в очереди
+        self._schedule: List[Tuple[float, int, str]] = []
+        self._counter = itertools.count()
+        self._size = 0
+        self._unfinished = 0
+        self._finished = asyncio.Event()
+        self._finished.set()
+        self._closed = False
+        self._cond = asyncio.Condition()
+        self._flusher: Optional[asyncio.Future] = None
+
+    def qsize(self) -> int:
+        return self._size + (self.store.spilled if self.store else 0)
+
+    def empty(self) -> bool:
+        return self.qsize() == 0
+
+    def full(self) -> bool:
+        return self.maxsize > 0 and self._size >= self.maxsize
+
+    def fairness_key(self, url: str) -> str:
+        host = host_of(unwrap_wayback(url))
+        return match_domain(host, self.seed_domains) or host
+
+    def _bucket_for(self, host: str) -> TokenBucket:
+        # Ведро живёт дольше очереди хоста: иначе хост, очередь которого
+        # только что опустела, получил бы новый полный запас токенов
+        bucket = self._buckets.get(host)
+        if bucket is None:
+            interval = self.host_intervals.get(host, self.default_interval)
+            rate = 1.0 / interval if interval > 0 else 1e9
+            bucket = self._buckets[host] = TokenBucket(rate, self.burst)
+        return bucket
+
+    async def put(self, item: PrioritizedItem):
+        async with self._cond:
+            if self.store is None:
+                while self.full() and not self._closed:
+                    await self._cond.wait()
+            if self._closed:
+                # Ссылки, найденные воркерами на последних страницах после
+                # close(), уходят на диск и будут обработаны после перезапуска
+                if self.store is not None:
+                    item.id = self.store.next_id()
+                    self.store.add(item.id, item.priority, item.depth, item.url, hot=False)
+                return
+
+            if self.store is not None:
+                item.id = self.store.next_id()
+                hot = not self.full()
+                self.store.add(item.id, item.priority, item.depth, item.url, hot)
+                self._unfinished += 1
+                self._finished.clear()
+                self._maybe_flush()
+                if not hot:
+                    return
+
+            self._push(item)
+            if self.store is None:
+                self._unfinished += 1
+                self._finished.clear()
+            self._cond.notify_all()
+
+    def _push(self, item: PrioritizedItem):
+        host = host_of(item.url)
+        queue = self._hosts.get(host)
+        if queue is None:
+            queue = self._hosts[host] = _HostQueue(self._bucket_for(host))
+        if queue.size == 0:
+            ready_at = queue.bucket.next_available(time.monotonic())
+            heapq.heappush(self._schedule, (ready_at, next(self._counter), host))
+
+        seq = next(self._counter)
+        queue.push(self.fairness_key(item.url), (item.priority, item.depth, seq, item))
+        self._size += 1
+
+    async def _refill(self):
+        """
+        Подгружает вытесненные URL, когда оперативное окно опустело наполовину.
+        """
+        store = self.store
+        window = self.maxsize or 10000
+        if store is None or not store.spilled or self._size > window // 2:
+            return
+        for item_id, priority, depth, url in await store.take_spilled(window - self._size):
+            self._push(PrioritizedItem(priority, depth, url, item_id))
+
+    def _maybe_flush(self):
+        store = self.store
+        if store is not None and store.flush_due() and (self._flusher is None or self._flusher.done()):
+            self._flusher = asyncio.ensure_future(store.flush())
+
+    async def get(self) -> Optional[PrioritizedItem]:
+        """
+        Возвращает следующий URL, готовый к загрузке, или None после close().
+        """
+        async with self._cond:
+            while True:
+                if self._closed:
+                    return None
+
+                await self._refill()
+                self._maybe_flush()
+
+                timeout = None
+                if self.store is not None and self.store.pending_ops:
+                    timeout = self.store.flush_interval
+                if self._schedule:
+                    now = time.monotonic()
+                    ready_at, _, host = self._schedule[0]
+                    if ready_at <= now:
+                        heapq.heappop(self._schedule)
+                        # Токен мог забрать повтор запроса к тому же хосту (acquire)
+                        ready_at = self._hosts[host].bucket.next_available(now)
+                        if ready_at > now:
+                            heapq.heappush(self._schedule, (ready_at, next(self._counter), host))
+                            continue
+                        item = self._take(host, now)
+                        self._cond.notify_all()
+                        return item
+                    wait = ready_at - now
+                    timeout = wait if timeout is None else min(timeout, wait)
+
+                try:
+                    await asyncio.wait_for(self._cond.wait(), timeout=timeout)
+                except asyncio.TimeoutError:
+                    pass
+
+    def _take(self, host: str, now: float) -> PrioritizedItem:
+        queue = self._hosts[host]
+        queue.bucket.consume(now)
+        item = queue.pop()
+        self._size -= 1
+        if queue.size:
+            ready_at = queue.bucket.next_available(now)
+            heapq.heappush(self._schedule, (ready_at, next(self._counter), host))
+        else:
+            del self._hosts[host]
+        return item
+
+    async def acquire(self, url: str):
+        """
+        Ждёт токен хоста URL в обход очереди: так повтор запроса, уже
+        выданного get(), расходует тот же бюджет хоста, что и новые URL.
+        """
+        bucket = self._bucket_for(host_of(url))
+        while True:
+            now = time.monotonic()
+            ready_at = bucket.next_available(now)
+            if ready_at <= now:
+                bucket.consume(now)
+                return
+            await asyncio.sleep(ready_at - now)
+
+    def task_done(self, item: Optional[PrioritizedItem] = None):
+        if self._unfinished > 0:
+            self._unfinished -= 1
+            if self._unfinished == 0:
+                self._finished.set()
+        if self.store is not None and item is not None and item.id:
+            self.store.remove(item.id)
+            self._maybe_flush()
+
+    async def join(self):
+        """
+        Ждёт, пока все поставленные URL не будут обработаны (task_done),
+        как asyncio.Queue.join().
+        """
+        await self._finished.wait()
+
+    async def restore(self) -> int:
+        """
+        Возвращает в очередь URL, не обработанные до перезапуска. Возвращает их число.
+        """
+        if self.store is None:
+            return 0
+        async with self._cond:
+            pending = await asyncio.to_thread(self.store.restore)
+            self._unfinished += pending
+            if pending:
+                self._finished.clear()
+            self._cond.notify_all()
+            return pending
+
+    async def is_bootstrapped(self) -> bool:
+        """
+        Завершилась ли загрузка семян в прошлом запуске (без хранилища — нет).
+        """
+        if self.store is None:
+            return False
+        return await asyncio.to_thread(self.store.is_bootstrapped)
+
+    async def mark_bootstrapped(self, done: bool = True):
+        """
+        Сохраняет признак загрузки семян; при done=True сначала записывает
+        на диск все уже поставленные в очередь URL.
+        """
+        store = self.store
+        if store is None:
+            return
+        if done:
+            await store.flush()
+        await asyncio.to_thread(store.set_bootstrapped, done)
+
+    async def close(self):
+        """
+        Будит всех ожидающих: get() возвращает None, put() больше ничего не
+        ставит в очередь (при наличии хранилища — только записывает на диск).
+        """
+        async with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    async def close_store(self):
+        """
+        Записывает отложенные изменения и закрывает хранилище
+        (после того как воркеры завершили task_done).
+        """
+        if self.store is not None:
+            if self._flusher is not None:
+                await self._flusher
+            await asyncio.to_thread(self.store.close)
+            self.store = None
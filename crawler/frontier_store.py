@@ -0,0 +1,170 @@
+# crawler/frontier_store.py
+import os
+import time
+import asyncio
+import sqlite3
+import logging
+import threading
+from typing import List, Tuple
+
+# Состояния строк: 0 — вытеснена на диск, 1 — в оперативном окне HostFrontier
+SPILLED = 0
+HOT = 1
+
+class FrontierStore:
+    """
+    Дисковая часть очереди URL (SQLite, режим WAL).
+
+    В таблице лежат все ещё не обработанные URL: и те, что находятся
+    в оперативном окне (state = 1), и вытесненные на диск (state = 0).
+    Строка удаляется, когда URL обработан, поэтому после перезапуска
+    в таблице остаётся ровно незавершённая часть обхода.
+
+    В отдельной таблице meta хранится признак того, что загрузка семян
+    завершена: после сбоя посреди неё обход продолжает и очередь, и загрузку.
+
+    Вставки и удаления не выполняются сразу, а копятся и записываются
+    одной транзакцией в отдельном потоке раз в flush_interval секунд
+    (или при накоплении flush_ops операций). При аварийном завершении
+    теряется не больше одной такой пачки.
+    """
+
+    def __init__(self, path: str, flush_interval: float = 1.0, flush_ops: int = 1000):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.flush_ops = flush_ops
+        self.logger = logging.getLogger("FrontierStore")
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS frontier ("
+            " id INTEGER PRIMARY KEY, priority INTEGER, depth INTEGER, url TEXT, state INTEGER)"
+        )
+        self._db.execute(
+            "CREATE INDEX IF NOT EXISTS frontier_spilled ON frontier (state, priority, depth, id)"
+        )
+        self._db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        row = self._db.execute("SELECT COALESCE(MAX(id), 0) FROM frontier").fetchone()
+        self._next_id = row[0] + 1
+
+        self._inserts: List[Tuple[int, int, int, str, int]] = []
+        self._deletes: List[Tuple[int]] = []
+        self._db_lock = threading.Lock()
+        self._flush_lock = asyncio.Lock()
+        self._last_flush = time.monotonic()
+        self.spilled = 0
+
+    def next_id(self) -> int:
+        item_id = self._next_id
+        self._next_id += 1
+        return item_id
+
+    @property
+    def pending_ops(self) -> int:
+        return len(self._inserts) + len(self._deletes)
+
+    def add(self, item_id: int, priority: int, depth: int, url: str, hot: bool):
+        self._inserts.append((item_id, priority, depth, url, HOT if hot else SPILLED))
+        if not hot:
+            self.spilled += 1
+
+    def remove(self, item_id: int):
+        self._deletes.append((item_id,))
+
+    def flush_due(self) -> bool:
+        return self.pending_ops >= self.flush_ops or (
+            self.pending_ops and time.monotonic() - self._last_flush >= self.flush_interval
+        )
+
+    async def flush(self):
+        # Пачки применяются строго по порядку: удаление не должно
+        # обогнать вставку той же строки
+        async with self._flush_lock:
+            inserts, self._inserts = self._inserts, []
+            deletes, self._deletes = self._deletes, []
+            self._last_flush = time.monotonic()
+            if inserts or deletes:
+                await asyncio.to_thread(self._apply, inserts, deletes)
+
+    def _apply(self, inserts, deletes):
+        with self._db_lock:
+            self._write(inserts, deletes)
+
+    def _write(self, inserts, deletes):
+        self._db.execute("BEGIN")
+        try:
+            self._db.executemany("INSERT OR REPLACE INTO frontier VALUES (?, ?, ?, ?, ?)", inserts)
+            self._db.executemany("DELETE FROM frontier WHERE id = ?", deletes)
+            self._db.execute("COMMIT")
+        except Exception:
+            self._db.execute("ROLLBACK")
+            raise
+
+    async def take_spilled(self, limit: int) -> List[Tuple[int, int, int, str]]:
+        """
+        Переводит до limit лучших по приоритету вытесненных строк в оперативное окно.
+        """
+        async with self._flush_lock:
+            inserts, self._inserts = self._inserts, []
+            deletes, self._deletes = self._deletes, []
+            self._last_flush = time.monotonic()
+            rows = await asyncio.to_thread(self._take, inserts, deletes, limit)
+        # Меньше строк, чем просили, — значит, на диске больше ничего нет
+        self.spilled = self.spilled - len(rows) if len(rows) == limit else 0
+        return rows
+
+    def _take(self, inserts, deletes, limit):
+        self._apply(inserts, deletes)
+        with self._db_lock:
+            rows = self._db.execute(
+                "SELECT id, priority, depth, url FROM frontier WHERE state = ? "
+                "ORDER BY priority, depth, id LIMIT ?", (SPILLED, limit)
+            ).fetchall()
+            if rows:
+                self._db.execute("BEGIN")
+                self._db.executemany(
+                    "UPDATE frontier SET state = ? WHERE id = ?", [(HOT, row[0]) for row in rows]
+                )
+                self._db.execute("COMMIT")
+            return rows
+
+    def restore(self) -> int:
+        """
+        После перезапуска возвращает все незавершённые строки в очередь
+        вытесненных. Возвращает их число.
+        """
+        with self._db_lock:
+            self._db.execute("UPDATE frontier SET state = ?", (SPILLED,))
+            self.spilled = self._db.execute("SELECT COUNT(*) FROM frontier").fetchone()[0]
+        if self.spilled:
+            self.logger.info(f"Restored {self.spilled} pending URLs from {self.path}")
+        return self.spilled
+
+    def is_bootstrapped(self) -> bool:
+        with self._db_lock:
+            row = self._db.execute("SELECT value FROM meta WHERE key = 'bootstrap'").fetchone()
+        return row is not None and row[0] == 'done'
+
+    def set_bootstrapped(self, done: bool):
+        """
+        Записывает признак завершённой загрузки семян. Отложенные строки
+        нужно сбросить раньше (flush), иначе после сбоя признак мог бы
+        пережить семена, которых нет в таблице.
+        """
+        with self._db_lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO meta VALUES ('bootstrap', ?)", ('done' if done else 'running',)
+            )
+
+    def close(self):
+        with self._db_lock:
+            inserts, self._inserts = self._inserts, []
+            deletes, self._deletes = self._deletes, []
+            if inserts or deletes:
+                self._write(inserts, deletes)
+            self._db.close()
@@ -0,0 +1,151 @@
+# crawler/html_extract.py
+"""
+Бэкенды извлечения данных из HTML для Parser.
+
+Каждый бэкенд возвращает (parts, links):
+  - parts — фрагменты текста для поиска ключевых слов
+    (видимый текст, атрибуты, <script>, комментарии);
+  - links — абсолютные URL из href/src (сначала href, затем src).
+"""
+from typing import Callable, Dict, List, Tuple
+from urllib.parse import urljoin
+from bs4 import BeautifulSoup, Comment
+
+try:
+    from lxml import etree
+except ImportError:  # lxml — необязательная зависимость
+    etree = None
+
+HREF_TAGS = ('a', 'img', 'script', 'iframe', 'link')
+SRC_TAGS = ('img', 'script', 'iframe', 'link')
+
+Extractor = Callable[[str, str], Tuple[List[str], List[str]]]
+
+def extract_bs4(html: str, base_url: str) -> Tuple[List[str], List[str]]:
+    """
+    Эталонный бэкенд: BeautifulSoup + html.parser, несколько проходов по дереву.
+    """
+    soup = BeautifulSoup(html, 'html.parser')
+
+    parts: List[str] = []
+
+    # 1.1) Видимый текст
+    parts.append(soup.get_text(separator=' '))
+
+    # 1.2) <title>
+    if soup.title and soup.title.string:
+        parts.append(soup.title.string)
+
+    # 1.3) <meta name="description"> и другие meta[name/...]
+    for meta in soup.find_all('meta', attrs={'content': True}):
+        content = meta.get('content', '').strip()
+        if content:
+            parts.append(content)
+
+    # 1.4) Атрибуты alt, title, aria-*, data-* и другие
+    for tag in soup.find_all(True):
+        for attr, value in tag.attrs.items():
+            if isinstance(value, str):
+                parts.append(value)
+            elif isinstance(value, list):
+                parts.extend(value)
+
+    # 1.5) Содержимое <script> (например, JSON-LD)
+    for script in soup.find_all('script'):
+        if script.string:
+            parts.append(script.string)
+
+    # 1.6) HTML-комментарии
+    for comment in soup.find_all(string=lambda text: isinstance(text, Comment)):
+        parts.append(comment)
+
+    # Ссылки из href и src всех релевантных тегов
+    links: List[str] = []
+    for tag in soup.find_all(list(HREF_TAGS), href=True):
+        url = tag.get('href')
+        if url:
+            links.append(urljoin(base_url, url))
+    for tag in soup.find_all(list(SRC_TAGS), src=True):
+        url = tag.get('src')
+        if url:
+            links.append(urljoin(base_url, url))
+
+    return parts, links
+
+def extract_lxml(html: str, base_url: str) -> Tuple[List[str], List[str]]:
+    """
+    Быстрый бэкенд: libxml2 через lxml и один обход дерева (iterwalk),
+    за который собираются текст, атрибуты, скрипты, комментарии и ссылки.
+    """
+    parser = etree.HTMLParser(recover=True, remove_comments=False, remove_pis=True)
+    try:
+        root = etree.fromstring(html, parser)
+    except ValueError:
+        # Строки с XML-декларацией кодировки lxml принимает только как байты
+        root = etree.fromstring(html.encode('utf-8'), etree.HTMLParser(
+            recover=True, remove_comments=False, remove_pis=True, encoding='utf-8'))
+
+    texts: List[str] = []
+    attrs: List[str] = []
+    scripts: List[str] = []
+    comments: List[str] = []
+    hrefs: List[str] = []
+    srcs: List[str] = []
+    if root is None:
+        return [], []
+
+    # Текст внутри <script>/<style> не считается видимым (как в get_text)
+    hidden = 0
+    for event, el in etree.iterwalk(root, events=('start', 'end', 'comment')):
+        if event == 'comment':
+            if el.text:
+                comments.append(el.text)
+            if el.tail and not hidden:
+                texts.append(el.tail)
+            continue
+
+        tag = el.tag
+        if event == 'start':
+            for value in el.attrib.values():
+                attrs.append(value)
+            if tag == 'script' or tag == 'style':
+                hidden += 1
+                if tag == 'script' and el.text:
+                    scripts.append(el.text)
+            elif el.text and not hidden:
+                texts.append(el.text)
+
+            if tag in HREF_TAGS:
+                url = el.get('href')
+                if url:
+                    hrefs.append(urljoin(base_url, url))
+                if tag != 'a':
+                    url = el.get('src')
+                    if url:
+                        srcs.append(urljoin(base_url, url))
+        else:
+            if tag == 'script' or tag == 'style':
+                hidden -= 1
+            if el.tail and not hidden:
+                texts.append(el.tail)
+
+    parts = [' '.join(texts)]
+    parts.extend(attrs)
+    parts.extend(scripts)
+    parts.extend(comments)
+    return parts, hrefs + srcs
+
+BACKENDS: Dict[str, Extractor] = {
+    'bs4': extract_bs4,
+    'lxml': extract_lxml,
+}
+
+def get_extractor(name: str) -> Extractor:
+    """
+    Возвращает функцию извлечения по имени бэкенда из ParserConfig.backend.
+    """
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown parser backend '{name}', expected one of {sorted(BACKENDS)}")
+    if name == 'lxml' and etree is None:
+        raise ImportError("parser backend 'lxml' requires the lxml package")
+    return BACKENDS[name]
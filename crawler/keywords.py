@@ -0,0 +1,176 @@
+# crawler/keywords.py
+import re
+import logging
+import unicodedata
+from typing import Dict, Iterable, List, Optional
+
+# Специальный токен для пробела внутри ключевой фразы: соответствует \s+
+_WS = ' '
+
+def is_cjk(ch: str) -> bool:
+    """
+    Широкие и полноширинные символы (кандзи, кана, хангыль и т.п.).
+    Для них граница слова \\b не имеет смысла: слова в тексте не разделяются.
+    """
+    return unicodedata.east_asian_width(ch) in ('W', 'F', 'H')
+
+def is_word_char(ch: str) -> bool:
+    return ch.isalnum() or ch == '_'
+
+def needs_boundary(ch: str) -> bool:
+    """
+    Нужна ли граница слова на краю ключевой фразы, оканчивающейся символом ch.
+    """
+    return is_word_char(ch) and not is_cjk(ch)
+
+
+class _Node:
+    __slots__ = ('children', 'terminal', 'boundary')
+
+    def __init__(self):
+        self.children: Dict[str, '_Node'] = {}
+        self.terminal = False
+        self.boundary = False
+
+
+class KeywordMatcher:
+    """
+    Поиск всех ключевых фраз за один проход по тексту.
+
+    Фразы собираются в префиксное дерево, которое компилируется в одно
+    регулярное выражение (общие префиксы вынесены, поэтому на каждой позиции
+    проверяется не больше одной ветки). Для каждой найденной позиции
+    дерево проходится ещё раз, чтобы вернуть и более короткие фразы,
+    начинающиеся там же.
+
+    Поведение совпадает с прежним набором шаблонов \\b<фраза>\\b:
+    пробелы внутри фразы соответствуют любому пробельному промежутку,
+    регистр по умолчанию не учитывается. Границы слова проверяются только
+    на краях, где стоит буква/цифра не из CJK — японские фразы находятся
+    и внутри сплошного текста.
+    """
+
+    def __init__(self, keywords: Iterable[str], case_sensitive: bool = False):
+        self.case_sensitive = case_sensitive
+        self.root = _Node()
+        self.size = 0
+
+        for keyword in keywords:
+            tokens = self._tokenize(keyword)
+            if tokens:
+                self._insert(tokens)
+
+        # Фразы в дереве уже приведены к нижнему регистру, поэтому основной
+        # шаблон регистрозависимый и применяется к text.lower() — это в разы
+        # быстрее re.IGNORECASE. Шаблон с IGNORECASE нужен только для текстов,
+        # у которых lower() меняет длину (и смещения перестают совпадать).
+        self.pattern: Optional[re.Pattern] = None
+        self._icase_pattern: Optional[re.Pattern] = None
+        if self.root.children:
+            regex = self._node_regex(self.root)
+            self.pattern = re.compile(regex)
+            if not case_sensitive:
+                self._icase_pattern = re.compile(regex, re.IGNORECASE)
+
+    @classmethod
+    def from_file(cls, patterns_file: str, case_sensitive: bool = False) -> 'KeywordMatcher':
+        """
+        Загружает ключевые фразы из файла (одна строка = одна фраза, # — комментарий).
+        """
+        keywords: List[str] = []
+        try:
+            with open(patterns_file, 'r', encoding='utf-8') as f:
+                for line in f:
+                    line = line.strip()
+                    if not line or line.startswith('#'):
+                        continue
+                    keywords.append(line)
+        except Exception as e:
+            logging.getLogger(__name__).error(f"Failed to load patterns from {patterns_file}: {e}")
+        return cls(keywords, case_sensitive=case_sensitive)
+
+    def __len__(self) -> int:
+        return self.size
+
+    def _fold(self, ch: str) -> str:
+        return ch if self.case_sensitive else ch.lower()
+
+    def _tokenize(self, keyword: str) -> List[str]:
+        tokens: List[str] = []
+        for word in keyword.split():
+            if tokens:
+                tokens.append(_WS)
+            tokens.extend(self._fold(ch) for ch in word)
+        return tokens
+
+    def _insert(self, tokens: List[str]):
+        node = self.root
+        for token in tokens:
+            node = node.children.setdefault(token, _Node())
+        if not node.terminal:
+            self.size += 1
+        node.terminal = True
+        node.boundary = needs_boundary(tokens[-1])
+
+    def _node_regex(self, node: _Node) -> str:
+        branches = []
+        for token, child in node.children.items():
+            head = r'\s+' if token == _WS else re.escape(token)
+            tail = self._node_regex(child) if child.children else ''
+            if child.children and child.terminal:
+                tail = f"(?:{tail})?"
+            branches.append(head + tail)
+        if len(branches) == 1:
+            return branches[0]
+        return '(?:' + '|'.join(branches) + ')'
+
+    def findall(self, text: str) -> List[str]:
+        """
+        Возвращает все вхождения ключевых фраз в порядке появления в тексте.
+        """
+        found: List[str] = []
+        if self.pattern is None:
+            return found
+
+        haystack, search = text, self.pattern.search
+        if not self.case_sensitive:
+            folded = text.lower()
+            if len(folded) == len(text):
+                haystack = folded
+            else:
+                search = self._icase_pattern.search
+
+        pos = 0
+        while True:
+            m = search(haystack, pos)
+            if m is None:
+                break
+            start = m.start()
+            # Граница слова слева проверяется здесь, а не в регулярном
+            # выражении: так re сохраняет быстрый поиск по первому символу
+            if not (start > 0 and needs_boundary(text[start]) and is_word_char(text[start - 1])):
+                self._collect(text, start, m.end(), found)
+            pos = start + 1
+        return found
+
+    def _collect(self, text: str, start: int, end: int, found: List[str]):
+        """
+        Проходит дерево по тексту [start, end) и добавляет все фразы,
+        у которых выполнена граница слова справа.
+        """
+        node = self.root
+        i = start
+        length = len(text)
+        while i < end:
+            ch = text[i]
+            if ch.isspace():
+                node = node.children.get(_WS)
+                while i < end and text[i].isspace():
+                    i += 1
+            else:
+                node = node.children.get(self._fold(ch))
+                i += 1
+            if node is None:
+                return
+            if node.terminal and not (node.boundary and i < length and is_word_char(text[i])):
+                found.append(text[start:i])
@@ -1,39 +1,73 @@
 # crawler/logger.py
+import atexit
 import logging
-from logging.handlers import RotatingFileHandler
+import queue
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 from pathlib import Path
 
-def init_logger(cfg):
+def init_logger(cfg) -> QueueListener:
+    """
+    Логгеры пишут записи в очередь (QueueHandler), а форматирование
+    и запись в файл и консоль выполняет фоновый поток QueueListener —
+    event loop не ждёт диска. Слушатель останавливается при выходе
+    процесса, дописав очередь.
+    """
     log_path = Path(cfg.path)
     if not log_path.parent.exists():
         log_path.parent.mkdir(parents=True, exist_ok=True)
 
-    # Файл-логирование на INFO и выше
+    formatter = logging.Formatter(
+        fmt="%(asctime)s [%(levelname)s] %(name)s: %(message)s",
+        datefmt="%Y-%m-%d %H:%M:%S"
+    )
+
+    # Файл-логирование
     file_handler = RotatingFileHandler(
         filename=cfg.path,
         maxBytes=cfg.max_bytes,
         backupCount=cfg.backup_count,
         encoding='utf-8'
     )
-    file_formatter = logging.Formatter(
-        fmt="%(asctime)s [%(levelname)s] %(name)s: %(message)s",
-        datefmt="%Y-%m-%d %H:%M:%S"
-    )
-    file_handler.setFormatter(file_formatter)
-    file_handler.setLevel(logging.INFO)
+    file_handler.setFormatter(formatter)
+    file_handler.setLevel(cfg.file_level.upper())
 
-    # Логирование в консоль на DEBUG и выше
+    # Логирование в консоль
     console_handler = logging.StreamHandler()
-    console_handler.setLevel(logging.DEBUG)
-    console_formatter = logging.Formatter(
-        fmt="%(asctime)s [%(levelname)s] %(name)s: %(message)s",
-        datefmt="%Y-%m-%d %H:%M:%S"
-    )
-    console_handler.setFormatter(console_formatter)
+    console_handler.setLevel(cfg.console_level.upper())
+    console_handler.setFormatter(formatter)
+
+    records: queue.SimpleQueue = queue.SimpleQueue()
+    listener = QueueListener(records, file_handler, console_handler, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
 
     root = logging.getLogger()
-    root.setLevel(logging.DEBUG)      # корневой логгер на DEBUG
-    root.addHandler(file_handler)
-    root.addHandler(console_handler)
+    root.setLevel(cfg.level.upper())
+    root.addHandler(QueueHandler(records))
+
+    # Уровни отдельных логгеров, например Scheduler: WARNING, aiohttp: ERROR
+    for name, level in cfg.levels.items():
+        logging.getLogger(name).setLevel(str(level).upper())
 
     root.info("Logger initialized")
+    return listener
+
+class LogSampler:
+    """
+    Прореживание сообщений, которые пишутся на каждый URL: sample()
+    возвращает True для одного вызова из every (every = 1 — для всех,
+    0 — ни для одного). Проверять нужно до форматирования сообщения.
+    """
+
+    def __init__(self, every: int):
+        self.every = every
+        self._count = 0
+
+    def sample(self) -> bool:
+        if self.every <= 0:
+            return False
+        self._count += 1
+        if self._count >= self.every:
+            self._count = 0
+            return True
+        return False
@@ -0,0 +1,242 @@
+# crawler/metrics.py
+"""
+Реестр метрик (счётчики, показатели, гистограммы) и их HTTP-экспорт
+в текстовом формате Prometheus.
+
+Все обновления выполняются в потоке event loop, поэтому метрики —
+обычные числа в словарях без блокировок: инкремент стоит одной
+операции со словарём, а снимок для /metrics собирается при запросе.
+"""
+import math
+import time
+import bisect
+import logging
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+from aiohttp import web
+
+LabelValues = Tuple[str, ...]
+
+# Границы корзин гистограмм по умолчанию (сек)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Значение метки для серий сверх max_series (защита от взрыва кардинальности)
+OVERFLOW_LABEL = '__other__'
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+class _Metric:
+    kind = ''
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), max_series: int = 1000):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self.max_series = max_series
+
+    def _key(self, labels: LabelValues, series: Dict) -> LabelValues:
+        if len(labels) != len(self.label_names):
+            raise ValueError(f"{self.name}: expected labels {self.label_names}, got {labels}")
+        if labels not in series and len(series) >= self.max_series:
+            return (OVERFLOW_LABEL,) * len(labels)
+        return labels
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, *labels: str):
+        key = self._key(labels, self.values)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def get(self, *labels: str) -> float:
+        return self.values.get(labels, 0)
+
+    def render(self) -> List[str]:
+        return [f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}"
+                for key, value in self.values.items()]
+
+class Gauge(_Metric):
+    """
+    Текущее значение. Вместо set() можно передать callback, который
+    вызывается при каждом запросе /metrics (например, размер очереди).
+    """
+    kind = 'gauge'
+
+    def __init__(self, *args, callback: Optional[Callable[[], float]] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.values: Dict[LabelValues, float] = {}
+        self.callback = callback
+
+    def set(self, value: float, *labels: str):
+        self.values[self._key(labels, self.values)] = value
+
+    def inc(self, amount: float = 1, *labels: str):
+        key = self._key(labels, self.values)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, *labels: str):
+        self.inc(-amount, *labels)
+
+    def get(self, *labels: str) -> float:
+        return self.values.get(labels, 0)
+
+    def render(self) -> List[str]:
+        if self.callback is not None:
+            self.values[()] = self.callback()
+        return [f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}"
+                for key, value in self.values.items()]
+
+class Histogram(_Metric):
+    """
+    Гистограмма с фиксированными корзинами. observe() увеличивает только
+    одну корзину (поиск делением пополам), накопительные суммы корзин
+    считаются при выводе.
+    """
+    kind = 'histogram'
+
+    def __init__(self, *args, buckets: Sequence[float] = DEFAULT_BUCKETS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.bounds = sorted(buckets)
+        # метки -> [счётчики корзин (+Inf последней), сумма, количество]
+        self.series: Dict[LabelValues, list] = {}
+
+    def observe(self, value: float, *labels: str):
+        key = self._key(labels, self.series)
+        data = self.series.get(key)
+        if data is None:
+            data = self.series[key] = [[0] * (len(self.bounds) + 1), 0.0, 0]
+        data[0][bisect.bisect_left(self.bounds, value)] += 1
+        data[1] += value
+        data[2] += 1
+
+    def time(self, *labels: str) -> "_Timer":
+        return _Timer(self, labels)
+
+    def render(self) -> List[str]:
+        lines = []
+        for key, (counts, total, count) in self.series.items():
+            cumulative = 0
+            for bound, n in zip(self.bounds + [math.inf], counts):
+                cumulative += n
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.label_names, key, le)} {cumulative}")
+            labels = _format_labels(self.label_names, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+class _Timer:
+    def __init__(self, histogram: Histogram, labels: LabelValues):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started, *self.labels)
+        return False
+
+class MetricsRegistry:
+    """
+    Именованные метрики процесса. Повторная регистрация с тем же именем
+    возвращает уже созданную метрику.
+    """
+
+    def __init__(self, namespace: str = 'jtk'):
+        self.namespace = namespace
+        self.metrics: Dict[str, _Metric] = {}
+        self.collectors: List[Callable[[], List[str]]] = []
+
+    def _register(self, cls, name: str, help: str, labels: Sequence[str], **kwargs):
+        full_name = f"{self.namespace}_{name}" if self.namespace else name
+        metric = self.metrics.get(full_name)
+        if metric is None:
+            metric = self.metrics[full_name] = cls(full_name, help, labels, **kwargs)
+        elif not isinstance(metric, cls):
+            raise ValueError(f"Metric {full_name} already registered as {metric.kind}")
+        return metric
+
+    def counter(self, name: str, help: str, labels: Sequence[str] = (), **kwargs) -> Counter:
+        return self._register(Counter, name, help, labels, **kwargs)
+
+    def gauge(self, name: str, help: str, labels: Sequence[str] = (), **kwargs) -> Gauge:
+        return self._register(Gauge, name, help, labels, **kwargs)
+
+    def histogram(self, name: str, help: str, labels: Sequence[str] = (), **kwargs) -> Histogram:
+        return self._register(Histogram, name, help, labels, **kwargs)
+
+    def add_collector(self, collector: Callable[[], List[str]]):
+        """
+        Добавляет функцию, возвращающую готовые строки в формате Prometheus.
+        """
+        self.collectors.append(collector)
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self.metrics.values():
+            samples = metric.render()
+            if samples:
+                lines.extend(metric.header())
+                lines.extend(samples)
+        for collector in self.collectors:
+            lines.extend(collector())
+        return '\n'.join(lines) + '\n'
+
+class MetricsExporter:
+    """
+    Локальный HTTP-сервер aiohttp: GET /metrics отдаёт registry.render().
+    """
+
+    def __init__(self, registry: MetricsRegistry, host: str = '127.0.0.1', port: int = 9108):
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self.logger = logging.getLogger("MetricsExporter")
+        self._runner: Optional[web.AppRunner] = None
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        return web.Response(
+            text=self.registry.render(),
+            headers={'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+        )
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get('/metrics', self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        try:
+            await web.TCPSite(self._runner, self.host, self.port).start()
+        except OSError as e:
+            # Занятый порт не должен мешать обходу
+            self.logger.error(f"Cannot serve metrics on {self.host}:{self.port}: {e}")
+            await self.close()
+            return
+        self.logger.info(f"Serving metrics at http://{self.host}:{self.port}/metrics")
+
+    async def close(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
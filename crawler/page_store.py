@@ -0,0 +1,254 @@
+# crawler/page_store.py
+import os
+import gzip
+import json
+import time
+import uuid
+import asyncio
+import hashlib
+import logging
+import threading
+from typing import Dict, NamedTuple, Optional, Tuple
+
+class PageEntry(NamedTuple):
+    digest: str      # sha256 тела страницы (имя объекта)
+    final_url: str   # URL после редиректов
+    stored: float    # время сохранения (time.time())
+    size: int        # размер сжатого объекта в байтах
+
+class PageStore:
+    """
+    Кэш загруженных страниц с адресацией по содержимому.
+
+    На диске:
+      - objects/ab/cd/<sha256>.gz — сжатые тела страниц; одинаковые тела
+        (например, одна и та же страница в разных снимках) хранятся один раз;
+      - index.jsonl — журнал индекса URL -> объект. При старте он
+        проигрывается в словарь, а после очистки перезаписывается компактно.
+
+    Срок жизни проверяется по времени из индекса, без обращений к диску.
+    Синхронные методы (*_sync) выполняют файловый ввод-вывод; асинхронные
+    обёртки уводят его из event loop через asyncio.to_thread. Фоновая
+    задача sweep удаляет записи старше ttl_days и самые старые записи,
+    пока общий размер больше max_bytes.
+    """
+
+    def __init__(self, root: str, ttl_days: float, max_bytes: int = 0,
+                 sweep_interval: float = 600, compress_level: int = 6):
+        self.root = root
+        self.objects_dir = os.path.join(root, 'objects')
+        self.index_path = os.path.join(root, 'index.jsonl')
+        self.ttl = ttl_days * 86400
+        self.max_bytes = max_bytes
+        self.sweep_interval = sweep_interval
+        self.compress_level = compress_level
+        self.logger = logging.getLogger("PageStore")
+
+        self._index: Dict[str, PageEntry] = {}
+        self._refs: Dict[str, int] = {}
+        self._sizes: Dict[str, int] = {}
+        self._total_bytes = 0
+        self._log_lines = 0
+        self._lock = threading.Lock()
+        self._log = None
+        self._sweeper: Optional[asyncio.Task] = None
+
+        os.makedirs(self.objects_dir, exist_ok=True)
+        self._load_index()
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    @property
+    def total_bytes(self) -> int:
+        return self._total_bytes
+
+    # --- индекс --------------------------------------------------------
+
+    def _load_index(self):
+        if not os.path.exists(self.index_path):
+            return
+        with open(self.index_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                self._log_lines += 1
+                try:
+                    row = json.loads(line)
+                except ValueError:
+                    continue  # строка, оборванная при аварийном завершении
+                url = row.get('url')
+                if not url:
+                    continue
+                if row.get('digest'):
+                    self._set(url, PageEntry(row['digest'], row['final_url'], row['stored'], row['size']))
+                else:
+                    self._unset(url)
+        self.logger.info(f"Page store: {len(self._index)} pages, {self._total_bytes} bytes")
+
+    def _set(self, url: str, entry: PageEntry) -> Optional[str]:
+        """
+        Обновляет индекс в памяти. Возвращает digest объекта,
+        на который больше никто не ссылается.
+        """
+        orphan = self._unset(url)
+        self._index[url] = entry
+        refs = self._refs.get(entry.digest, 0)
+        if refs == 0:
+            self._total_bytes += entry.size
+            self._sizes[entry.digest] = entry.size
+        self._refs[entry.digest] = refs + 1
+        return orphan if orphan != entry.digest else None
+
+    def _unset(self, url: str) -> Optional[str]:
+        entry = self._index.pop(url, None)
+        if entry is None:
+            return None
+        refs = self._refs[entry.digest] - 1
+        if refs:
+            self._refs[entry.digest] = refs
+            return None
+        del self._refs[entry.digest]
+        del self._sizes[entry.digest]
+        self._total_bytes -= entry.size
+        return entry.digest
+
+    def _append_log(self, row: dict):
+        if self._log is None:
+            self._log = open(self.index_path, 'a', encoding='utf-8')
+        self._log.write(json.dumps(row, ensure_ascii=False) + '\n')
+        self._log.flush()
+        self._log_lines += 1
+
+    def _object_path(self, digest: str) -> str:
+        return os.path.join(self.objects_dir, digest[:2], digest[2:4], f"{digest}.gz")
+
+    def _remove_object(self, digest: str):
+        try:
+            os.remove(self._object_path(digest))
+        except FileNotFoundError:
+            pass
+
+    # --- синхронный интерфейс ------------------------------------------
+
+    def get_sync(self, url: str) -> Optional[Tuple[str, str]]:
+        """
+        Возвращает (content, final_url) или None, если страницы нет или она устарела.
+        """
+        entry = self._index.get(url)
+        if entry is None or time.time() - entry.stored > self.ttl:
+            return None
+        try:
+            with open(self._object_path(entry.digest), 'rb') as f:
+                return gzip.decompress(f.read()).decode('utf-8'), entry.final_url
+        except (OSError, EOFError, UnicodeDecodeError) as e:
+            self.logger.warning(f"Dropping unreadable cached page for {url}: {e}")
+            with self._lock:
+                if self._index.get(url) == entry:
+                    orphan = self._unset(url)
+                    self._append_log({'url': url, 'digest': None})
+                    if orphan:
+                        self._remove_object(orphan)
+            return None
+
+    def put_sync(self, url: str, content: str, final_url: Optional[str] = None):
+        body = content.encode('utf-8')
+        digest = hashlib.sha256(body).hexdigest()
+        path = self._object_path(digest)
+
+        with self._lock:
+            size = self._sizes.get(digest)
+        if size is None:
+            data = gzip.compress(body, self.compress_level)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Уникальное имя временного файла: тот же объект может
+            # одновременно записываться из нескольких потоков
+            tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+            size = len(data)
+
+        entry = PageEntry(digest, final_url or url, time.time(), size)
+        with self._lock:
+            orphan = self._set(url, entry)
+            self._append_log({'url': url, **entry._asdict()})
+            if orphan:
+                self._remove_object(orphan)
+
+    def sweep_sync(self) -> int:
+        """
+        Удаляет устаревшие записи, затем самые старые — до max_bytes.
+        Возвращает число удалённых записей.
+        """
+        with self._lock:
+            now = time.time()
+            victims = [url for url, entry in self._index.items() if now - entry.stored > self.ttl]
+            for url in victims:
+                self._evict(url)
+
+            if self.max_bytes and self._total_bytes > self.max_bytes:
+                by_age = sorted((entry.stored, url) for url, entry in self._index.items())
+                for _, url in by_age:
+                    if self._total_bytes <= self.max_bytes:
+                        break
+                    victims.append(url)
+                    self._evict(url)
+
+            if victims or self._log_lines > 2 * len(self._index) + 1000:
+                self._compact()
+
+        if victims:
+            self.logger.info(f"Evicted {len(victims)} cached pages, {self._total_bytes} bytes left")
+        return len(victims)
+
+    def _evict(self, url: str):
+        orphan = self._unset(url)
+        if orphan:
+            self._remove_object(orphan)
+
+    def _compact(self):
+        """
+        Перезаписывает журнал индекса, оставляя по строке на URL.
+        """
+        if self._log is not None:
+            self._log.close()
+            self._log = None
+        tmp_path = self.index_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for url, entry in self._index.items():
+                f.write(json.dumps({'url': url, **entry._asdict()}, ensure_ascii=False) + '\n')
+        os.replace(tmp_path, self.index_path)
+        self._log_lines = len(self._index)
+
+    # --- асинхронный интерфейс -----------------------------------------
+
+    async def get(self, url: str) -> Optional[Tuple[str, str]]:
+        if url not in self._index:
+            return None
+        return await asyncio.to_thread(self.get_sync, url)
+
+    async def put(self, url: str, content: str, final_url: Optional[str] = None):
+        await asyncio.to_thread(self.put_sync, url, content, final_url)
+
+    def start(self):
+        """
+        Запускает фоновую очистку (нужен работающий event loop).
+        """
+        if self._sweeper is None and self.sweep_interval > 0:
+            self._sweeper = asyncio.create_task(self._sweep_loop())
+
+    async def _sweep_loop(self):
+        while True:
+            try:
+                await asyncio.to_thread(self.sweep_sync)
+            except Exception as e:
+                self.logger.error(f"Page store sweep failed: {e}")
+            await asyncio.sleep(self.sweep_interval)
+
+    def close(self):
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            self._sweeper = None
+        with self._lock:
+            if self._log is not None:
+                self._log.close()
+                self._log = None
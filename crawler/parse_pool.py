@@ -0,0 +1,97 @@
+# crawler/parse_pool.py
+import signal
+import asyncio
+import logging
+import multiprocessing
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Sequence, Tuple
+from .parser import Parser
+from . import utils
+
+# Экземпляр Parser внутри процесса-воркера (создаётся один раз в initializer)
+_worker_parser: Optional[Parser] = None
+
+def _init_worker(cfg, scope_domains: Sequence[str], wayback_base: str):
+    global _worker_parser
+    # Ctrl+C обрабатывает основной процесс, воркеры завершаются вместе с пулом
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    utils.configure_wayback(wayback_base)
+    _worker_parser = Parser(cfg, scope_domains)
+
+def _parse_in_worker(html: str, base_url: str) -> Tuple[List[str], List[str], Dict[str, int]]:
+    matches, urls = _worker_parser.parse(html, base_url)
+    # Счётчики фильтра живут в процессе-воркере, поэтому возвращаются вместе с результатом
+    return matches, urls, _worker_parser.take_filter_hits()
+
+def _scan_in_worker(html: str, base_url: str) -> Tuple[List[str], List[str]]:
+    return _worker_parser.scan(html, base_url)
+
+class ParsePool:
+    """
+    Выполняет Parser.parse вне event loop.
+
+    При cfg.workers == 0 разбор идёт прямо в event loop (как раньше).
+    При cfg.workers > 0 страницы отправляются в пул процессов: у каждого
+    процесса свой Parser, поэтому по сети передаются только тело страницы
+    и базовый URL, а обратно — совпадения и ссылки. Число страниц «в полёте»
+    ограничено, чтобы очередь пула не копила тела страниц в памяти.
+    """
+
+    def __init__(self, cfg, parser: Parser):
+        self.cfg = cfg
+        self.parser = parser
+        self.workers = cfg.workers
+        self.logger = logging.getLogger("ParsePool")
+        self.executor: Optional[ProcessPoolExecutor] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._filter_hits: Counter = Counter()
+
+        if self.workers > 0:
+            self.executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_worker,
+                initargs=(cfg, parser.url_filter.scope_domains, utils.WAYBACK_BASE)
+            )
+            self._slots = asyncio.Semaphore(self.workers * cfg.queue_per_worker)
+            self.logger.info(f"Parsing offloaded to {self.workers} worker processes")
+
+    async def parse(self, html: str, base_url: str) -> Tuple[List[str], List[str]]:
+        """
+        Асинхронный аналог Parser.parse с тем же контрактом (matches, discovered_urls).
+        """
+        if self.executor is None:
+            return self.parser.parse(html, base_url)
+
+        loop = asyncio.get_running_loop()
+        async with self._slots:
+            matches, urls, hits = await loop.run_in_executor(self.executor, _parse_in_worker, html, base_url)
+        self._filter_hits.update(hits)
+        return matches, urls
+
+    async def scan(self, html: str, base_url: str = '') -> Tuple[List[str], List[str]]:
+        """
+        Асинхронный аналог Parser.scan: совпадения и неразрешённые ссылки.
+        """
+        if self.executor is None:
+            return self.parser.scan(html, base_url)
+
+        loop = asyncio.get_running_loop()
+        async with self._slots:
+            return await loop.run_in_executor(self.executor, _scan_in_worker, html, base_url)
+
+    def take_filter_hits(self) -> Dict[str, int]:
+        """
+        Счётчики UrlFilter с прошлого вызова — из процессов пула и из Parser
+        (ссылки из scan() фильтрует Parser основного процесса).
+        """
+        hits = self._filter_hits
+        self._filter_hits = Counter()
+        hits.update(self.parser.take_filter_hits())
+        return dict(hits)
+
+    async def close(self):
+        if self.executor is not None:
+            await asyncio.to_thread(self.executor.shutdown, wait=True, cancel_futures=True)
+            self.executor = None
@@ -1,106 +1,82 @@
 # crawler/parser.py
 
-import re
 import logging
-from typing import List, Tuple
+from typing import Dict, List, Sequence, Tuple
 from urllib.parse import urljoin
-from bs4 import BeautifulSoup, Comment
+from .keywords import KeywordMatcher
+from .html_extract import get_extractor
+from .url_filter import UrlFilter
+from .tracing import span
 
 class Parser:
-    def __init__(self, cfg):
+    def __init__(self, cfg, scope_domains: Sequence[str] = ()):
         """
-        cfg — это инстанс ParserConfig с полем:
+        cfg — это инстанс ParserConfig с полями:
           - patterns_file: str
+          - url_filters: str (правила отсева ссылок)
+          - case_sensitive: bool
+          - backend: str ('bs4' или 'lxml')
+        scope_domains — домены обхода; ссылки на другие хосты отбрасываются
+          (пустой список — без ограничения).
         """
+        self.cfg = cfg
         self.logger = logging.getLogger(__name__)
-        self.keyword_patterns = self._compile_patterns(cfg.patterns_file)
-
-    def _compile_patterns(self, patterns_file: str) -> List[re.Pattern]:
-        """
-        Загружает файл с ключевыми словами (одна строка = один шаблон)
-        и компилирует их в регулярные выражения.
-        """
-        patterns = []
+        self.matcher = KeywordMatcher.from_file(cfg.patterns_file, cfg.case_sensitive)
+        self.url_filter = UrlFilter.from_file(cfg.url_filters, scope_domains)
         try:
-            with open(patterns_file, 'r', encoding='utf-8') as f:
-                for line in f:
-                    line = line.strip()
-                    if not line or line.startswith('#'):
-                        continue
-                    pat = re.escape(line).replace(r'\ ', r'\s+')
-                    patterns.append(re.compile(rf"\b{pat}\b", re.IGNORECASE))
-        except Exception as e:
-            self.logger.error(f"Failed to load patterns from {patterns_file}: {e}")
-        return patterns
+            self.extract = get_extractor(cfg.backend)
+        except ImportError as e:
+            self.logger.warning(f"{e}, falling back to 'bs4'")
+            self.extract = get_extractor('bs4')
 
     def parse(self, html: str, base_url: str) -> Tuple[List[str], List[str]]:
         """
         Парсит HTML:
           - возвращает список найденных совпадений ключевых слов
-          - список новых URL для обхода
+          - список новых URL для обхода (уже прошедших UrlFilter)
+        """
+        matches, hrefs = self.scan(html, base_url)
+        return matches, self.resolve(hrefs, base_url)
+
+    def scan(self, html: str, base_url: str = '') -> Tuple[List[str], List[str]]:
+        """
+        Первая часть parse(), не зависящая от адреса страницы: совпадения
+        и ссылки как они записаны в HTML (относительные не разрешены).
+        Такой результат можно переиспользовать для того же тела по другому
+        адресу. base_url нужен только для сообщения об ошибке.
         """
         matches: List[str] = []
-        discovered_urls: List[str] = []
+        hrefs: List[str] = []
 
         try:
-            soup = BeautifulSoup(html, 'html.parser')
-
-            # 1) Собираем текст для поиска:
-            parts: List[str] = []
-
-            # 1.1) Видимый текст
-            parts.append(soup.get_text(separator=' '))
-
-            # 1.2) <title>
-            if soup.title and soup.title.string:
-                parts.append(soup.title.string)
-
-            # 1.3) <meta name="description"> и другие meta[name/...]
-            for meta in soup.find_all('meta', attrs={'content': True}):
-                content = meta.get('content', '').strip()
-                if content:
-                    parts.append(content)
-
-            # 1.4) Атрибуты alt, title, aria-*, data-* и другие
-            for tag in soup.find_all(True):
-                for attr, value in tag.attrs.items():
-                    if isinstance(value, str):
-                        parts.append(value)
-                    elif isinstance(value, list):
-                        parts.extend(value)
-
-            # 1.5) Содержимое <script> (например, JSON-LD)
-            for script in soup.find_all('script'):
-                if script.string:
-                    parts.append(script.string)
-
-            # 1.6) HTML-комментарии
-            for comment in soup.find_all(string=lambda text: isinstance(text, Comment)):
-                parts.append(comment)
+            # 1) Собираем текст для поиска и ссылки выбранным бэкендом;
+            # urljoin('', href) возвращает href без изменений
+            with span('extract'):
+                parts, hrefs = self.extract(html, '')
 
             # Объединяем всё в один большой текст
             full_text = " ".join(parts)
 
-            # 2) Ищем совпадения по ключевым шаблонам
-            for pat in self.keyword_patterns:
-                for m in pat.findall(full_text):
-                    matches.append(m)
-
-            # 3) Извлекаем ссылки из href и src всех релевантных тегов
-            for tag in soup.find_all(['a', 'img', 'script', 'iframe', 'link'], href=True):
-                url = tag.get('href')
-                if url:
-                    discovered_urls.append(urljoin(base_url, url))
-            for tag in soup.find_all(['img', 'script', 'iframe', 'link'], src=True):
-                url = tag.get('src')
-                if url:
-                    discovered_urls.append(urljoin(base_url, url))
+            # 2) Ищем совпадения по всем ключевым фразам за один проход
+            with span('match'):
+                matches.extend(self.matcher.findall(full_text))
 
         except Exception as e:
             self.logger.error(f"Parsing error at {base_url}: {e}")
 
         # Убираем дубли и возвращаем списки
-        matches = list(dict.fromkeys(matches))
-        discovered_urls = list(dict.fromkeys(discovered_urls))
+        return list(dict.fromkeys(matches)), list(dict.fromkeys(hrefs))
 
-        return matches, discovered_urls
+    def resolve(self, hrefs: List[str], base_url: str) -> List[str]:
+        """
+        Разрешает ссылки из scan() относительно base_url и пропускает через UrlFilter.
+        """
+        with span('url_filter'):
+            urls = [urljoin(base_url, href) for href in hrefs]
+            return self.url_filter.filter(list(dict.fromkeys(urls)))
+
+    def take_filter_hits(self) -> Dict[str, int]:
+        """
+        Забирает счётчики срабатываний правил UrlFilter с прошлого вызова.
+        """
+        return self.url_filter.take_hits()
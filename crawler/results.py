@@ -0,0 +1,113 @@
+# crawler/results.py
+import os
+import json
+import time
+import asyncio
+import logging
+from typing import Dict, Iterator, List, Optional
+
+class ResultsWriter:
+    """
+    Потоковая запись найденных совпадений в JSONL-сегменты.
+
+    Каждая строка — {"url": ..., "matches": [...], "ts": ...}. Записи копятся
+    в буфере и сбрасываются на диск пачкой, когда их набирается batch_size
+    или с прошлого сброса прошло flush_interval секунд. Запись идёт в потоке
+    (asyncio.to_thread), в памяти держится не больше одной-двух пачек.
+    Сегмент results/matches-<время>-<pid>-<номер>.jsonl сменяется новым
+    после segment_size байт; файлы прошлых запусков не перезаписываются.
+    """
+
+    def __init__(self, directory: str, batch_size: int = 1000, flush_interval: float = 300,
+                 segment_size: int = 256 * 1024 * 1024):
+        self.directory = directory
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.segment_size = segment_size
+        self.logger = logging.getLogger("ResultsWriter")
+
+        self._buffer: List[str] = []
+        self._last_flush = time.monotonic()
+        self._write_lock = asyncio.Lock()
+        self._file = None
+        self._serial = 0
+        self._stamp = time.strftime('%Y%m%d-%H%M%S')
+        self._flusher: Optional[asyncio.Task] = None
+
+        os.makedirs(directory, exist_ok=True)
+
+    async def add(self, url: str, matches: List[str]):
+        self._buffer.append(json.dumps(
+            {'url': url, 'matches': matches, 'ts': int(time.time())},
+            ensure_ascii=False
+        ))
+        if len(self._buffer) >= self.batch_size:
+            await self.flush()
+
+    async def flush(self):
+        """
+        Сбрасывает накопленные записи на диск (вне event loop).
+        """
+        self._last_flush = time.monotonic()
+        if not self._buffer:
+            return
+        batch, self._buffer = self._buffer, []
+        # Пачки пишутся по очереди, чтобы строки не перемешивались
+        async with self._write_lock:
+            await asyncio.to_thread(self._write, batch)
+
+    def _write(self, lines: List[str]):
+        if self._file is None or self._file.tell() >= self.segment_size:
+            self._open_segment()
+        self._file.write('\n'.join(lines) + '\n')
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def _open_segment(self):
+        if self._file is not None:
+            self._file.close()
+        self._serial += 1
+        path = os.path.join(self.directory, f"matches-{self._stamp}-{os.getpid()}-{self._serial:04d}.jsonl")
+        self._file = open(path, 'a', encoding='utf-8')
+        self.logger.info(f"Writing matches to {path}")
+
+    def start(self):
+        """
+        Запускает периодический сброс по flush_interval (нужен работающий event loop).
+        """
+        if self._flusher is None:
+            self._flusher = asyncio.create_task(self._flush_loop())
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(max(1.0, self.flush_interval - (time.monotonic() - self._last_flush)))
+            if time.monotonic() - self._last_flush >= self.flush_interval:
+                try:
+                    await self.flush()
+                except Exception as e:
+                    self.logger.error(f"Failed to flush matches: {e}")
+
+    async def close(self):
+        if self._flusher is not None:
+            self._flusher.cancel()
+            self._flusher = None
+        await self.flush()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+def iter_results(directory: str) -> Iterator[Dict]:
+    """
+    Читает записи из всех сегментов каталога по порядку (оборванные строки пропускаются).
+    """
+    if not os.path.isdir(directory):
+        return
+    for name in sorted(os.listdir(directory)):
+        if not (name.startswith('matches-') and name.endswith('.jsonl')):
+            continue
+        with open(os.path.join(directory, name), 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue
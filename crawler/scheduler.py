@@ -1,15 +1,15 @@
+import time
 import asyncio
 import logging
-from asyncio import PriorityQueue
-from dataclasses import dataclass, field
+import contextlib
+from crawler.frontier import HostFrontier, PrioritizedItem
+from crawler.frontier_store import FrontierStore
 from crawler.wayback_cdx import CDXManager
-from typing import List, Dict, Optional
-
-@dataclass(order=True)
-class PrioritizedItem:
-    priority: int
-    depth: int
-    url: str = field(compare=False)
+from crawler.warc import WarcRecord, decode_body, find_warc_files, iter_warc_responses
+from crawler.utils import canonicalize_url, host_of, is_valid_mime_type, unwrap_wayback
+from crawler.tracing import span
+from crawler.logger import LogSampler
+from typing import Iterator, List, Dict, Optional
 
 class Scheduler:
     def __init__(
@@ -19,7 +19,11 @@ class Scheduler:
         storage,
         fetcher,
         parser,
-        stats
+        stats,
+        parse_pool=None,
+        dedup=None,
+        router=None,
+        tracer=None
     ):
         # Разделение конфигураций
         self.scheduler_cfg = scheduler_cfg
@@ -28,53 +32,116 @@ class Scheduler:
         self.fetcher       = fetcher
         self.parser        = parser
         self.stats         = stats
+        self.parse_pool    = parse_pool
+        self.dedup         = dedup
+        self.router        = router   # ShardRouter в режиме --shards, иначе None
+        self.tracer        = tracer   # Tracer: длительности этапов обработки URL
 
         import logging
         self.logger = logging.getLogger("Scheduler")
+        # Строки о каждом URL пишутся только для каждого log_every-го
+        self.url_log = LogSampler(scheduler_cfg.log_every)
 
-        self.queue        = PriorityQueue(maxsize=scheduler_cfg.queue_size)
+        fetch_cfg = fetcher.cfg
+        store = FrontierStore(scheduler_cfg.frontier_path) if scheduler_cfg.frontier_path else None
+        self.queue        = HostFrontier(
+            maxsize=scheduler_cfg.queue_size,
+            default_interval=fetch_cfg.rate_limit,
+            host_intervals=fetch_cfg.host_rate_limits,
+            burst=fetch_cfg.host_burst,
+            seed_domains=scheduler_cfg.seeds,
+            store=store
+        )
         self.workers      = []
+
+        metrics = stats.metrics
+        self.parse_seconds = metrics.histogram(
+            'parse_duration_seconds', 'Duration of page parsing (pool or inline)',
+            buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5))
+        metrics.gauge('frontier_size', 'URLs waiting in the frontier (memory and disk)',
+                      callback=self.queue.qsize)
+        self.bootstrap_task: Optional[asyncio.Task] = None
         self.is_running   = True
-        self.poison_pill  = scheduler_cfg.poison_pill
+        # Устанавливается, когда shutdown() записал очередь, совпадения и фильтры на диск
+        self.stopped      = asyncio.Event()
         self.max_depth    = scheduler_cfg.max_depth
 
     async def run(self):
         """
-        Запускает процесс планировщика: инициализация семян, запуск воркеров и ожидание их завершения.
+        Запускает процесс планировщика: воркеры стартуют сразу, а загрузка семян
+        из CDX идёт параллельно с ними и пополняет очередь по мере поступления страниц.
+        Если на диске остались необработанные URL прошлого запуска, обход
+        продолжается с них (см. _resume_or_bootstrap). Возвращает управление
+        после того, как shutdown() полностью завершился.
         """
-        await self._bootstrap_seeds()
-
-        # Создание и запуск воркеров
-        for _ in range(self.scheduler_cfg.max_concurrent):
+        # Создание и запуск воркеров. С адаптивным регулятором воркеров должно
+        # хватать на максимальное окно: сколько из них реально качают, решает он
+        worker_count = self.scheduler_cfg.max_concurrent
+        if self.fetcher.limiter is not None:
+            worker_count = max(worker_count, self.fetcher.limiter.max_window)
+        for _ in range(worker_count):
             worker = asyncio.create_task(self._worker_loop())
             self.workers.append(worker)
 
-        # Ожидание завершения всех воркеров
+        if self.router is not None:
+            self.router.start(self.enqueue_url)
+
+        await self._resume_or_bootstrap()
+
+        # Ожидание завершения всех воркеров. Они останавливаются, когда shutdown()
+        # закрывает очередь, а он сам ещё ждёт шарды и пишет состояние на диск:
+        # run() возвращает управление только после этого
         await asyncio.gather(*self.workers)
         logging.info("All workers shut down.")
+        await self.stopped.wait()
+
+    async def _resume_or_bootstrap(self):
+        """
+        Возвращает в очередь URL прошлого запуска и запускает загрузку семян,
+        если очередь пуста или прошлая загрузка не успела завершиться
+        (уже поставленные семена отсеет проверка посещённых URL).
+        """
+        pending = await self.queue.restore()
+        if pending:
+            await self.stats.add_total_urls(pending)
+            if await self.queue.is_bootstrapped():
+                self.logger.info(f"Resuming interrupted crawl: {pending} pending URLs, seed bootstrap already complete")
+                return
+            self.logger.info(f"Resuming interrupted crawl: {pending} pending URLs and unfinished seed bootstrap")
+        self.bootstrap_task = asyncio.create_task(self._bootstrap_seeds())
 
     async def _bootstrap_seeds(self):
         """
-        Загружает начальные URL: сначала из Wayback Machine, затем из конфигурации.
+        Загружает начальные URL: сначала из конфигурации, затем потоково из Wayback Machine.
+        Признак завершения сохраняется в хранилище очереди только после успешной загрузки.
         """
+        await self.queue.mark_bootstrapped(False)
+
+        # Обычные семена из конфигурации (при шардировании их ставит шард 0,
+        # остальным они достанутся через маршрутизацию)
+        if self.router is None or self.router.shard_id == 0:
+            self.logger.info(f"Adding {len(self.scheduler_cfg.seeds)} static seed URLs")
+            await self._enqueue_seed_batch(self.scheduler_cfg.seeds)
+
         try:
-            cdx = CDXManager(self.cdx_cfg, self.storage)
+            owns_domain = self.router.owns_domain if self.router is not None else None
+            cdx = CDXManager(self.cdx_cfg, self.storage, self.fetcher.limiter, owns_domain)
             await cdx.initialize(self.fetcher.session)
             self.logger.info("Bootstrapping seeds from CDX...")
-            seed_urls = await cdx.get_seed_urls()
-            self.logger.info(f"Total seed URLs from CDX: {len(seed_urls)}")
-            
-            # Устанавливаем общее число URL для прогресса
-            await self.stats.set_total_urls(len(seed_urls))
-            
-            for url in seed_urls:
-                await self.enqueue_url(url, priority=0, depth=0)
+            await cdx.stream_seed_urls(self._enqueue_seed_batch)
+            self.logger.info(f"CDX bootstrap finished, total seed URLs: {await self.stats.get_total_urls()}")
+            await self.queue.mark_bootstrapped()
+        except asyncio.CancelledError:
+            raise
         except Exception as e:
             self.logger.error(f"Failed to bootstrap from CDX: {e}")
 
-        # Обычные семена из конфигурации
-        self.logger.info(f"Adding {len(self.scheduler_cfg.seeds)} static seed URLs")
-        for url in self.scheduler_cfg.seeds:
+    async def _enqueue_seed_batch(self, urls: List[str]):
+        """
+        Ставит в очередь очередную порцию семян и увеличивает общее число URL для прогресса.
+        """
+        await self.stats.add_total_urls(len(urls))
+        for url in urls:
             await self.enqueue_url(url, priority=0, depth=0)
 
     async def enqueue_url(self, url: str, priority: int = 5, depth: int = 0):
@@ -84,6 +151,16 @@ class Scheduler:
             # Ограничение глубины
             if depth > self.max_depth:
                 return
+
+            # Варианты одного и того же URL (фрагмент, порядок параметров,
+            # модификатор снимка Wayback) считаются одним URL
+            url = canonicalize_url(url)
+
+            # URL чужого шарда отправляется владельцу, он и проверит посещение
+            if self.router is not None and not self.router.owns(url):
+                self.router.send(url, priority, depth)
+                await self.stats.increment("shard_routed_urls")
+                return
     
             # Защита от повторного посещения
             async with self.storage.visited_lock:
@@ -101,18 +178,15 @@ class Scheduler:
         """
         worker_name = asyncio.current_task().get_name()
         while self.is_running:
-            try:
-                item = await asyncio.wait_for(self.queue.get(), timeout=5)
-                self.logger.info(f"[{worker_name}] Dequeued URL: {item.url} (depth={item.depth})")
-            except asyncio.TimeoutError:
-                continue
-
-            if item.url == self.poison_pill:
-                self.logger.info(f"[{worker_name}] Received poison pill, stopping.")
+            item = await self.queue.get()
+            if item is None:
+                self.logger.info(f"[{worker_name}] Frontier closed, stopping.")
                 break
+            if self.logger.isEnabledFor(logging.DEBUG):
+                self.logger.debug(f"[{worker_name}] Dequeued URL: {item.url} (depth={item.depth})")
 
             await self._process_url(item.url, item.depth)
-            self.queue.task_done()
+            self.queue.task_done(item)
 
 
     async def _process_url(self, url: str, depth: int):
@@ -120,56 +194,216 @@ class Scheduler:
         Обрабатывает один URL: скачивает контент, парсит, сохраняет результаты и добавляет новые URL.
         """
         try:
-            content, final_url = await self.fetcher.fetch(url)
-            if not content:
-                self.logger.warning(f"No content for {url}, skipping.")
-                return
+            with self._trace(url):
+                with span('fetch'):
+                    content, final_url = await self.fetcher.fetch(url, self.queue.acquire)
+                if not content:
+                    # Причину уже записал Fetcher, исходы считаются в stats
+                    self.logger.debug(f"No content for {url}, skipping.")
+                    return
+
+                discovered_urls = await self.process_page(final_url, content)
+
+                # Ставим найденные ссылки в очередь
+                log_links = self.logger.isEnabledFor(logging.DEBUG)
+                with span('enqueue'):
+                    for new_url in discovered_urls:
+                        if log_links:
+                            self.logger.debug(f"Discovered URL: {new_url}")
+                        await self.enqueue_url(new_url, priority=depth + 1, depth=depth + 1)
+
+        except Exception as e:
+            # Учёт ошибок
+            await self.stats.increment("error_count")
+            self.logger.exception(f"Error processing {url}: {e}")
 
-            self.logger.info(f"Fetched {len(content)} bytes from {final_url}")
 
-            matches, discovered_urls = self.parser.parse(content, final_url)
-            if matches:
+    def _trace(self, url: str):
+        if self.tracer is None:
+            return contextlib.nullcontext()
+        return self.tracer.trace(url)
+
+    async def process_page(self, final_url: str, content: str) -> List[str]:
+        """
+        Общий этап обработки загруженной страницы (из сети или из WARC):
+        разбор, сохранение совпадений и статистика. Возвращает найденные ссылки.
+        """
+        with span('parse'):
+            matches, discovered_urls = await self._parse_or_reuse(content, final_url)
+        if matches:
+            with span('save'):
                 await self.storage.save_matches(final_url, matches)
-                self.logger.info(f"  → {len(matches)} keyword matches at {final_url}")
+            # Сами совпадения сохраняются в results, в лог — только при DEBUG
+            if self.logger.isEnabledFor(logging.DEBUG):
+                self.logger.debug(f"  → {len(matches)} keyword matches at {final_url}")
 
-            # Обновляем статистику
-            await self.stats.increment("processed_urls")
+        # Обновляем статистику; сводку по всем URL периодически пишет main.log_progress
+        await self.stats.increment("processed_urls")
+        if self.url_log.sample():
             processed = await self.stats.get("processed_urls")
             total = await self.stats.get_total_urls()
             pct = (processed / total * 100) if total else 0
-            self.logger.info(f"Progress: {processed}/{total} URLs ({pct:.2f}%)")
+            self.logger.info(
+                f"Processed {final_url}: {len(content)} chars, {len(discovered_urls)} links, "
+                f"{len(matches)} matches (progress {processed}/{total}, {pct:.2f}%)"
+            )
 
-            # Фиксируем количество совпадений
-            await self.stats.increment("match_count", len(matches))
+        # Фиксируем количество совпадений
+        await self.stats.increment("match_count", len(matches))
+        return discovered_urls
 
-            # Логируем найденные ссылки и ставим их в очередь
-            for new_url in discovered_urls:
-                self.logger.debug(f"Discovered URL: {new_url}")
-                await self.enqueue_url(new_url, priority=depth + 1, depth=depth + 1)
+    async def replay(self, paths: List[str], read_batch: int = 64):
+        """
+        Офлайн-режим: прогоняет ответы из WARC-файлов через тот же этап
+        process_page без сети и без обхода найденных ссылок. Файлы читаются
+        в отдельном потоке, страницы разбирают воркеры (и пул процессов).
+        """
+        files = find_warc_files(paths)
+        self.logger.info(f"Replaying {len(files)} WARC files")
+        pages: asyncio.Queue = asyncio.Queue(maxsize=read_batch * 4)
 
-        except Exception as e:
-            # Учёт ошибок
-            await self.stats.increment("error_count")
-            self.logger.exception(f"Error processing {url}: {e}")
+        worker_count = self.scheduler_cfg.max_concurrent
+        if self.parse_pool is not None and self.parse_pool.workers:
+            worker_count = max(worker_count, self.parse_pool.workers * self.parse_pool.cfg.queue_per_worker)
+
+        async def consume():
+            while True:
+                record = await pages.get()
+                if record is None:
+                    break
+                content_type = record.headers.get('content-type', 'text/html')
+                try:
+                    content = decode_body(record.body, content_type, self.fetcher.decoder,
+                                          host_of(unwrap_wayback(record.url)))
+                    await self.process_page(record.url, content)
+                except Exception as e:
+                    await self.stats.increment("error_count")
+                    self.logger.exception(f"Error replaying {record.url}: {e}")
+
+        self.workers = [asyncio.create_task(consume()) for _ in range(worker_count)]
+        try:
+            for path in files:
+                records = iter_warc_responses(path)
+                while self.is_running:
+                    batch = await asyncio.to_thread(self._read_replay_batch, records, read_batch)
+                    if not batch:
+                        break
+                    await self.stats.add_total_urls(len(batch))
+                    for record in batch:
+                        await pages.put(record)
+                if not self.is_running:
+                    break
+        finally:
+            for _ in self.workers:
+                await pages.put(None)
+            await asyncio.gather(*self.workers, return_exceptions=True)
+        self.logger.info("WARC replay finished")
+
+    @staticmethod
+    def _read_replay_batch(records: Iterator[WarcRecord], size: int) -> List[WarcRecord]:
+        batch = []
+        for record in records:
+            if record.status == 200 and is_valid_mime_type(record.headers.get('content-type', 'text/html')):
+                batch.append(record)
+                if len(batch) >= size:
+                    break
+        return batch
+
+    async def _parse_or_reuse(self, content: str, final_url: str):
+        """
+        Берёт результат разбора у ранее обработанной такой же (или похожей)
+        страницы, если она есть в ContentDedup, иначе разбирает страницу.
+        В ContentDedup хранятся ссылки как они записаны в HTML: то же тело
+        встречается по другим адресам (другой снимок, другой путь), поэтому
+        ссылки каждый раз разрешаются относительно final_url.
+        """
+        if self.dedup is None:
+            return await self._parse(content, final_url)
+
+        fp = self.dedup.fingerprint(content)
+        kind, result = self.dedup.lookup(fp)
+        if result is not None:
+            await self.stats.increment(f"dedup_{kind}_hits")
+            if self.dedup.avg_parse_time:
+                await self.stats.increment("dedup_parse_ms_saved", int(self.dedup.avg_parse_time * 1000))
+            if self.logger.isEnabledFor(logging.DEBUG):
+                self.logger.debug(f"Reusing parse result for {kind} duplicate {final_url}")
+        else:
+            started = time.perf_counter()
+            result = await self._scan(content, final_url)
+            self.dedup.add(fp, result, time.perf_counter() - started)
 
+        matches, hrefs = result
+        urls = self.parser.resolve(hrefs, final_url)
+        await self._count_filter_hits(self.parser.take_filter_hits())
+        return matches, urls
+
+    async def _parse(self, content: str, final_url: str):
+        """
+        Разбирает страницу в пуле процессов, если он настроен, иначе в event loop.
+        """
+        started = time.perf_counter()
+        if self.parse_pool is not None:
+            result = await self.parse_pool.parse(content, final_url)
+            hits = self.parse_pool.take_filter_hits()
+        else:
+            result = self.parser.parse(content, final_url)
+            hits = self.parser.take_filter_hits()
+        self.parse_seconds.observe(time.perf_counter() - started)
+        await self._count_filter_hits(hits)
+        return result
+
+    async def _scan(self, content: str, final_url: str):
+        """
+        Parser.scan в пуле процессов или в event loop: совпадения и неразрешённые ссылки.
+        """
+        started = time.perf_counter()
+        if self.parse_pool is not None:
+            result = await self.parse_pool.scan(content, final_url)
+        else:
+            result = self.parser.scan(content, final_url)
+        self.parse_seconds.observe(time.perf_counter() - started)
+        return result
+
+    async def _count_filter_hits(self, hits: Dict[str, int]):
+        # Сколько ссылок отсеяло каждое правило UrlFilter
+        for rule, count in hits.items():
+            await self.stats.increment(f"url_filter_{rule}", count)
 
     # crawler/scheduler.py
     async def shutdown(self):  # <-- Добавьте этот метод
         """
-        Корректное завершение работы планировщика.
+        Корректное завершение работы планировщика. Обработчик сигналов
+        запускает его отдельной задачей; повторный вызов ждёт, пока первый
+        не закончит (см. stopped).
         """
         if not self.is_running:
+            await self.stopped.wait()
             return
-        
+
         self.is_running = False
+        try:
+            await self._shutdown()
+        finally:
+            self.stopped.set()
+
+    async def _shutdown(self):
         logging.info("Shutting down scheduler...")
+
+        if self.bootstrap_task is not None and not self.bootstrap_task.done():
+            self.bootstrap_task.cancel()
         
-        # Отправляем poison-pill каждому воркеру
-        for _ in range(self.scheduler_cfg.max_concurrent):
-            await self.queue.put(PrioritizedItem(priority=100, depth=0, url=self.poison_pill))
+        # Закрываем очередь: ожидающие воркеры получают None и завершаются
+        await self.queue.close()
         
         # Ожидаем завершения задач
         await asyncio.gather(*self.workers, return_exceptions=True)
+
+        # Ссылки для других шардов отправляются владельцам, а пришедшие
+        # от них записываются в дисковую часть очереди
+        if self.router is not None:
+            await self.router.close(self.enqueue_url)
+        await self.queue.close_store()
         
         # Выводим статистику
         total_snapshots = self.storage.stats.total_snapshots
@@ -189,6 +423,9 @@ class Scheduler:
             for domain in failed_domains:
                 logging.info(f" - {domain}")
         
-        # Закрываем соединения
+        # Закрываем соединения и пул разбора
         await self.fetcher.close()
+        if self.parse_pool is not None:
+            await self.parse_pool.close()
         await self.storage.persist_matches()
+        self.storage.close()
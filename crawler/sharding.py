@@ -0,0 +1,280 @@
+# crawler/sharding.py
+"""
+Многопроцессный режим обхода (main.py --shards N).
+
+Запускается N процессов-шардов, у каждого свой event loop, Fetcher,
+Parser и каталог состояния (cache/shard-<i>: посещённые URL, кэш
+страниц, очередь). URL принадлежит шарду по хэшу хоста исходной
+страницы (для снимков Wayback — хоста внутри /web/<ts>/...), поэтому
+все URL одного сайта обходит один процесс и множества посещённых
+не пересекаются. Найденные ссылки чужих шардов пачками уходят
+владельцу через multiprocessing-очереди.
+
+Совпадения все шарды пишут в общий results_dir (имена сегментов
+содержат pid), а итоговую статистику каждый шард отправляет
+родительскому процессу, который её суммирует.
+"""
+import os
+import copy
+import math
+import queue
+import signal
+import asyncio
+import hashlib
+import logging
+import threading
+import multiprocessing
+from collections import Counter
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+from .utils import host_of, unwrap_wayback
+
+# (url, priority, depth)
+RoutedUrl = Tuple[str, int, int]
+
+def shard_of_host(host: str, shards: int) -> int:
+    """
+    Номер шарда для хоста. blake2b, а не hash(): результат должен
+    совпадать во всех процессах и между запусками.
+    """
+    digest = hashlib.blake2b(host.lower().encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big') % shards
+
+def shard_of(url: str, shards: int) -> int:
+    return shard_of_host(host_of(unwrap_wayback(url)), shards)
+
+def _shard_path(path: str, shard_id: int) -> str:
+    root, ext = os.path.splitext(path)
+    return f"{root}.shard-{shard_id}{ext}"
+
+def shard_config(cfg, shard_id: int, shards: int):
+    """
+    Копия конфигурации для одного шарда: свои каталоги состояния
+    и доля общих лимитов.
+
+    Все снимки загружаются с хоста архива, какому бы шарду они ни
+    принадлежали, поэтому интервал к архиву умножается на число шардов,
+    а окно одновременных запросов делится между ними. Разбор страниц
+    идёт в самих шардах (parser.workers = 0): процессов и так N.
+    """
+    cfg = copy.deepcopy(cfg)
+    cfg.cache_dir = os.path.join(cfg.cache_dir, f"shard-{shard_id}")
+    cfg.storage.cache_dir = os.path.join(cfg.storage.cache_dir, f"shard-{shard_id}")
+    if cfg.scheduler.frontier_path:
+        cfg.scheduler.frontier_path = _shard_path(cfg.scheduler.frontier_path, shard_id)
+    cfg.log.path = _shard_path(cfg.log.path, shard_id)
+    cfg.warc.prefix = f"{cfg.warc.prefix}-s{shard_id}"
+    cfg.metrics.port += shard_id
+    if cfg.tracing.trace_file:
+        cfg.tracing.trace_file = _shard_path(cfg.tracing.trace_file, shard_id)
+
+    archive_host = host_of(cfg.cdx.wayback_base)
+    intervals = {h.lower(): v for h, v in cfg.fetch.host_rate_limits.items()}
+    intervals[archive_host] = intervals.get(archive_host, cfg.fetch.rate_limit) * shards
+    cfg.fetch.host_rate_limits = intervals
+    cfg.fetch.pool_size = max(1, math.ceil(cfg.fetch.pool_size / shards))
+
+    conc = cfg.concurrency
+    conc.max_window = max(conc.min_window, math.ceil(conc.max_window / shards))
+    conc.initial_window = min(max(conc.min_window, math.ceil(conc.initial_window / shards)), conc.max_window)
+    cfg.scheduler.max_concurrent = max(1, math.ceil(cfg.scheduler.max_concurrent / shards))
+    cfg.max_concurrent = cfg.scheduler.max_concurrent
+    cfg.parser.workers = 0
+    return cfg
+
+class ShardRouter:
+    """
+    Связь шарда с остальными: определяет владельца URL, копит ссылки
+    для чужих шардов и отправляет их пачками (batch_size штук или
+    раз в flush_interval секунд), а входящие пачки передаёт в on_url.
+
+    inboxes — по одной multiprocessing-очереди на шард; шард читает
+    только свою, пишет во все остальные. barrier — общий для всех шардов
+    multiprocessing.Barrier, через который они синхронно завершаются.
+    """
+
+    # Сколько ждать остальные шарды при завершении (сек)
+    SHUTDOWN_TIMEOUT = 30
+
+    def __init__(self, shard_id: int, shards: int, inboxes: List, reports=None, barrier=None,
+                 batch_size: int = 500, flush_interval: float = 0.5):
+        self.shard_id = shard_id
+        self.shards = shards
+        self.inboxes = inboxes
+        self.reports = reports
+        self.barrier = barrier
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.logger = logging.getLogger("ShardRouter")
+
+        self.sent = 0
+        self.received = 0
+        self._outbox: Dict[int, List[RoutedUrl]] = {i: [] for i in range(shards) if i != shard_id}
+        self._stopping = threading.Event()
+        self._tasks: List[asyncio.Task] = []
+
+    def owner(self, url: str) -> int:
+        return shard_of(url, self.shards)
+
+    def owns(self, url: str) -> bool:
+        return self.owner(url) == self.shard_id
+
+    def owns_domain(self, domain: str) -> bool:
+        """
+        CDX-домены делятся между шардами так же, как хосты.
+        """
+        return shard_of_host(domain, self.shards) == self.shard_id
+
+    def send(self, url: str, priority: int, depth: int):
+        owner = self.owner(url)
+        batch = self._outbox[owner]
+        batch.append((url, priority, depth))
+        if len(batch) >= self.batch_size:
+            self._flush_to(owner)
+
+    def _flush_to(self, owner: int):
+        batch, self._outbox[owner] = self._outbox[owner], []
+        if batch:
+            # put не блокирует: пачку передаёт в канал фоновый поток очереди
+            self.inboxes[owner].put(batch)
+            self.sent += len(batch)
+
+    def flush(self):
+        for owner in self._outbox:
+            self._flush_to(owner)
+
+    def start(self, on_url: Callable[[str, int, int], Awaitable[None]]):
+        self._tasks = [
+            asyncio.create_task(self._receive_loop(on_url)),
+            asyncio.create_task(self._flush_loop())
+        ]
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            self.flush()
+
+    def _get_batch(self) -> Optional[List[RoutedUrl]]:
+        # Короткий таймаут, чтобы поток чтения замечал остановку
+        while not self._stopping.is_set():
+            try:
+                return self.inboxes[self.shard_id].get(timeout=0.5)
+            except queue.Empty:
+                continue
+        return None
+
+    async def _receive_loop(self, on_url: Callable[[str, int, int], Awaitable[None]]):
+        while True:
+            batch = await asyncio.to_thread(self._get_batch)
+            if batch is None:
+                return
+            await self._deliver(batch, on_url)
+
+    async def _deliver(self, batch: List[RoutedUrl], on_url: Callable[[str, int, int], Awaitable[None]]):
+        self.received += len(batch)
+        for url, priority, depth in batch:
+            await on_url(url, priority, depth)
+
+    async def close(self, on_url: Callable[[str, int, int], Awaitable[None]]):
+        """
+        Останавливает приём, отправляет накопленные ссылки и, дождавшись
+        того же от остальных шардов (barrier), передаёт в on_url всё,
+        что успело прийти. Шард, не дошедший до barrier за SHUTDOWN_TIMEOUT
+        секунд, не задерживает остальных; ссылки, отправленные ему после
+        его остановки, теряются.
+        """
+        self._stopping.set()
+        receiver, flusher = self._tasks or (None, None)
+        if flusher is not None:
+            flusher.cancel()
+            # Поток чтения не прерывается: он либо вернёт уже взятую
+            # из очереди пачку, либо заметит остановку по таймауту
+            await asyncio.gather(receiver, flusher, return_exceptions=True)
+        self._tasks = []
+        self.flush()
+
+        if self.barrier is not None:
+            try:
+                await asyncio.to_thread(self.barrier.wait, self.SHUTDOWN_TIMEOUT)
+            except threading.BrokenBarrierError:
+                self.logger.warning(f"Shard {self.shard_id}: not all shards reached shutdown barrier")
+
+        # Фоновые потоки очередей других шардов могут ещё дописывать
+        # последние пачки, поэтому чтение идёт с коротким ожиданием
+        inbox = self.inboxes[self.shard_id]
+        while True:
+            try:
+                batch = await asyncio.to_thread(inbox.get, True, 0.5)
+            except queue.Empty:
+                break
+            await self._deliver(batch, on_url)
+
+        # Не ждать при выходе процесса, пока остановившиеся шарды прочитают очередь
+        for i, q in enumerate(self.inboxes):
+            if i != self.shard_id:
+                q.cancel_join_thread()
+        self.logger.info(f"Shard {self.shard_id}: sent {self.sent} URLs to other shards, received {self.received}")
+
+    def report(self, snapshot: Dict[str, float], failed_domains: List[str]):
+        """
+        Отправляет итоговую статистику шарда родительскому процессу.
+        """
+        if self.reports is not None:
+            self.reports.put({
+                'shard': self.shard_id,
+                'stats': snapshot,
+                'failed_domains': failed_domains
+            })
+
+def merge_reports(reports: List[Dict]) -> Tuple[Dict[str, float], List[str]]:
+    """
+    Суммирует счётчики шардов и объединяет списки проблемных доменов.
+    """
+    totals: Counter = Counter()
+    failed = set()
+    for report in reports:
+        totals.update(report['stats'])
+        failed.update(report['failed_domains'])
+    return dict(totals), sorted(failed)
+
+def run_shards(target: Callable, args, shards: int) -> Tuple[Dict[str, float], List[str]]:
+    """
+    Запускает shards процессов target(args, shard_id, shards, inboxes, reports, barrier)
+    и ждёт их итоговую статистику. SIGINT/SIGTERM родителя передаются шардам
+    как SIGTERM, и они завершаются штатно (с сохранением очереди).
+    """
+    ctx = multiprocessing.get_context('spawn')
+    inboxes = [ctx.Queue() for _ in range(shards)]
+    reports = ctx.Queue()
+    barrier = ctx.Barrier(shards)
+    processes = [
+        ctx.Process(target=target, args=(args, i, shards, inboxes, reports, barrier), name=f"shard-{i}")
+        for i in range(shards)
+    ]
+    for process in processes:
+        process.start()
+
+    def _stop(signum, frame):
+        logging.info(f"Received signal {signum}, stopping {shards} shards...")
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+
+    for signame in ('SIGINT', 'SIGTERM'):
+        signal.signal(getattr(signal, signame), _stop)
+
+    collected: List[Dict] = []
+    while len(collected) < shards:
+        try:
+            collected.append(reports.get(timeout=1.0))
+        except queue.Empty:
+            if not any(process.is_alive() for process in processes):
+                break
+    for process in processes:
+        process.join()
+
+    for process in processes:
+        if process.exitcode:
+            logging.error(f"{process.name} exited with code {process.exitcode}")
+    for q in inboxes:
+        q.cancel_join_thread()
+    return merge_reports(collected)
@@ -3,16 +3,24 @@ import asyncio
 import signal
 import logging
 
+# Ссылки на запущенные задачи завершения: без них задачу может собрать сборщик мусора
+_shutdown_tasks = set()
+
+def _start_shutdown(shutdown_callback):
+    task = asyncio.create_task(shutdown_callback())
+    _shutdown_tasks.add(task)
+    task.add_done_callback(_shutdown_tasks.discard)
+
 def setup_signal_handlers(shutdown_callback):
     loop = asyncio.get_event_loop()
 
     def _handler(signame):
         logging.info(f"Received {signame}, initiating shutdown...")
-        asyncio.create_task(shutdown_callback())
+        _start_shutdown(shutdown_callback)
 
     for signame in ('SIGINT', 'SIGTERM'):
         try:
             loop.add_signal_handler(getattr(signal, signame), lambda: _handler(signame))
         except NotImplementedError:
             # Windows fallback
-            signal.signal(getattr(signal, signame), lambda s, f: asyncio.create_task(shutdown_callback()))
+            signal.signal(getattr(signal, signame), lambda s, f: _start_shutdown(shutdown_callback))
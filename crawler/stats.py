@@ -1,68 +1,106 @@
 # crawler/stats.py
-import asyncio
+import re
 from collections import defaultdict
 from typing import Dict, List, Set
 import logging
+from .metrics import MetricsRegistry
+
+_METRIC_NAME_RE = re.compile(r'[^a-zA-Z0-9_]')
 
 class Stats:
+    """
+    Счётчики и показатели обхода.
+
+    Все изменения выполняются в потоке event loop и не содержат await
+    внутри, поэтому блокировка не нужна. Асинхронный интерфейс сохранён
+    для совместимости с вызывающим кодом. Счётчики и показатели
+    экспортируются в metrics (jtk_<имя>_total и jtk_<имя>) вместе
+    с гистограммами и метриками с метками, которые модули регистрируют
+    в metrics сами.
+    """
+
     def __init__(self):
-        self._lock = asyncio.Lock()
         self._counters: Dict[str, int] = defaultdict(int)
+        self._gauges: Dict[str, float] = {}
         self.total_snapshots: int = 0
         self.new_snapshots: int = 0
         self.failed_domains: Set[str] = set()
         self.total_urls: int = 0  # общее число URL для обработки
+        self.metrics = MetricsRegistry()
+        self.metrics.add_collector(self._render_metrics)
 
     async def get_progress(self) -> float:
         """
         Возвращает процент обработанных URL: processed_urls / total_urls * 100
         """
-        async with self._lock:
-            processed = self._counters.get("processed_urls", 0)
-            if self.total_urls:
-                return processed / self.total_urls * 100
-            return 0.0
+        processed = self._counters.get("processed_urls", 0)
+        if self.total_urls:
+            return processed / self.total_urls * 100
+        return 0.0
 
     async def add_snapshots(self, total: int, new: int):
-        async with self._lock:
-            self.total_snapshots += total
-            self.new_snapshots += new
+        self.total_snapshots += total
+        self.new_snapshots += new
 
     async def add_failed_domain(self, domain: str):
-        async with self._lock:
-            self.failed_domains.add(domain)
+        self.failed_domains.add(domain)
 
     async def get_failed_domains(self) -> List[str]:
-        async with self._lock:
-            return sorted(self.failed_domains)
+        return sorted(self.failed_domains)
 
     async def increment(self, key: str, amount: int = 1):
-        async with self._lock:
-            self._counters[key] += amount
+        self._counters[key] += amount
+
+    async def set_gauge(self, key: str, value: float):
+        """
+        Устанавливает текущее значение показателя (например, окна одновременных запросов).
+        """
+        self._gauges[key] = value
+
+    async def get_gauge(self, key: str) -> float:
+        return self._gauges.get(key, 0)
 
     async def get(self, key: str) -> int:
-        async with self._lock:
-            return self._counters.get(key, 0)
+        return self._counters.get(key, 0)
 
     async def set_total_urls(self, total: int):
         """
-        Асинхронно устанавливает общее количество URL, ожидающих обработки.
+        Устанавливает общее количество URL, ожидающих обработки.
+        """
+        self.total_urls = total
+
+    async def add_total_urls(self, count: int):
+        """
+        Увеличивает общее число URL по мере потоковой загрузки семян.
         """
-        async with self._lock:
-            self.total_urls = total
+        self.total_urls += count
 
     async def get_total_urls(self) -> int:
         """Возвращает общее число URL для обработки."""
-        async with self._lock:
-            return self.total_urls
+        return self.total_urls
 
     async def snapshot(self) -> Dict[str, int]:
-        async with self._lock:
-            # Формируем снимок всех счетчиков и метрик
-            snapshot = dict(self._counters)
-            snapshot.update({
-                'total_snapshots': self.total_snapshots,
-                'new_snapshots': self.new_snapshots,
-                'total_urls': self.total_urls
-            })
-            return snapshot
+        # Формируем снимок всех счетчиков и метрик
+        snapshot = dict(self._counters)
+        snapshot.update(self._gauges)
+        snapshot.update({
+            'total_snapshots': self.total_snapshots,
+            'new_snapshots': self.new_snapshots,
+            'total_urls': self.total_urls
+        })
+        return snapshot
+
+    def _render_metrics(self) -> List[str]:
+        namespace = self.metrics.namespace
+        counters = dict(self._counters)
+        counters.update(snapshots=self.total_snapshots, new_snapshots=self.new_snapshots)
+        gauges = dict(self._gauges)
+        gauges.update(total_urls=self.total_urls, failed_domains=len(self.failed_domains))
+
+        lines: List[str] = []
+        for kind, values, suffix in (('counter', counters, '_total'), ('gauge', gauges, '')):
+            for key, value in sorted(values.items()):
+                name = f"{namespace}_{_METRIC_NAME_RE.sub('_', key)}{suffix}"
+                lines.append(f"# TYPE {name} {kind}")
+                lines.append(f"{name} {value}")
+        return lines
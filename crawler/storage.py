@@ -1,10 +1,9 @@
-from collections import defaultdict, deque
-from typing import List, Deque, Optional, Set, DefaultDict
-from pybloom_live import BloomFilter
+from typing import List, Optional
+from .visited import VisitedStore
+from .page_store import PageStore
+from .results import ResultsWriter
 import os
 import json
-import time
-import hashlib
 import asyncio
 
 class Storage:
@@ -15,95 +14,129 @@ class Storage:
         self.bloom_capacity = cfg.bloom_capacity
         self.bloom_error_rate = cfg.bloom_error_rate
         self.cache_ttl_days = cfg.cache_ttl_days
-        self.matches: DefaultDict[str, List[str]] = defaultdict(list)
-        self.cache_queue: Deque[str] = deque(maxlen=cfg.bloom_capacity)
         self.visited_lock = asyncio.Lock()
-        self.lock = asyncio.Lock()
-        
-        self.bloom = BloomFilter(capacity=self.bloom_capacity, 
-                               error_rate=self.bloom_error_rate)
         
         if not os.path.exists(self.cache_dir):
             os.makedirs(self.cache_dir)
         
-        # Очередь для кэширования старых записей
-        self.cache_queue = deque(maxlen=self.bloom_capacity)
-        
+        # Персистентное множество посещённых URL: снимок + журнал изменений
+        self.visited = VisitedStore(
+            path=os.path.join(self.cache_dir, 'visited'),
+            capacity=self.bloom_capacity,
+            error_rate=self.bloom_error_rate,
+            checkpoint_interval=cfg.auto_save_interval
+        )
+
+        # Хэши содержимого (CDX digest) снимков, уже поставленных в очередь
+        self.digests = VisitedStore(
+            path=os.path.join(self.cache_dir, 'cdx_digests'),
+            capacity=self.bloom_capacity,
+            error_rate=self.bloom_error_rate,
+            checkpoint_interval=cfg.auto_save_interval
+        )
+
+        # Сжатый кэш загруженных страниц, к нему обращается Fetcher
+        self.pages = PageStore(
+            root=os.path.join(self.cache_dir, 'pages'),
+            ttl_days=self.cache_ttl_days,
+            max_bytes=cfg.page_cache_max_mb * 1024 * 1024,
+            sweep_interval=cfg.page_cache_sweep_interval
+        )
+
+        # Совпадения пишутся пачками в JSONL-сегменты, а не копятся в памяти
+        self.results = ResultsWriter(
+            directory=cfg.results_dir,
+            batch_size=cfg.batch_size,
+            flush_interval=cfg.auto_save_interval,
+            segment_size=cfg.results_segment_mb * 1024 * 1024
+        )
+
+    def start(self):
+        """
+        Запускает фоновые задачи хранилища: очистку кэша страниц (если
+        кэш включён, storage.page_cache) и периодический сброс результатов
+        (нужен работающий event loop).
+        """
+        if self.cfg.page_cache:
+            self.pages.start()
+        self.results.start()
+
     async def save_matches(self, url: str, keywords: List[str]):
-        async with self.lock:
-            self.matches[url].extend(keywords)
+        await self.results.add(url, keywords)
 
     def is_visited(self, url: str) -> bool:
         """
         Проверяет, был ли URL уже посещён с помощью Bloom filter.
         """
-        return url in self.bloom
+        return url in self.visited
 
     def add_visited(self, url: str):
         """
         Добавляет URL в список посещённых.
+        Стоимость не зависит от размера обхода: URL дописывается в журнал,
+        а снимок фильтра перезаписывается раз в auto_save_interval секунд.
         """
-        if not self.is_visited(url):
-            self.bloom.add(url)
-            self.cache_queue.append(url)
-            self._save_bloom_filter()
+        self.visited.add(url)
 
-    def _save_bloom_filter(self):
+    def add_digest(self, digest: str) -> bool:
         """
-        Сохраняет Bloom filter в файл.
+        Запоминает хэш содержимого снимка из CDX. Возвращает False, если
+        снимок с таким содержимым уже встречался. Неизвестный хэш ("-")
+        всегда считается новым.
         """
-        with open(os.path.join(self.cache_dir, 'bloom_filter.json'), 'w') as f:
-            json.dump([url for url in self.cache_queue], f)
+        if not digest or digest == '-':
+            return True
+        return self.digests.add(digest)
 
-    def load_bloom_filter(self):
+    def save_bloom_filter(self):
         """
-        Загружает Bloom filter из файла, если он существует.
+        Принудительно сохраняет снимок Bloom filter и очищает журнал.
         """
-        bloom_filter_file = os.path.join(self.cache_dir, 'bloom_filter.json')
-        if os.path.exists(bloom_filter_file):
-            with open(bloom_filter_file, 'r') as f:
-                visited_urls = json.load(f)
-                for url in visited_urls:
-                    self.bloom.add(url)
-        
-    def is_cache_valid(self, cache_file: str) -> bool:
+        self.visited.checkpoint()
+        self.digests.checkpoint()
+
+    def load_bloom_filter(self):
         """
-        Проверяет, действителен ли кэш. Если срок действия истёк, то кэш удаляется.
+        Загружает Bloom filter из снимка и журнала, если они существуют.
+        Старый формат (bloom_filter.json со списком URL) импортируется один раз.
         """
-        if not os.path.exists(cache_file):
-            return False
-        file_age = time.time() - os.path.getmtime(cache_file)
-        if file_age > self.cache_ttl_days * 86400:  # 86400 секунд в день
-            os.remove(cache_file)
-            return False
-        return True
+        self.visited.load()
+        self.digests.load()
 
+        legacy_file = os.path.join(self.cache_dir, 'bloom_filter.json')
+        if os.path.exists(legacy_file):
+            with open(legacy_file, 'r') as f:
+                for url in json.load(f):
+                    self.visited.add(url)
+            self.visited.checkpoint()
+            os.remove(legacy_file)
+        
     def get_from_cache(self, url: str) -> Optional[str]:
         """
-        Получает контент из кэша, если он ещё действителен.
+        Получает контент из кэша страниц, если он ещё действителен.
+        Блокирующий вызов; в event loop используйте pages.get().
         """
-        cache_file = self._get_cache_filename(url)
-        if self.is_cache_valid(cache_file):
-            with open(cache_file, 'r') as f:
-                return f.read()
-        return None
+        cached = self.pages.get_sync(url)
+        return cached[0] if cached else None
 
     def save_to_cache(self, url: str, content: str):
         """
-        Сохраняет контент в кэш.
+        Сохраняет контент в кэш страниц.
+        Блокирующий вызов; в event loop используйте pages.put().
         """
-        cache_file = self._get_cache_filename(url)
-        with open(cache_file, 'w') as f:
-            f.write(content)
+        self.pages.put_sync(url, content)
 
-    def _get_cache_filename(self, url: str) -> str:
+    async def persist_matches(self):
         """
-        Генерирует имя файла для кэширования контента URL.
+        Дописывает на диск оставшиеся в буфере совпадения и закрывает сегмент.
         """
-        hash_url = hashlib.sha256(url.encode()).hexdigest()
-        return os.path.join(self.cache_dir, f"{hash_url}.html")
-    
-    async def persist_matches(self):
-        with open("results.json", "w") as f:
-            json.dump(dict(self.matches), f)
+        await self.results.close()
+
+    def close(self):
+        """
+        Сохраняет состояние посещённых URL и кэша страниц перед завершением работы.
+        """
+        self.visited.close()
+        self.digests.close()
+        self.pages.close()
     
\ No newline at end of file
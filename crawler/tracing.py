@@ -0,0 +1,268 @@
+# crawler/tracing.py
+"""
+Трассировка этапов обработки URL, контроль задержки event loop
+и сэмплирующий профилировщик.
+
+  - Tracer: Scheduler открывает трассу на каждый URL, этапы отмечаются
+    через span('имя') в любом месте конвейера (трасса текущей задачи
+    берётся из contextvars). Длительности всех этапов идут в гистограмму
+    jtk_stage_duration_seconds{stage}, а разбивка по этапам для доли
+    sample_rate URL пишется строкой JSON в trace_file. DNS, соединение
+    и ожидание заголовков отмечаются хуками aiohttp (trace_config()).
+  - LoopLagMonitor: насколько позже запланированного просыпается
+    периодическая задача, то есть как долго event loop был занят.
+  - SamplingProfiler: фоновый поток снимает стек потока event loop
+    profile_hz раз в секунду и пишет профиль в формате «collapsed stacks»
+    (flamegraph.pl, speedscope, inferno). Запускается по SIGUSR1
+    или периодически по конфигурации, без перезапуска обхода.
+"""
+import os
+import sys
+import json
+import time
+import random
+import signal
+import asyncio
+import logging
+import threading
+import contextlib
+import contextvars
+from collections import Counter
+from typing import Dict, List, Optional
+import aiohttp
+
+_current: contextvars.ContextVar[Optional["Trace"]] = contextvars.ContextVar('jtk_trace', default=None)
+_NULL_SPAN = contextlib.nullcontext()
+
+class Trace:
+    """
+    Длительности этапов обработки одного URL.
+    """
+    __slots__ = ('url', 'sampled', 'started', 'stages')
+
+    def __init__(self, url: str, sampled: bool):
+        self.url = url
+        self.sampled = sampled
+        self.started = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+
+    def add(self, stage: str, seconds: float):
+        # Этап может повторяться (повторы запроса) — время суммируется
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+class _Span:
+    __slots__ = ('trace', 'stage', 'started')
+
+    def __init__(self, trace: Trace, stage: str):
+        self.trace = trace
+        self.stage = stage
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.trace.add(self.stage, time.perf_counter() - self.started)
+        return False
+
+def span(stage: str):
+    """
+    Отмечает этап текущей трассы; без трассы ничего не делает.
+    """
+    trace = _current.get()
+    if trace is None:
+        return _NULL_SPAN
+    return _Span(trace, stage)
+
+def current_trace() -> Optional[Trace]:
+    return _current.get()
+
+class Tracer:
+    def __init__(self, metrics, trace_file: str = '', sample_rate: float = 0.01):
+        self.trace_file = trace_file
+        self.sample_rate = sample_rate
+        self.logger = logging.getLogger("Tracer")
+        self.stage_seconds = metrics.histogram(
+            'stage_duration_seconds', 'Duration of crawl pipeline stages per URL', ('stage',),
+            buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0))
+        self._file = None
+        if trace_file and sample_rate > 0:
+            directory = os.path.dirname(trace_file)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._file = open(trace_file, 'a', encoding='utf-8')
+
+    @contextlib.contextmanager
+    def trace(self, url: str):
+        """
+        Открывает трассу URL для текущей задачи на время блока.
+        """
+        trace = Trace(url, self._file is not None and random.random() < self.sample_rate)
+        token = _current.set(trace)
+        try:
+            yield trace
+        finally:
+            _current.reset(token)
+            self._finish(trace)
+
+    def _finish(self, trace: Trace):
+        total = time.perf_counter() - trace.started
+        observe = self.stage_seconds.observe
+        for stage, seconds in trace.stages.items():
+            observe(seconds, stage)
+        observe(total, 'total')
+        if trace.sampled:
+            record = {'url': trace.url, 'ts': time.time(), 'total_ms': round(total * 1000, 3)}
+            record.update({stage: round(seconds * 1000, 3) for stage, seconds in trace.stages.items()})
+            self._file.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+    def trace_config(self) -> aiohttp.TraceConfig:
+        """
+        Хуки aiohttp: dns, connect (включая TLS) и request — от начала
+        запроса до получения заголовков ответа (включая dns и connect).
+        """
+        config = aiohttp.TraceConfig()
+
+        async def start(name, session, ctx, params):
+            setattr(ctx, name, time.perf_counter())
+
+        async def end(name, session, ctx, params):
+            trace = _current.get()
+            started = getattr(ctx, name, None)
+            if trace is not None and started is not None:
+                trace.add(name, time.perf_counter() - started)
+
+        def hooks(name):
+            return (lambda *a: start(name, *a)), (lambda *a: end(name, *a))
+
+        for name, (on_start, on_end) in (
+            ('dns', (config.on_dns_resolvehost_start, config.on_dns_resolvehost_end)),
+            ('connect', (config.on_connection_create_start, config.on_connection_create_end)),
+            ('request', (config.on_request_start, config.on_request_end)),
+        ):
+            start_hook, end_hook = hooks(name)
+            on_start.append(start_hook)
+            on_end.append(end_hook)
+        return config
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+class LoopLagMonitor:
+    """
+    Раз в interval секунд измеряет, на сколько позже срока проснулась задача.
+    """
+
+    def __init__(self, metrics, interval: float = 0.5, warn_threshold: float = 0.25):
+        self.interval = interval
+        self.warn_threshold = warn_threshold
+        self.logger = logging.getLogger("LoopLagMonitor")
+        self.lag = metrics.gauge('event_loop_lag_seconds', 'Last measured event loop lag')
+        self.lag_max = metrics.gauge('event_loop_lag_max_seconds', 'Maximum event loop lag since start')
+        self.lag_seconds = metrics.histogram(
+            'event_loop_lag_distribution_seconds', 'Event loop lag measurements',
+            buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0))
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            expected = time.perf_counter() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, time.perf_counter() - expected)
+            self.lag.set(lag)
+            self.lag_seconds.observe(lag)
+            if lag > self.lag_max.get():
+                self.lag_max.set(lag)
+            if lag >= self.warn_threshold:
+                self.logger.warning(f"Event loop blocked for {lag * 1000:.0f} ms")
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+class SamplingProfiler:
+    """
+    Сэмплирующий профилировщик потока event loop.
+
+    Пока идёт запись, фоновый поток каждые 1/hz секунды читает стек
+    профилируемого потока через sys._current_frames() и считает
+    одинаковые стеки. Результат — файл <output_dir>/profile-<время>.folded,
+    строки вида «модуль:функция;модуль:функция N». Процессы ParsePool
+    не профилируются.
+    """
+
+    def __init__(self, output_dir: str = 'profiles', hz: int = 100, duration: float = 30):
+        self.output_dir = output_dir
+        self.hz = hz
+        self.duration = duration
+        self.logger = logging.getLogger("SamplingProfiler")
+        self._thread: Optional[threading.Thread] = None
+        self._target_id = threading.get_ident()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def trigger(self):
+        """
+        Начинает запись на duration секунд (если она ещё не идёт).
+        """
+        if self.running:
+            self.logger.info("Profiler is already running")
+            return
+        self._target_id = threading.get_ident()
+        self._thread = threading.Thread(target=self._run, name="SamplingProfiler", daemon=True)
+        self._thread.start()
+
+    def install_signal(self, signame: str = 'SIGUSR1'):
+        """
+        Запуск записи по сигналу (kill -USR1 <pid>); вызывать из event loop.
+        """
+        signum = getattr(signal, signame, None)
+        if signum is None:
+            return
+        try:
+            asyncio.get_running_loop().add_signal_handler(signum, self.trigger)
+        except (NotImplementedError, RuntimeError):
+            pass
+
+    async def run_periodically(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            self.trigger()
+
+    @staticmethod
+    def _collapse(frame) -> str:
+        names: List[str] = []
+        while frame is not None:
+            code = frame.f_code
+            module = os.path.splitext(os.path.basename(code.co_filename))[0]
+            names.append(f"{module}:{code.co_name}")
+            frame = frame.f_back
+        return ';'.join(reversed(names))
+
+    def _run(self):
+        stacks: Counter = Counter()
+        period = 1.0 / self.hz
+        deadline = time.monotonic() + self.duration
+        self.logger.info(f"Profiling for {self.duration:.0f}s at {self.hz} Hz")
+        while time.monotonic() < deadline:
+            frame = sys._current_frames().get(self._target_id)
+            if frame is not None:
+                stacks[self._collapse(frame)] += 1
+            del frame
+            time.sleep(period)
+
+        os.makedirs(self.output_dir, exist_ok=True)
+        path = os.path.join(self.output_dir, f"profile-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}.folded")
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        self.logger.info(f"Profile with {sum(stacks.values())} samples written to {path}")
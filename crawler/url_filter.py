@@ -0,0 +1,97 @@
+# crawler/url_filter.py
+import re
+import logging
+from collections import Counter
+from typing import Dict, List, Optional, Sequence
+from .utils import host_of, match_domain, unwrap_wayback
+
+SCOPE_RULE = 'out_of_scope'
+
+class UrlFilter:
+    """
+    Отсев ссылок до постановки в очередь.
+
+    Все регулярные выражения из url_filters.txt собираются в одно выражение
+    с именованными группами (?P<r0>...)|(?P<r1>...)|..., поэтому каждая ссылка
+    проверяется одним проходом, а match.lastgroup говорит, какое правило
+    сработало. Для снимков Wayback проверяется исходный URL.
+
+    Дополнительное правило области обхода: если заданы домены (семена
+    и домены CDX), ссылки на другие хосты отбрасываются.
+
+    Срабатывания считаются в hits по имени правила; take_hits() забирает
+    накопленные значения (в том числе из процессов ParsePool).
+    """
+
+    def __init__(self, patterns: Sequence[str] = (), scope_domains: Sequence[str] = ()):
+        self.patterns = list(patterns)
+        self.scope_domains = sorted({d.lower() for d in scope_domains if d}, key=len, reverse=True)
+        self.logger = logging.getLogger("UrlFilter")
+        self.hits: Counter = Counter()
+
+        self.rule_names: Dict[str, str] = {}
+        alternatives = []
+        for i, pattern in enumerate(self.patterns):
+            try:
+                re.compile(pattern)
+            except re.error as e:
+                self.logger.error(f"Skipping invalid URL filter {pattern!r}: {e}")
+                continue
+            group = f"r{i}"
+            self.rule_names[group] = self._rule_name(pattern, i)
+            alternatives.append(f"(?P<{group}>{pattern})")
+        self.regex: Optional[re.Pattern] = re.compile('|'.join(alternatives), re.IGNORECASE) if alternatives else None
+
+    @classmethod
+    def from_file(cls, path: str, scope_domains: Sequence[str] = ()) -> "UrlFilter":
+        """
+        Читает правила по одному на строку; пустые строки и строки,
+        начинающиеся с «# » (комментарии), пропускаются.
+        """
+        patterns: List[str] = []
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    line = line.strip()
+                    if not line or line.startswith('# ') or line == '#':
+                        continue
+                    patterns.append(line)
+        except FileNotFoundError:
+            logging.getLogger("UrlFilter").warning(f"URL filters file {path} not found, only scope rule applies")
+        return cls(patterns, scope_domains)
+
+    def _rule_name(self, pattern: str, index: int) -> str:
+        name = re.sub(r'\W+', '_', pattern).strip('_')[:40] or f"rule_{index}"
+        taken = set(self.rule_names.values())
+        base, n = name, 1
+        while name in taken:
+            n += 1
+            name = f"{base}_{n}"
+        return name
+
+    def check(self, url: str) -> Optional[str]:
+        """
+        Возвращает имя сработавшего правила или None, если ссылку нужно оставить.
+        """
+        original = unwrap_wayback(url)
+        if self.regex is not None:
+            m = self.regex.search(original)
+            if m:
+                return self.rule_names[m.lastgroup]
+        if self.scope_domains and not match_domain(host_of(original), self.scope_domains):
+            return SCOPE_RULE
+        return None
+
+    def filter(self, urls: List[str]) -> List[str]:
+        kept: List[str] = []
+        for url in urls:
+            rule = self.check(url)
+            if rule is None:
+                kept.append(url)
+            else:
+                self.hits[rule] += 1
+        return kept
+
+    def take_hits(self) -> Dict[str, int]:
+        hits, self.hits = dict(self.hits), Counter()
+        return hits
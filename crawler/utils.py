@@ -1,6 +1,12 @@
+import re
+import codecs
 import hashlib
 import mimetypes
 import random
+import time
+from email.utils import parsedate_to_datetime
+from typing import Optional
+from urllib.parse import urlsplit, urlunsplit
 
 def sha256_hash(url: str) -> str:
     """
@@ -10,12 +16,33 @@ def sha256_hash(url: str) -> str:
 
 def is_valid_mime_type(content_type: str) -> bool:
     """
-    Проверяет, является ли MIME-тип допустимым для обработки (например, text/html).
+    Проверяет, является ли MIME-тип допустимым для обработки (text/html или XHTML).
     """
-    valid_mime_types = ['text/html']
-    mime_type = content_type.split(';')[0].strip()  # Убираем параметры, если они есть
+    valid_mime_types = ['text/html', 'application/xhtml+xml']
+    mime_type = content_type.split(';')[0].strip().lower()  # Убираем параметры, если они есть
     return mime_type in valid_mime_types
 
+# Сигнатуры двоичных форматов, которые встречаются под видом страниц:
+# PDF, ZIP, gzip, bzip2, RAR, 7z, PNG, JPEG, GIF, исполняемые файлы,
+# Flash, документы MS Office, аудио и видео
+BINARY_SIGNATURES = (
+    b'%PDF-', b'PK\x03\x04', b'\x1f\x8b', b'BZh', b'Rar!', b'7z\xbc\xaf', b'\x89PNG',
+    b'\xff\xd8\xff', b'GIF8', b'MZ', b'\x7fELF', b'FWS', b'CWS', b'\xd0\xcf\x11\xe0',
+    b'ID3', b'OggS', b'RIFF', b'\x00\x00\x01\xba',
+)
+
+# Сколько байт начала тела нужно для решения looks_binary
+BINARY_SNIFF_BYTES = 1024
+
+def looks_binary(head: bytes) -> bool:
+    """
+    Похоже ли начало тела на двоичный файл: известная сигнатура
+    или нулевой байт в первом килобайте (кроме текста в UTF-16 с BOM).
+    """
+    if head.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        return False
+    return head.startswith(BINARY_SIGNATURES) or b'\x00' in head[:BINARY_SNIFF_BYTES]
+
 def generate_filename_from_url(url: str) -> str:
     """
     Генерирует имя файла для URL с использованием SHA-256 хэша.
@@ -24,3 +51,106 @@ def generate_filename_from_url(url: str) -> str:
 
 def rotate_user_agent(user_agents: list) -> str:
     return random.choice(user_agents) if user_agents else ""
+
+# Адрес снимков Wayback Machine; configure_wayback() заменяет его,
+# например на локальный стенд из benchmarks
+WAYBACK_BASE = "http://web.archive.org/web"
+
+def _wayback_url_re(base: str) -> re.Pattern:
+    parts = urlsplit(base)
+    prefix = re.escape(parts.netloc) + re.escape(parts.path.rstrip('/'))
+    return re.compile(rf'^https?://{prefix}/(\d+)([a-z]{{2}}_)?/(.+)$', re.IGNORECASE)
+
+WAYBACK_URL_RE = _wayback_url_re(WAYBACK_BASE)
+
+def configure_wayback(base: str):
+    """
+    Задаёт адрес снимков (cdx.wayback_base) для unwrap_wayback и canonicalize_url.
+    Вызывается при запуске каждого процесса, до разбора URL.
+    """
+    global WAYBACK_BASE, WAYBACK_URL_RE
+    WAYBACK_BASE = base.rstrip('/')
+    WAYBACK_URL_RE = _wayback_url_re(WAYBACK_BASE)
+_SCHEME_PREFIX_RE = re.compile(r'^(https?):/*', re.IGNORECASE)
+_DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+def unwrap_wayback(url: str) -> str:
+    """
+    Возвращает исходный URL для снимка Wayback Machine или сам URL, если это не снимок.
+    """
+    m = WAYBACK_URL_RE.match(url)
+    if not m:
+        return url
+    # urljoin схлопывает "http://" внутри пути снимка в "http:/"
+    original = _SCHEME_PREFIX_RE.sub(lambda p: p.group(1).lower() + '://', m.group(3), count=1)
+    if '://' not in original:
+        original = 'http://' + original
+    return original
+
+def canonicalize_url(url: str) -> str:
+    """
+    Приводит URL к каноническому виду перед проверкой на посещённость:
+      - схема и хост в нижнем регистре, порт по умолчанию убирается;
+      - фрагмент (#...) отбрасывается, пустой путь заменяется на "/";
+      - параметры запроса сортируются (их кодирование не меняется);
+      - снимки Wayback (http/https, любой модификатор вроде if_/im_ или без него)
+        сводятся к <WAYBACK_BASE>/<timestamp>id_/<канонический исходный URL>.
+    """
+    m = WAYBACK_URL_RE.match(url)
+    if m:
+        return f"{WAYBACK_BASE}/{m.group(1)}id_/{canonicalize_url(unwrap_wayback(url))}"
+
+    try:
+        parts = urlsplit(url.strip())
+        port = parts.port
+    except ValueError:
+        return url
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or '').lower()
+    if not host:
+        return urlunsplit((scheme, parts.netloc, parts.path, parts.query, ''))
+
+    netloc = host
+    if parts.username is not None:
+        userinfo = parts.username + (f":{parts.password}" if parts.password is not None else '')
+        netloc = f"{userinfo}@{host}"
+    if port is not None and port != _DEFAULT_PORTS.get(scheme):
+        netloc += f":{port}"
+    if ':' in host:  # IPv6
+        netloc = netloc.replace(host, f"[{host}]", 1)
+
+    query = '&'.join(sorted(p for p in parts.query.split('&') if p))
+    return urlunsplit((scheme, netloc, parts.path or '/', query, ''))
+
+def host_of(url: str) -> str:
+    """
+    Хост URL в нижнем регистре (пустая строка, если хоста нет).
+    """
+    try:
+        return (urlsplit(url).hostname or '').lower()
+    except ValueError:
+        return ''
+
+def match_domain(host: str, domains) -> str:
+    """
+    Возвращает домен из списка, которому принадлежит хост (сам домен или поддомен),
+    либо пустую строку.
+    """
+    for domain in domains:
+        if host == domain or host.endswith('.' + domain):
+            return domain
+    return ''
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """
+    Разбирает заголовок Retry-After (секунды или HTTP-дата) в число секунд ожидания.
+    """
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError, IndexError, OverflowError):
+        return None
@@ -0,0 +1,186 @@
+# crawler/visited.py
+import os
+import mmap
+import time
+import struct
+import logging
+from typing import List, Optional
+from bitarray import bitarray
+from pybloom_live import BloomFilter
+
+class VisitedStore:
+    """
+    Персистентное множество посещённых URL на основе Bloom filter.
+
+    На диске хранятся два файла:
+      - <path>.bloom — снимок битового массива фильтра (заголовок + биты);
+      - <path>.delta — журнал URL, добавленных после последнего снимка.
+
+    Каждое добавление дописывает одну строку в журнал, а полная перезапись
+    снимка (компакция) выполняется не чаще, чем раз в checkpoint_interval
+    секунд. При старте снимок читается через mmap, после чего
+    проигрывается только короткий журнал.
+
+    Фильтр масштабируемый: когда текущий Bloom filter заполнен до своей
+    ёмкости, добавляется новый — в growth раз больше и с вероятностью
+    ложного срабатывания в tightening раз ниже. Первый фильтр создаётся
+    с error_rate * (1 - tightening), поэтому суммарная вероятность
+    ложного срабатывания по всем фильтрам не превышает error_rate.
+    """
+
+    MAGIC = b'JTKV'
+    VERSION = 1
+    HEADER_FMT = '<4sHI'   # magic, версия, число фильтров
+    FILTER_FMT = '<dQQQQQ' # error_rate, num_slices, bits_per_slice, capacity, count, размер в байтах
+
+    def __init__(self, path: str, capacity: int, error_rate: float,
+                 checkpoint_interval: float = 300, growth: int = 2, tightening: float = 0.5):
+        self.path = path
+        self.snapshot_path = f"{path}.bloom"
+        self.delta_path = f"{path}.delta"
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.checkpoint_interval = checkpoint_interval
+        self.growth = growth
+        self.tightening = tightening
+        self.logger = logging.getLogger("VisitedStore")
+
+        self.filters: List[BloomFilter] = [
+            BloomFilter(capacity=capacity, error_rate=error_rate * (1 - tightening))
+        ]
+        self._delta = None
+        self._last_checkpoint = time.monotonic()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def __contains__(self, url: str) -> bool:
+        # Новые фильтры крупнее и чаще содержат недавние URL — проверяем их первыми
+        for bf in reversed(self.filters):
+            if url in bf:
+                return True
+        return False
+
+    def __len__(self) -> int:
+        return sum(bf.count for bf in self.filters)
+
+    def _insert(self, url: str):
+        bf = self.filters[-1]
+        if bf.count >= bf.capacity:
+            bf = BloomFilter(
+                capacity=bf.capacity * self.growth,
+                error_rate=bf.error_rate * self.tightening
+            )
+            self.filters.append(bf)
+            self.logger.info(
+                f"Visited set grew to {len(self.filters)} filters "
+                f"(new capacity {bf.capacity}, error rate {bf.error_rate:.2e})"
+            )
+        bf.add(url, skip_check=True)
+
+    def add(self, url: str) -> bool:
+        """
+        Добавляет URL в фильтр и журнал. Возвращает False, если URL уже был.
+        """
+        if url in self:
+            return False
+        self._insert(url)
+        self._open_delta().write(url + '\n')
+
+        if time.monotonic() - self._last_checkpoint >= self.checkpoint_interval:
+            self.checkpoint()
+        return True
+
+    def _open_delta(self):
+        if self._delta is None:
+            self._delta = open(self.delta_path, 'a', encoding='utf-8')
+        return self._delta
+
+    def load(self) -> int:
+        """
+        Восстанавливает фильтр из снимка (через mmap) и журнала.
+        Возвращает число элементов после загрузки.
+        """
+        started = time.perf_counter()
+        if os.path.exists(self.snapshot_path) and os.path.getsize(self.snapshot_path) > 0:
+            filters = self._read_snapshot(self.snapshot_path)
+            if filters:
+                self.filters = filters
+
+        replayed = 0
+        if os.path.exists(self.delta_path):
+            with open(self.delta_path, 'r', encoding='utf-8', errors='replace') as f:
+                for line in f:
+                    url = line.rstrip('\n')
+                    if url and url not in self:
+                        self._insert(url)
+                        replayed += 1
+
+        elapsed = (time.perf_counter() - started) * 1000
+        count = len(self)
+        self.logger.info(
+            f"Visited set loaded: {count} URLs in {len(self.filters)} filters "
+            f"({replayed} from delta log) in {elapsed:.1f} ms"
+        )
+        return count
+
+    def checkpoint(self):
+        """
+        Компакция: атомарно записывает снимок фильтра и обнуляет журнал.
+        """
+        tmp_path = self.snapshot_path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            self._write_snapshot(f, self.filters)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.snapshot_path)
+
+        # Журнал больше не нужен: всё его содержимое уже в снимке
+        if self._delta is not None:
+            self._delta.close()
+            self._delta = None
+        open(self.delta_path, 'w').close()
+        self._last_checkpoint = time.monotonic()
+
+    def flush(self):
+        if self._delta is not None:
+            self._delta.flush()
+
+    def close(self):
+        self.checkpoint()
+
+    def _write_snapshot(self, f, filters: List[BloomFilter]):
+        f.write(struct.pack(self.HEADER_FMT, self.MAGIC, self.VERSION, len(filters)))
+        for bf in filters:
+            data = bf.bitarray.tobytes()
+            f.write(struct.pack(
+                self.FILTER_FMT, bf.error_rate, bf.num_slices,
+                bf.bits_per_slice, bf.capacity, bf.count, len(data)
+            ))
+            f.write(data)
+
+    def _read_snapshot(self, path: str) -> Optional[List[BloomFilter]]:
+        with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            magic, version, count = struct.unpack_from(self.HEADER_FMT, mm, 0)
+            if magic != self.MAGIC or version != self.VERSION:
+                self.logger.error(f"Unsupported visited snapshot format in {path}")
+                return None
+
+            offset = struct.calcsize(self.HEADER_FMT)
+            filter_size = struct.calcsize(self.FILTER_FMT)
+            filters: List[BloomFilter] = []
+            for _ in range(count):
+                error_rate, num_slices, bits_per_slice, capacity, n, size = \
+                    struct.unpack_from(self.FILTER_FMT, mm, offset)
+                offset += filter_size
+
+                bf = BloomFilter.__new__(BloomFilter)
+                bf._setup(error_rate, num_slices, bits_per_slice, capacity, n)
+                bits = bitarray(endian='little')
+                bits.frombytes(mm[offset:offset + size])
+                del bits[bf.num_bits:]
+                bf.bitarray = bits
+                offset += size
+                filters.append(bf)
+            return filters
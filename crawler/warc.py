@@ -0,0 +1,219 @@
+# crawler/warc.py
+"""
+Запись и чтение WARC-файлов (WARC/1.1).
+
+Каждая запись сжимается отдельным gzip-членом, поэтому файл .warc.gz
+читается как обычный gzip и совместим с warcio, pywb и прочими
+инструментами. Писатель переходит на новый файл, когда текущий
+превышает max_file_size.
+"""
+import os
+import io
+import gzip
+import time
+import uuid
+import base64
+import asyncio
+import hashlib
+import logging
+import threading
+from datetime import datetime, timezone
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+from .encoding import CharsetDecoder
+
+WARC_VERSION = b'WARC/1.1'
+
+# Для decode_body без своего декодера: без кэша по хостам
+_default_decoder = CharsetDecoder(cache_size=0)
+
+# aiohttp отдаёт тело уже без сжатия и chunked-кодирования,
+# поэтому соответствующие заголовки ответа в запись не переносятся
+_DROPPED_HEADERS = {'content-encoding', 'transfer-encoding', 'content-length'}
+
+class WarcRecord(NamedTuple):
+    url: str
+    date: str
+    status: int
+    headers: Dict[str, str]   # HTTP-заголовки ответа, имена в нижнем регистре
+    body: bytes
+
+def _warc_date() -> str:
+    return datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+def _sha1_digest(data: bytes) -> str:
+    return 'sha1:' + base64.b32encode(hashlib.sha1(data).digest()).decode('ascii')
+
+def _build_record(warc_type: str, headers: List[Tuple[str, str]], block: bytes) -> bytes:
+    lines = [WARC_VERSION]
+    lines.append(f"WARC-Type: {warc_type}".encode())
+    lines.append(f"WARC-Record-ID: <urn:uuid:{uuid.uuid4()}>".encode())
+    for name, value in headers:
+        lines.append(f"{name}: {value}".encode('utf-8'))
+    lines.append(f"Content-Length: {len(block)}".encode())
+    return b'\r\n'.join(lines) + b'\r\n\r\n' + block + b'\r\n\r\n'
+
+class WarcWriter:
+    """
+    Потокобезопасный писатель WARC с ротацией файлов
+    <directory>/<prefix>-<время>-<номер>.warc.gz.
+    """
+
+    def __init__(self, directory: str, prefix: str = 'jtk', max_file_size: int = 1024 ** 3,
+                 compress_level: int = 6):
+        self.directory = directory
+        self.prefix = prefix
+        self.max_file_size = max_file_size
+        self.compress_level = compress_level
+        self.logger = logging.getLogger("WarcWriter")
+
+        self._file = None
+        self._path: Optional[str] = None
+        self._serial = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _open_next(self):
+        self._close_file()
+        self._serial += 1
+        stamp = time.strftime('%Y%m%d%H%M%S', time.gmtime())
+        self._path = os.path.join(self.directory, f"{self.prefix}-{stamp}-{self._serial:05d}.warc.gz")
+        self._file = open(self._path, 'wb')
+        info = b"software: JTK crawler\r\nformat: WARC File Format 1.1\r\n"
+        self._write(_build_record('warcinfo', [
+            ('WARC-Date', _warc_date()),
+            ('WARC-Filename', os.path.basename(self._path)),
+            ('Content-Type', 'application/warc-fields'),
+        ], info))
+        self.logger.info(f"Writing WARC records to {self._path}")
+
+    def _write(self, record: bytes):
+        self._file.write(gzip.compress(record, self.compress_level))
+
+    def write_response(self, url: str, status: int, reason: str, http_version: str,
+                       headers: Iterable[Tuple[str, str]], body: bytes, truncated: bool = False):
+        """
+        Добавляет запись response: HTTP-статус, заголовки и тело ответа.
+        truncated — тело обрезано по размеру (WARC-Truncated: length).
+        """
+        head = [f"HTTP/{http_version} {status} {reason or ''}".rstrip()]
+        for name, value in headers:
+            if name.lower() not in _DROPPED_HEADERS:
+                head.append(f"{name}: {value}")
+        head.append(f"Content-Length: {len(body)}")
+        block = ('\r\n'.join(head) + '\r\n\r\n').encode('utf-8', 'replace') + body
+
+        fields = [
+            ('WARC-Date', _warc_date()),
+            ('WARC-Target-URI', url),
+            ('WARC-Payload-Digest', _sha1_digest(body)),
+            ('Content-Type', 'application/http;msgtype=response'),
+        ]
+        if truncated:
+            fields.append(('WARC-Truncated', 'length'))
+        record = _build_record('response', fields, block)
+
+        with self._lock:
+            if self._file is None or self._file.tell() >= self.max_file_size:
+                self._open_next()
+            self._write(record)
+
+    async def write_response_async(self, *args):
+        await asyncio.to_thread(self.write_response, *args)
+
+    def _close_file(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def close(self):
+        with self._lock:
+            self._close_file()
+
+def _read_headers(stream) -> Optional[Tuple[bytes, Dict[str, str]]]:
+    """
+    Читает стартовую строку и заголовки до пустой строки.
+    """
+    first = stream.readline()
+    while first in (b'\r\n', b'\n'):
+        first = stream.readline()
+    if not first:
+        return None
+    headers: Dict[str, str] = {}
+    for line in iter(stream.readline, b''):
+        line = line.rstrip(b'\r\n')
+        if not line:
+            break
+        name, _, value = line.decode('utf-8', 'replace').partition(':')
+        headers[name.strip().lower()] = value.strip()
+    return first.rstrip(b'\r\n'), headers
+
+def _parse_http_response(block: bytes) -> Optional[Tuple[int, Dict[str, str], bytes]]:
+    stream = io.BytesIO(block)
+    parsed = _read_headers(stream)
+    if parsed is None:
+        return None
+    status_line, headers = parsed
+    parts = status_line.split(None, 2)
+    if len(parts) < 2 or not parts[0].startswith(b'HTTP/'):
+        return None
+    try:
+        status = int(parts[1])
+    except ValueError:
+        return None
+    return status, headers, stream.read()
+
+def iter_warc_responses(path: str) -> Iterator[WarcRecord]:
+    """
+    Потоково читает записи response из .warc или .warc.gz (в том числе
+    с одним gzip-членом на запись). Остальные типы записей пропускаются.
+    """
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rb') as stream:
+        while True:
+            parsed = _read_headers(stream)
+            if parsed is None:
+                return
+            version, headers = parsed
+            if not version.startswith(b'WARC/'):
+                raise ValueError(f"{path}: not a WARC record: {version[:40]!r}")
+            length = int(headers.get('content-length', 0))
+            block = stream.read(length)
+            if len(block) < length:
+                return  # файл обрезан при аварийном завершении
+
+            if headers.get('warc-type') != 'response':
+                continue
+            response = _parse_http_response(block)
+            if response is None:
+                continue
+            status, http_headers, body = response
+            yield WarcRecord(
+                url=headers.get('warc-target-uri', '').strip('<>'),
+                date=headers.get('warc-date', ''),
+                status=status,
+                headers=http_headers,
+                body=body
+            )
+
+def find_warc_files(paths: Iterable[str]) -> List[str]:
+    """
+    Разворачивает каталоги в отсортированный список .warc/.warc.gz файлов.
+    """
+    files: List[str] = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, names in os.walk(path):
+                files.extend(
+                    os.path.join(root, name) for name in names
+                    if name.endswith('.warc') or name.endswith('.warc.gz')
+                )
+        else:
+            files.append(path)
+    return sorted(files)
+
+def decode_body(body: bytes, content_type: str, decoder: Optional[CharsetDecoder] = None, host: str = '') -> str:
+    """
+    Декодирует тело так же, как Fetcher: BOM, charset из Content-Type,
+    <meta>, кэш кодировки хоста, детектор (см. crawler/encoding.py).
+    """
+    return (decoder or _default_decoder).decode(body, content_type, host).text
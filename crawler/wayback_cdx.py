@@ -1,10 +1,28 @@
 # crawler/wayback_cdx.py
 import aiohttp
 import asyncio
+import hashlib
 import logging
+from contextlib import asynccontextmanager, nullcontext
 from urllib.parse import quote
-from typing import List, Optional
+from typing import AsyncIterator, Awaitable, Callable, Iterator, List, NamedTuple, Optional, Set, Tuple
 from datetime import datetime
+from .congestion import RequestSlot
+from .utils import canonicalize_url, parse_retry_after
+
+class CDXRecord(NamedTuple):
+    urlkey: str
+    timestamp: str
+    original: str
+    statuscode: str
+    mimetype: str
+    digest: str = "-"   # content hash (SHA-1, base32); "-" when unknown
+
+# Field list requested in line-oriented (text) mode, in CDXRecord order
+RECORD_FIELDS = ",".join(CDXRecord._fields)
+
+class InvalidCDXResponse(ValueError):
+    """A 200 response whose body is not a CDX listing (e.g. an HTML error page)."""
 
 class WaybackCDXClient:
     def __init__(
@@ -14,14 +32,22 @@ class WaybackCDXClient:
         backoff_factor: float = 2.0,
         request_timeout: int = 30,
         max_pages: int = 100,
-        page_size: int = 5000
+        page_size: int = 5000,
+        limiter=None,
+        collapse: str = "urlkey",
+        base_url: str = "https://web.archive.org/cdx/search/cdx",
+        wayback_base: str = "http://web.archive.org/web"
     ):
         self.session = session
+        self.limiter = limiter        # shared AdaptiveLimiter, optional
         self.max_retries = max_retries
         self.backoff_factor = backoff_factor
         self.request_timeout = request_timeout
         self.max_pages = max_pages    # 0 = no limit on pages
         self.page_size = page_size    # number of URLs per request
+        self.collapse = collapse      # CDX collapse field ("urlkey", "digest"); "" = none
+        self.base_url = base_url
+        self.wayback_base = wayback_base.rstrip('/')
         self.logger = logging.getLogger("CDXClient")
 
     async def fetch_snapshots(
@@ -30,107 +56,262 @@ class WaybackCDXClient:
         from_date: str = "20040101000000",
         to_date: str = "20041231235959"
     ) -> List[str]:
-        base_url = "https://web.archive.org/cdx/search/cdx"
         results: List[str] = []
+        try:
+            async for records in self.iter_snapshot_pages(domain, from_date, to_date):
+                results.extend(self.build_url(record) for record in records)
+        except Exception as e:
+            self.logger.error(f"Failed to fetch CDX for {domain}: {str(e)}")
+            return []
+
+        self.logger.info(f"Fetched {len(results)} snapshots for domain {domain}")
+        return results
+
+    async def iter_snapshot_pages(
+        self,
+        domain: str,
+        from_date: str = "20040101000000",
+        to_date: str = "20041231235959",
+        resume_key: Optional[str] = None,
+        on_resume_key: Optional[Callable[[Optional[str]], None]] = None
+    ) -> AsyncIterator[List[CDXRecord]]:
+        """
+        Yields CDX records page by page as CDX pages arrive, following
+        Resume-Key until exhausted or max_pages is reached. Records already
+        yielded for this domain are skipped.
+
+        Pagination can start from a saved resume_key; on_resume_key is called
+        after every page with the key of the next one (None when done).
+        A page that is still not valid JSON after retries raises InvalidCDXResponse,
+        so an unfinished listing is never mistaken for a complete one.
+        """
+        params = self._build_params(domain, from_date, to_date)
+        params["output"] = "json"
+        params["fl"] = RECORD_FIELDS
+        if resume_key:
+            params["resumeKey"] = resume_key
+        seen: Set[int] = set()
+        page = 0
+
+        while True:
+            data, resume_key = await self._fetch_page(domain, params)
+            page += 1
+
+            records = []
+            for record in self._process_cdx_response(data):
+                key = self._dedup_key(record)
+                if key not in seen:
+                    seen.add(key)
+                    records.append(record)
+            if records:
+                yield records
+
+            # Pagination: follow Resume-Key until no more or page limit reached
+            if not resume_key or (self.max_pages > 0 and page >= self.max_pages):
+                resume_key = None
+            if on_resume_key is not None:
+                on_resume_key(resume_key)
+            if not resume_key:
+                break
+            params["resumeKey"] = resume_key
+
+    async def stream_snapshots(
+        self,
+        domain: str,
+        from_date: str = "20040101000000",
+        to_date: str = "20041231235959",
+        resume_key: Optional[str] = None,
+        on_resume_key: Optional[Callable[[Optional[str]], None]] = None
+    ) -> AsyncIterator[CDXRecord]:
+        """
+        Streaming variant of iter_snapshot_pages: requests line-oriented CDX
+        output and yields one CDXRecord per line while the body is still
+        being read, so no page is ever held in memory as a whole.
+
+        Duplicates are filtered with a set of 64-bit hashes of
+        (timestamp, original) instead of the full URL strings.
+        resume_key/on_resume_key work as in iter_snapshot_pages.
+        """
+        params = self._build_params(domain, from_date, to_date)
+        params["fl"] = RECORD_FIELDS
+        if resume_key:
+            params["resumeKey"] = resume_key
+        seen: Set[int] = set()
+        page = 0
+
+        while True:
+            resume_key = None
+            for attempt in range(self.max_retries + 1):
+                try:
+                    async with self._get(
+                        params,
+                        aiohttp.ClientTimeout(total=None, sock_read=self.request_timeout)
+                    ) as response:
+                        resume_key = response.headers.get("Resume-Key")
+
+                        # The resume key, if any, follows an empty line after the records
+                        trailer = False
+                        parsed = malformed = 0
+                        async for raw in response.content:
+                            line = raw.decode("utf-8", "replace").rstrip("\r\n")
+                            if trailer:
+                                resume_key = line.strip() or resume_key
+                                continue
+                            if not line:
+                                trailer = True
+                                continue
+
+                            record = self._parse_line(line)
+                            if record is None:
+                                malformed += 1
+                                continue
+                            parsed += 1
+                            key = self._dedup_key(record)
+                            if key in seen:
+                                continue
+                            seen.add(key)
+                            yield record
+
+                        # An error page served with status 200 (HTML, JSON) has no
+                        # CDX lines at all; it must not end pagination
+                        if malformed and not parsed:
+                            raise InvalidCDXResponse(f"Unexpected CDX response for {domain}: no CDX lines")
+                    break
+
+                except (aiohttp.ClientError, asyncio.TimeoutError, InvalidCDXResponse) as e:
+                    # A retried page is re-read from its start; rows already
+                    # yielded are dropped by the dedup set
+                    if attempt == self.max_retries:
+                        self.logger.debug(f"Params: {params}")
+                        raise
+                    delay = self.backoff_factor ** attempt
+                    self.logger.warning(f"Retry {attempt+1} for {domain} in {delay}s: {e}")
+                    await asyncio.sleep(delay)
+
+            page += 1
+            if not resume_key or (self.max_pages > 0 and page >= self.max_pages):
+                resume_key = None
+            if on_resume_key is not None:
+                on_resume_key(resume_key)
+            if not resume_key:
+                break
+            params["resumeKey"] = resume_key
+
+    def _build_params(self, domain: str, from_date: str, to_date: str) -> dict:
         params = {
             "url": f"{domain}/*",
             "matchType": "domain",
             "from": from_date,
             "to": to_date,
-            "output": "json",
-            "fl": "timestamp,original,statuscode,mimetype",
             "filter": ["statuscode:200", "mimetype:text/html"],
-            "collapse": "urlkey",
             "limit": self.page_size,
             "showResumeKey": "true",
         }
+        if self.collapse:
+            params["collapse"] = self.collapse
+        return params
 
-        try:
-            for attempt in range(self.max_retries + 1):
-                try:
-                    async with self.session.get(
-                        base_url,
-                        params=params,
-                        timeout=self.request_timeout
-                    ) as response:
-                        await self._handle_errors(response)
-
-                        try:
-                            data = await response.json(content_type=None)
-                            if not isinstance(data, list):
-                                raise ValueError(f"Non-list JSON response: {data}")
-                        except Exception as e:
-                            text = await response.text()
-                            self.logger.error(f"Invalid JSON response from CDX API for {domain}: {e}")
-                            self.logger.debug(f"Raw response: {text}")
-                            return []
-
-                        results.extend(self._process_cdx_response(data))
-
-                        # Pagination: follow Resume-Key until no more or page limit reached
-                        page = 1
-                        while "Resume-Key" in response.headers and (self.max_pages == 0 or page < self.max_pages):
-                            params["resumeKey"] = response.headers["Resume-Key"]
-                            async with self.session.get(
-                                base_url,
-                                params=params,
-                                timeout=self.request_timeout
-                            ) as paginated_response:
-                                await self._handle_errors(paginated_response)
-
-                                try:
-                                    data = await paginated_response.json(content_type=None)
-                                    if not isinstance(data, list):
-                                        raise ValueError(f"Non-list JSON response: {data}")
-                                except Exception as e:
-                                    text = await paginated_response.text()
-                                    self.logger.error(f"Invalid JSON response during pagination for {domain}: {e}")
-                                    self.logger.debug(f"Raw response: {text}")
-                                    break
-
-                                results.extend(self._process_cdx_response(data))
-                                page += 1
-
-                        # Deduplicate and apply optional total limit
-                        unique = list(dict.fromkeys(results))  # preserve order
-                        if self.max_pages > 0:
-                            unique = unique[: self.max_pages * self.page_size]
-
-                        self.logger.info(f"Fetched {len(unique)} snapshots for domain {domain}")
-                        return unique
-
-                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
-                    if attempt == self.max_retries:
-                        raise
-                    delay = self.backoff_factor ** attempt
-                    self.logger.warning(f"Retry {attempt+1} for {domain} in {delay}s")
-                    await asyncio.sleep(delay)
+    @staticmethod
+    def _parse_line(line: str) -> Optional[CDXRecord]:
+        fields = line.split()
+        if len(fields) != len(CDXRecord._fields):
+            return None
+        return CDXRecord(*fields)
 
-        except Exception as e:
-            self.logger.error(f"Failed to fetch CDX for {domain}: {str(e)}")
-            self.logger.debug(f"Params: {params}")
-            return []
+    @staticmethod
+    def _dedup_key(record: CDXRecord) -> int:
+        digest = hashlib.blake2b(
+            f"{record.timestamp} {record.original}".encode("utf-8", "surrogateescape"),
+            digest_size=8
+        ).digest()
+        return int.from_bytes(digest, "little")
+
+    def build_url(self, record: CDXRecord) -> str:
+        return self._build_wayback_url(record.timestamp, record.original)
+
+    async def _fetch_page(self, domain: str, params: dict) -> Tuple[list, Optional[str]]:
+        """
+        Fetches one CDX JSON page with retries. Returns (rows, resume_key);
+        a response that is not valid JSON is retried like a network error
+        and raises InvalidCDXResponse once retries are exhausted.
+        """
+        for attempt in range(self.max_retries + 1):
+            try:
+                async with self._get(
+                    params,
+                    aiohttp.ClientTimeout(total=self.request_timeout)
+                ) as response:
+
+                    try:
+                        data = await response.json(content_type=None)
+                        if not isinstance(data, list):
+                            raise ValueError(f"Non-list JSON response: {data}")
+                    except Exception as e:
+                        text = await response.text()
+                        self.logger.error(f"Invalid JSON response from CDX API for {domain}: {e}")
+                        self.logger.debug(f"Raw response: {text}")
+                        raise InvalidCDXResponse(f"Invalid JSON response from CDX API for {domain}") from e
 
-    def _process_cdx_response(self, data: list) -> List[str]:
+                    resume_key = response.headers.get("Resume-Key")
+                    # With output=json the key is also sent in the body: [..., [], ["<key>"]]
+                    if len(data) >= 2 and data[-2] == [] and len(data[-1]) == 1:
+                        resume_key = resume_key or data[-1][0]
+                        data = data[:-2]
+                    return data, resume_key
+
+            except (aiohttp.ClientError, asyncio.TimeoutError, InvalidCDXResponse) as e:
+                if attempt == self.max_retries:
+                    self.logger.debug(f"Params: {params}")
+                    raise
+                delay = self.backoff_factor ** attempt
+                self.logger.warning(f"Retry {attempt+1} for {domain} in {delay}s: {e}")
+                await asyncio.sleep(delay)
+        raise InvalidCDXResponse(f"No CDX response for {domain}")
+
+    def _process_cdx_response(self, data: list) -> List[CDXRecord]:
         if not data or len(data) < 2:
             return []
 
-        urls: List[str] = []
-        for entry in data[1:]:
-            if len(entry) >= 2:
-                timestamp, original = entry[0], entry[1]
-                urls.append(self._build_wayback_url(timestamp, original))
-        return urls
+        # The first row names the columns; map by name so older field lists still parse
+        header = data[0]
+        if not set(header) <= set(CDXRecord._fields):
+            header = CDXRecord._fields
+        width = len(header)
+        return [CDXRecord(**dict(zip(header, entry))) for entry in data[1:] if len(entry) == width]
 
     def _build_wayback_url(self, timestamp: str, original_url: str) -> str:
         encoded = quote(original_url, safe=":/")
-        return f"http://web.archive.org/web/{timestamp}id_/{encoded}"
+        return f"{self.wayback_base}/{timestamp}id_/{encoded}"
+
+    @asynccontextmanager
+    async def _get(self, params: dict, timeout: aiohttp.ClientTimeout):
+        """
+        GET to the CDX endpoint; raises on non-200.
+
+        The limiter slot covers the request up to the response headers
+        only. A CDX page can take minutes to read, and holding the slot
+        meanwhile would keep page fetches out of the shared window.
+        """
+        slot_cm = self.limiter.slot() if self.limiter is not None else nullcontext(RequestSlot())
+        async with slot_cm as slot:
+            response = await self.session.get(self.base_url, params=params, timeout=timeout)
+            try:
+                slot.record(response.status, parse_retry_after(response.headers.get("Retry-After")))
+                await self._handle_errors(response)
+            except BaseException:
+                response.release()
+                raise
+        async with response:
+            yield response
 
     async def _handle_errors(self, response: aiohttp.ClientResponse):
         if response.status == 429:
-            retry_after = int(response.headers.get("Retry-After", 60))
+            retry_after = parse_retry_after(response.headers.get("Retry-After")) or 60
             self.logger.warning(f"Rate limited. Retrying after {retry_after}s")
-            await asyncio.sleep(retry_after)
+            # With a shared limiter the pause applies to every request via
+            # Retry-After; without one only this coroutine waits
+            if self.limiter is None:
+                await asyncio.sleep(retry_after)
             raise aiohttp.ClientResponseError(
                 request_info=response.request_info,
                 history=response.history,
@@ -147,9 +328,13 @@ class WaybackCDXClient:
             )
 
 class CDXManager:
-    def __init__(self, cfg, storage):
+    def __init__(self, cfg, storage, limiter=None,
+                 owns_domain: Optional[Callable[[str], bool]] = None):
         self.cfg = cfg
         self.storage = storage
+        self.limiter = limiter
+        # In sharded mode each shard queries only the domains it owns
+        self.owns_domain = owns_domain
         self.client: Optional[WaybackCDXClient] = None
         self.logger = logging.getLogger("CDXManager")
 
@@ -160,47 +345,182 @@ class CDXManager:
             backoff_factor=self.cfg.backoff_factor,
             request_timeout=self.cfg.request_timeout,
             max_pages=self.cfg.max_pages,
-            page_size=self.cfg.page_size
+            page_size=self.cfg.page_size,
+            limiter=self.limiter,
+            collapse=self.cfg.collapse,
+            base_url=self.cfg.base_url,
+            wayback_base=self.cfg.wayback_base
         )
 
     async def get_seed_urls(self) -> List[str]:
+        all_urls: List[str] = []
+
+        async def collect(urls: List[str]):
+            all_urls.extend(urls)
+
+        await self.stream_seed_urls(collect)
+        return all_urls
+
+    async def stream_seed_urls(self, on_batch: Callable[[List[str]], Awaitable[None]]):
+        """
+        Queries up to max_parallel_domains domains at once and hands each
+        CDX page of new (unvisited) URLs to on_batch as soon as it arrives.
+        """
         if not self.client:
             raise RuntimeError("CDXClient not initialized")
 
         domains = self._load_domains()
         self.logger.info(f"Will bootstrap seeds for {len(domains)} domains")
 
-        all_urls: List[str] = []
-        for domain in domains:
-            try:
-                self.logger.info(f"Fetching CDX for {domain}")
-                urls = await self.client.fetch_snapshots(domain)
-                self.logger.info(f"  → raw snapshots: {len(urls)}")
+        semaphore = asyncio.Semaphore(self.cfg.max_parallel_domains)
+
+        async def run(domain: str):
+            async with semaphore:
+                await self._stream_domain(domain, on_batch)
+
+        await asyncio.gather(*(run(domain) for domain in domains))
 
-                filtered = await self._filter_new_urls(urls)
-                self.logger.info(f"  → new (unvisited): {len(filtered)}")
+    async def _stream_domain(self, domain: str, on_batch: Callable[[List[str]], Awaitable[None]]):
+        total = new = 0
+        try:
+            self.logger.info(f"Fetching CDX for {domain}")
+            async for records in self._iter_record_batches(domain):
+                filtered = await self._filter_new_records(records)
+                total += len(records)
+                new += len(filtered)
 
                 await self.storage.stats.add_snapshots(
-                    total=len(urls),
+                    total=len(records),
                     new=len(filtered)
                 )
+                if filtered:
+                    await on_batch(filtered)
 
-                all_urls.extend(filtered)
+            self.logger.info(f"  → {domain}: raw snapshots: {total}, new (unvisited): {new}")
 
-            except Exception as e:
-                self.logger.error(f"Failed to process domain {domain}: {str(e)}")
-                await self.storage.stats.add_failed_domain(domain)
-                continue
+        except Exception as e:
+            self.logger.error(f"Failed to process domain {domain}: {str(e)}")
+            await self.storage.stats.add_failed_domain(domain)
 
-        return all_urls
+    async def _iter_record_batches(self, domain: str) -> AsyncIterator[List[CDXRecord]]:
+        """
+        Yields CDX records in batches for one domain.
+
+        A fresh local index is read without touching the network. Otherwise
+        records come from the CDX API and are journaled into the local
+        index; an interrupted run first replays its journal and then
+        continues pagination from the saved resume key.
+
+        The index is finalized only when pagination really ended: the last
+        page had no resume key or max_pages was reached. A failed page
+        raises out of here and leaves the journal and key for the next run.
+        """
+        if not self.cfg.index_dir:
+            async for records in self._iter_network_batches(domain):
+                yield records
+            return
+
+        from .cdx_index import CDXIndex  # cdx_index imports CDXRecord from this module
+        # Indexes built with a different collapse mode hold different captures
+        tag = self.cfg.collapse if self.cfg.collapse != "urlkey" else ""
+        index = CDXIndex(self.cfg.index_dir, domain, self.cfg.from_date, self.cfg.to_date, tag=tag)
+
+        if index.is_fresh(self.cfg.index_ttl_days):
+            self.logger.info(f"Using local CDX index for {domain}")
+            for records in self._chunks(index.iter_records()):
+                yield records
+            return
+
+        resume_key = index.resume_key
+        if resume_key and index.has_journal:
+            self.logger.info(f"Resuming CDX pagination for {domain}")
+            for records in self._chunks(index.iter_journal()):
+                yield records
+        else:
+            index.reset()
+            resume_key = None
+
+        try:
+            async for records in self._iter_network_batches(domain, resume_key, index):
+                yield records
+        finally:
+            index.close()
+
+        await asyncio.to_thread(index.finalize)
+
+    async def _iter_network_batches(
+        self,
+        domain: str,
+        resume_key: Optional[str] = None,
+        index: Optional["CDXIndex"] = None
+    ) -> AsyncIterator[List[CDXRecord]]:
+        """
+        Yields records from the CDX API: whole JSON pages, or with cdx.stream
+        enabled, stream_batch records at a time from the line-oriented stream.
+        Every record is journaled into index before the page's resume key is
+        checkpointed, so a saved key never skips unsaved records.
+        """
+        on_resume_key = index.checkpoint if index is not None else None
+
+        if not self.cfg.stream:
+            async for records in self.client.iter_snapshot_pages(
+                domain, self.cfg.from_date, self.cfg.to_date, resume_key, on_resume_key
+            ):
+                if index is not None:
+                    index.append(records)
+                yield records
+            return
+
+        batch: List[CDXRecord] = []
+        async for record in self.client.stream_snapshots(
+            domain, self.cfg.from_date, self.cfg.to_date, resume_key, on_resume_key
+        ):
+            if index is not None:
+                index.append((record,))
+            batch.append(record)
+            if len(batch) >= self.cfg.stream_batch:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def _chunks(self, records: Iterator[CDXRecord]) -> Iterator[List[CDXRecord]]:
+        batch: List[CDXRecord] = []
+        for record in records:
+            batch.append(record)
+            if len(batch) >= self.cfg.stream_batch:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
 
     def _load_domains(self) -> List[str]:
         try:
             with open(self.cfg.target_domains_file, "r") as f:
-                return [line.strip() for line in f if line.strip()]
+                domains = [line.strip() for line in f if line.strip()]
         except FileNotFoundError:
             self.logger.error("Domains file not found")
             return []
+        if self.owns_domain is not None:
+            domains = [domain for domain in domains if self.owns_domain(domain)]
+        return domains
 
-    async def _filter_new_urls(self, urls: List[str]) -> List[str]:
-        return [url for url in urls if not self.storage.is_visited(url)]
+    async def _filter_new_records(self, records: List[CDXRecord]) -> List[str]:
+        """
+        Returns Wayback URLs of captures that are not visited yet and, with
+        cdx.dedup_digests, whose content digest has not been seen before —
+        unchanged captures are dropped before any request to the archive.
+        """
+        urls: List[str] = []
+        duplicates = 0
+        for record in records:
+            url = canonicalize_url(self.client.build_url(record))
+            if self.storage.is_visited(url):
+                continue
+            if self.cfg.dedup_digests and not self.storage.add_digest(record.digest):
+                duplicates += 1
+                continue
+            urls.append(url)
+        if duplicates:
+            await self.storage.stats.increment("cdx_digest_duplicates", duplicates)
+        return urls
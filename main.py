@@ -1,24 +1,73 @@
 import logging
 import asyncio
+import argparse
 from config import load_config
 from crawler.logger import init_logger
 from crawler.signals import setup_signal_handlers
 from crawler.scheduler import Scheduler
 from crawler.fetcher import Fetcher
 from crawler.parser import Parser
+from crawler.parse_pool import ParsePool
 from crawler.storage import Storage
 from crawler.stats import Stats
+from crawler.metrics import MetricsExporter
+from crawler.tracing import LoopLagMonitor, SamplingProfiler, Tracer
+from crawler.congestion import AdaptiveLimiter
+from crawler.warc import WarcWriter
+from crawler.dedup import ContentDedup
+from crawler.sharding import ShardRouter, run_shards, shard_config
+from crawler.utils import configure_wayback
 
-async def log_progress(stats: Stats):
+async def log_progress(stats: Stats, queue, interval: float = 10):
+    """
+    Периодическая сводка вместо строк о каждом URL: прогресс, скорость
+    за интервал, размер очереди, совпадения и ошибки.
+    """
+    previous = await stats.get("processed_urls")
     while True:
+        await asyncio.sleep(interval)
         progress = await stats.get_progress()
-        logging.info(f"[Progress] {progress:.2f}%")
-        await asyncio.sleep(10)
+        processed = await stats.get("processed_urls")
+        logging.info(
+            f"[Progress] {progress:.2f}% | {processed} URLs ({(processed - previous) / interval:.1f}/s) | "
+            f"queue {queue.qsize()} | matches {await stats.get('match_count')} | "
+            f"errors {await stats.get('error_count')} | failed fetches {await stats.get('fetch_failures')}"
+        )
+        previous = processed
 
-async def main():
+def scope_domains(cfg) -> list:
+    """
+    Домены, которыми ограничен обход: семена и домены для CDX.
+    """
+    domains = list(cfg.scheduler.seeds)
+    try:
+        with open(cfg.cdx.target_domains_file, 'r') as f:
+            domains.extend(line.strip() for line in f if line.strip())
+    except FileNotFoundError:
+        pass
+    return domains
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="JTK crawler")
+    parser.add_argument('--config', default='config.yaml', help="путь к config.yaml")
+    parser.add_argument('--replay', nargs='+', metavar='PATH',
+                        help="разобрать ответы из WARC-файлов или каталогов вместо обхода сети")
+    parser.add_argument('--shards', type=int, default=1, metavar='N',
+                        help="обходить в N процессах, разделив хосты между ними")
+    args = parser.parse_args()
+    if args.shards < 1:
+        parser.error("--shards must be >= 1")
+    if args.shards > 1 and args.replay:
+        parser.error("--shards cannot be combined with --replay")
+    return args
+
+async def main(args, router: ShardRouter = None):
     try:
         print("[1/5] Loading config...")
-        cfg = load_config('config.yaml')
+        cfg = load_config(args.config)
+        if router is not None:
+            cfg = shard_config(cfg, router.shard_id, router.shards)
+        configure_wayback(cfg.cdx.wayback_base)
         
         print("[2/5] Initializing logger...")
         init_logger(cfg.log)
@@ -26,36 +75,132 @@ async def main():
         print("[3/5] Creating core components...")
         stats = Stats()
         storage = Storage(cfg.storage, stats)
-        fetcher = Fetcher(cfg.fetch)
+        storage.load_bloom_filter()
+        storage.start()
+        limiter = None
+        if cfg.concurrency.enabled:
+            limiter = AdaptiveLimiter(
+                initial_window=cfg.concurrency.initial_window,
+                min_window=cfg.concurrency.min_window,
+                max_window=cfg.concurrency.max_window,
+                increase=cfg.concurrency.increase,
+                decrease=cfg.concurrency.decrease,
+                latency_spike=cfg.concurrency.latency_spike,
+                cooldown=cfg.concurrency.cooldown,
+                stats=stats
+            )
+        page_store = storage.pages if cfg.storage.page_cache else None
+        warc_writer = None
+        if cfg.warc.enabled and not args.replay:
+            warc_writer = WarcWriter(
+                cfg.warc.output_dir,
+                prefix=cfg.warc.prefix,
+                max_file_size=cfg.warc.max_file_size_mb * 1024 * 1024
+            )
+        tracer = None
+        if cfg.tracing.enabled:
+            tracer = Tracer(stats.metrics, cfg.tracing.trace_file, cfg.tracing.sample_rate)
+        fetcher = Fetcher(cfg.fetch, limiter, stats, page_store, warc_writer, tracer)
         
-        print("[4/5] Initializing fetcher session...")
-        await fetcher._ensure_session()
-        print(f"Fetcher session: {fetcher.session}")
+        if not args.replay:
+            print("[4/5] Initializing fetcher session...")
+            await fetcher._ensure_session()
+            print(f"Fetcher session: {fetcher.session}")
         
-        parser = Parser(cfg.parser)
+        parser = Parser(cfg.parser, scope_domains(cfg))
+        parse_pool = ParsePool(cfg.parser, parser)
+        dedup = None
+        if cfg.dedup.enabled:
+            dedup = ContentDedup(
+                max_entries=cfg.dedup.max_entries,
+                near_duplicates=cfg.dedup.near_duplicates,
+                near_distance=cfg.dedup.near_distance,
+                shingle_size=cfg.dedup.shingle_size
+            )
         
         print("[5/5] Starting scheduler...")
-        scheduler = Scheduler(cfg.scheduler, cfg.cdx, storage, fetcher, parser, stats)
+        scheduler = Scheduler(cfg.scheduler, cfg.cdx, storage, fetcher, parser, stats, parse_pool, dedup, router, tracer)
         setup_signal_handlers(scheduler.shutdown)
         
+        exporter = None
+        if cfg.metrics.enabled:
+            exporter = MetricsExporter(stats.metrics, cfg.metrics.host, cfg.metrics.port)
+            await exporter.start()
+
+        # Задержка event loop и профилировщик по SIGUSR1 / расписанию
+        lag_monitor = None
+        if cfg.tracing.loop_lag_interval > 0:
+            lag_monitor = LoopLagMonitor(stats.metrics, cfg.tracing.loop_lag_interval, cfg.tracing.loop_lag_warn)
+            lag_monitor.start()
+        profiler = SamplingProfiler(cfg.tracing.profile_dir, cfg.tracing.profile_hz, cfg.tracing.profile_duration)
+        profiler.install_signal()
+        profile_task = None
+        if cfg.tracing.profile_interval > 0:
+            profile_task = asyncio.create_task(profiler.run_periodically(cfg.tracing.profile_interval))
+
         # Запуск задачи прогресса
-        progress_task = asyncio.create_task(log_progress(stats))
+        progress_task = asyncio.create_task(log_progress(stats, scheduler.queue, cfg.log.summary_interval))
         
-        print("=== Starting crawler ===")
-        await scheduler.run()
+        if args.replay:
+            print("=== Replaying WARC files ===")
+            await scheduler.replay(args.replay)
+            await scheduler.shutdown()
+        else:
+            print("=== Starting crawler ===")
+            await scheduler.run()
         
         # Остановка задачи прогресса
         progress_task.cancel()
-        await asyncio.sleep(1)
+        if profile_task is not None:
+            profile_task.cancel()
+        if lag_monitor is not None:
+            lag_monitor.stop()
+        if tracer is not None:
+            tracer.close()
+        if exporter is not None:
+            await exporter.close()
+        # scheduler.run() и shutdown() возвращаются, когда очередь, совпадения
+        # и фильтры уже записаны, поэтому отчёт шарда содержит итоговые числа
+        if router is not None:
+            router.report(await stats.snapshot(), await stats.get_failed_domains())
         print("=== Crawler finished ===")
 
     except Exception as e:
         logging.error(f"!!! Critical error: {str(e)}", exc_info=True)
         raise
 
+def run_shard(args, shard_id: int, shards: int, inboxes, reports, barrier):
+    """
+    Точка входа процесса-шарда (см. crawler/sharding.py).
+    """
+    router = ShardRouter(shard_id, shards, inboxes, reports, barrier)
+    try:
+        asyncio.run(main(args, router))
+    except KeyboardInterrupt:
+        pass
+
+def main_sharded(args):
+    print(f"=== Starting {args.shards} crawler shards ===")
+    totals, failed_domains = run_shards(run_shard, args, args.shards)
+
+    print("\n=== Final Statistics (all shards) ===")
+    print(f"Total snapshots found:     {int(totals.get('total_snapshots', 0))}")
+    print(f"New snapshots processed:   {int(totals.get('new_snapshots', 0))}")
+    print(f"URLs crawled:              {int(totals.get('processed_urls', 0))}")
+    print(f"Keyword matches found:     {int(totals.get('match_count', 0))}")
+    print(f"URLs routed between shards: {int(totals.get('shard_routed_urls', 0))}")
+    if failed_domains:
+        print("\n=== Problem Domains ===")
+        for domain in failed_domains:
+            print(f" - {domain}")
+
 if __name__ == '__main__':
     try:
-        asyncio.run(main())
+        args = parse_args()
+        if args.shards > 1:
+            main_sharded(args)
+        else:
+            asyncio.run(main(args))
     except KeyboardInterrupt:
         print("\nInterrupted by user")
     finally:
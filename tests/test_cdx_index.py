@@ -0,0 +1,24 @@
+from crawler.cdx_index import CDXIndex
+from crawler.wayback_cdx import CDXRecord
+
+def record(urlkey, timestamp):
+    return CDXRecord(urlkey, timestamp, f"http://{urlkey}", "200", "text/html")
+
+def test_index_resume_and_lookup(tmp_path):
+    index = CDXIndex(str(tmp_path), "a.jp", "2004", "2005", block_lines=2)
+    index.append([record("jp,a)/b", "20040102"), record("jp,a)/a", "20040101")])
+    index.checkpoint("KEY1")
+    index.close()
+
+    resumed = CDXIndex(str(tmp_path), "a.jp", "2004", "2005", block_lines=2)
+    assert resumed.resume_key == "KEY1"
+    assert [r.urlkey for r in resumed.iter_journal()] == ["jp,a)/b", "jp,a)/a"]
+
+    resumed.append([record("jp,a)/c", "20040103"), record("jp,a)/a", "20040101")])
+    resumed.finalize()
+    assert resumed.is_fresh(max_age_days=1)
+    assert [r.urlkey for r in resumed.iter_records()] == ["jp,a)/a", "jp,a)/b", "jp,a)/c"]
+    assert resumed.contains("jp,a)/c")
+    assert resumed.contains("jp,a)/b", "20040102")
+    assert not resumed.contains("jp,a)/b", "20040101")
+    assert not resumed.contains("jp,a)/d")
@@ -0,0 +1,109 @@
+import asyncio
+import aiohttp
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from crawler.congestion import AdaptiveLimiter
+from crawler.wayback_cdx import WaybackCDXClient
+
+def test_cdx_body_is_read_outside_the_limiter_window():
+    async def scenario():
+        release = asyncio.Event()
+
+        async def cdx(request):
+            response = web.StreamResponse(headers={'Content-Type': 'text/plain'})
+            await response.prepare(request)
+            await response.write(b"jp,a)/ 20040101000000 http://a.jp/ 200 text/html AAAA\n")
+            await release.wait()
+            await response.write(b"jp,a)/b 20040101000000 http://a.jp/b 200 text/html BBBB\n")
+            await response.write_eof()
+            return response
+
+        app = web.Application()
+        app.router.add_get('/cdx', cdx)
+        limiter = AdaptiveLimiter(initial_window=1, min_window=1, max_window=1)
+        async with TestServer(app) as server, aiohttp.ClientSession() as session:
+            client = WaybackCDXClient(session, limiter=limiter, base_url=str(server.make_url('/cdx')))
+            records = client.stream_snapshots("a.jp")
+            first = await records.__anext__()
+            in_flight = limiter.in_flight
+            # Окно из одного места свободно, пока дочитывается тело страницы CDX
+            async with asyncio.timeout(1):
+                async with limiter.slot() as slot:
+                    slot.record(200)
+            release.set()
+            rest = [record async for record in records]
+        return first.original, in_flight, [record.original for record in rest]
+
+    assert asyncio.run(scenario()) == ("http://a.jp/", 0, ["http://a.jp/b"])
+
+async def respond(limiter, status, latency=0.01, retry_after=None):
+    async with limiter.slot() as slot:
+        slot.record(status, retry_after)
+        slot.latency = latency
+
+def test_window_grows_on_success_up_to_max():
+    async def scenario():
+        limiter = AdaptiveLimiter(initial_window=4, max_window=6)
+        for _ in range(4):
+            await respond(limiter, 200)
+        grown = limiter.window
+        for _ in range(100):
+            await respond(limiter, 200)
+        return grown, limiter.window
+
+    grown, final = asyncio.run(scenario())
+    # Примерно +1 за окно успешных ответов
+    assert 4.8 < grown < 5
+    assert final == 6
+
+def test_overload_halves_window_once_per_cooldown():
+    async def scenario():
+        limiter = AdaptiveLimiter(initial_window=16, cooldown=60)
+        await respond(limiter, 429)
+        after_429 = limiter.limit
+        await respond(limiter, 503)  # в пределах cooldown
+        await respond(limiter, 404)  # не перегрузка
+        return after_429, limiter.limit
+
+    assert asyncio.run(scenario()) == (8, 8)
+
+def test_window_never_drops_below_min():
+    async def scenario():
+        limiter = AdaptiveLimiter(initial_window=16, min_window=3, cooldown=0)
+        for status in (503, 429, 503, 429):
+            await respond(limiter, status)
+        return limiter.window, limiter.limit
+
+    assert asyncio.run(scenario()) == (3, 3)
+
+def test_latency_spike_and_network_error_count_as_congestion():
+    async def scenario():
+        limiter = AdaptiveLimiter(initial_window=8, cooldown=0, latency_spike=3.0)
+        for _ in range(10):
+            await respond(limiter, 200, latency=0.01)
+        before = limiter.limit
+        await respond(limiter, 200, latency=0.1)
+        after_spike = limiter.limit
+        try:
+            async with limiter.slot():
+                raise asyncio.TimeoutError()
+        except asyncio.TimeoutError:
+            pass
+        return before, after_spike, limiter.limit, round(limiter.baseline_latency, 3)
+
+    before, after_spike, after_error, baseline = asyncio.run(scenario())
+    assert before == 9
+    assert after_spike == 4
+    assert after_error == 2
+    # Медленный ответ не сдвигает базовую задержку
+    assert baseline == 0.01
+
+def test_retry_after_pauses_new_slots():
+    async def scenario():
+        limiter = AdaptiveLimiter(initial_window=4, cooldown=0)
+        await respond(limiter, 429, retry_after=0.3)
+        started = asyncio.get_running_loop().time()
+        await respond(limiter, 200)
+        return asyncio.get_running_loop().time() - started
+
+    assert asyncio.run(scenario()) >= 0.25
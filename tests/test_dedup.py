@@ -0,0 +1,14 @@
+from crawler.dedup import ContentDedup
+
+PAGE = "<html><body>" + " ".join(f"post {i} by anonymous on 2ch" for i in range(200)) + "</body></html>"
+
+def test_exact_and_near_duplicates():
+    dedup = ContentDedup(near_duplicates=True)
+    fp = dedup.fingerprint(PAGE)
+    assert dedup.lookup(fp) == (None, None)
+    dedup.add(fp, (["2ch"], ["http://example.com/next"]), 0.01)
+
+    assert dedup.lookup(dedup.fingerprint(PAGE))[0] == 'exact'
+    similar = PAGE.replace("post 7 by", "post 7 edited by")
+    assert dedup.lookup(dedup.fingerprint(similar)) == ('near', (["2ch"], ["http://example.com/next"]))
+    assert dedup.lookup(dedup.fingerprint("<html>something else entirely</html>")) == (None, None)
@@ -0,0 +1,29 @@
+from crawler.encoding import CharsetDecoder, sniff_meta
+
+TEXT = "<html><body>白い顔の女がこちらを見ていた</body></html>"
+
+def test_declared_charsets():
+    decoder = CharsetDecoder()
+    assert decoder.decode(b'\xef\xbb\xbf' + TEXT.encode('utf-8')).text == TEXT
+    decoded = decoder.decode(TEXT.encode('shift_jis'), 'text/html; charset=Shift_JIS')
+    assert (decoded.text, decoded.source) == (TEXT, 'header')
+
+    page = f'<meta http-equiv="Content-Type" content="text/html; charset=euc-jp">{TEXT}'
+    decoded = decoder.decode(page.encode('euc-jp'), 'text/html')
+    assert (decoded.text, decoded.encoding, decoded.source) == (page, 'euc_jp', 'meta')
+    assert sniff_meta(b'<meta charset="x-sjis">') == 'cp932'
+
+def test_detection_and_host_cache():
+    decoder = CharsetDecoder()
+    for encoding in ('shift_jis', 'euc-jp', 'utf-8'):
+        decoded = decoder.decode(TEXT.encode(encoding), 'text/html')
+        assert decoded.text == TEXT
+
+    decoder.decode(TEXT.encode('euc-jp'), '', 'geocities.jp')
+    decoded = decoder.decode(TEXT.encode('euc-jp'), '', 'geocities.jp')
+    assert (decoded.text, decoded.source) == (TEXT, 'cache')
+
+def test_wrong_declaration_is_counted():
+    decoded = CharsetDecoder().decode(TEXT.encode('shift_jis'), 'text/html; charset=utf-8')
+    assert decoded.text == TEXT
+    assert decoded.misdecoded and not decoded.replaced
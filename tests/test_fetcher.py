@@ -0,0 +1,176 @@
+import gzip
+import asyncio
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from config import load_config
+from crawler.fetcher import Fetcher
+from crawler.stats import Stats
+
+PAGE = "<html><body>white face</body></html>"
+
+def make_fetcher(**overrides):
+    cfg = load_config('config.yaml').fetch
+    cfg.backoff_base = 0.001
+    cfg.backoff_max = 0.01
+    for name, value in overrides.items():
+        setattr(cfg, name, value)
+    return Fetcher(cfg, None, Stats())
+
+async def serve(responses, scenario):
+    """
+    Отдаёт ответы из responses по очереди (последний повторяется)
+    и выполняет scenario(url страницы) на запущенном сервере.
+    """
+    requests = []
+
+    async def handle(request):
+        requests.append(request.path)
+        return await responses[min(len(requests), len(responses)) - 1](request)
+
+    app = web.Application()
+    app.router.add_get('/{path:.*}', handle)
+    async with TestServer(app) as server:
+        result = await scenario(str(server.make_url('/page.html')))
+    return result, len(requests)
+
+def html(text=PAGE, content_type='text/html'):
+    async def handle(request):
+        return web.Response(text=text, content_type=content_type)
+    return handle
+
+def status(code, retry_after=None):
+    headers = {'Retry-After': retry_after} if retry_after is not None else None
+
+    async def handle(request):
+        return web.Response(status=code, text='error', headers=headers)
+    return handle
+
+def test_backoff_bounds():
+    fetcher = make_fetcher(backoff_base=0.5, backoff_max=4, retry_after_max=60)
+    for attempt in range(10):
+        delays = [fetcher._backoff(attempt, None) for _ in range(200)]
+        assert 0 <= min(delays) and max(delays) <= min(4, 0.5 * 2 ** attempt)
+    assert fetcher._backoff(0, 7.0) == 7.0
+    assert fetcher._backoff(0, 3600.0) == 60
+
+def test_retries_transient_statuses_through_host_gate():
+    fetcher = make_fetcher()
+    gated = []
+
+    async def gate(url):
+        gated.append(url)
+
+    async def scenario(url):
+        try:
+            return await fetcher.fetch(url, gate), gated, url
+        finally:
+            await fetcher.close()
+
+    ((content, _), gated, url), requests = asyncio.run(serve([status(503), status(429, '0'), html()], scenario))
+    assert content == PAGE
+    assert requests == 3
+    assert gated == [url, url]
+    stats = fetcher.stats
+    assert asyncio.run(stats.get("fetch_retries")) == 2
+    assert asyncio.run(stats.get("fetch_status_503")) == 1
+
+def test_client_errors_are_not_retried():
+    fetcher = make_fetcher()
+
+    async def scenario(url):
+        try:
+            return await fetcher.fetch(url)
+        finally:
+            await fetcher.close()
+
+    (content, _), requests = asyncio.run(serve([status(404)], scenario))
+    assert content is None and requests == 1
+
+def test_gives_up_after_max_retries_and_on_long_retry_after():
+    fetcher = make_fetcher(max_retries=2, retry_after_max=60)
+
+    async def scenario(url):
+        try:
+            return await fetcher.fetch(url)
+        finally:
+            await fetcher.close()
+
+    (content, _), requests = asyncio.run(serve([status(500)], scenario))
+    assert content is None and requests == 3
+
+    # Retry-After дольше retry_after_max: без ожидания и без повторов
+    fetcher = make_fetcher(max_retries=2, retry_after_max=60)
+    (content, _), requests = asyncio.run(serve([status(429, '3600')], scenario))
+    assert content is None and requests == 1
+    assert asyncio.run(fetcher.stats.get("fetch_retry_after_exceeded")) == 1
+    assert asyncio.run(fetcher.stats.get("fetch_failures")) == 1
+
+def trickle(*parts, content_type='text/html'):
+    """
+    Тело без Content-Length, отправляемое частями с паузами: клиент
+    получает их отдельными кусками.
+    """
+    async def handle(request):
+        response = web.StreamResponse(headers={'Content-Type': content_type})
+        await response.prepare(request)
+        for part in parts:
+            await response.write(part)
+            await asyncio.sleep(0.02)
+        await response.write_eof()
+        return response
+    return handle
+
+async def fetch_once(fetcher, handler):
+    app = web.Application()
+    app.router.add_get('/{path:.*}', handler)
+    async with TestServer(app) as server:
+        try:
+            content, _ = await fetcher.fetch(str(server.make_url('/page.html')))
+        finally:
+            await fetcher.close()
+    return content
+
+def counters(fetcher, *keys):
+    return [asyncio.run(fetcher.stats.get(key)) for key in keys]
+
+def test_oversized_body_is_truncated_and_marked_in_warc(tmp_path):
+    from crawler.warc import WarcWriter, find_warc_files
+    page = "<html><body>" + "white face " * 1000 + "</body></html>"
+    fetcher = make_fetcher(max_body_mb=4096 / (1024 * 1024), truncate_oversized=True)
+    fetcher.warc_writer = WarcWriter(str(tmp_path))
+
+    content = asyncio.run(fetch_once(fetcher, html(page)))
+    assert content == page[:4096]
+    assert counters(fetcher, "fetch_skipped_truncated") == [1]
+    with gzip.open(find_warc_files([str(tmp_path)])[0], 'rb') as f:
+        warc = f.read()
+    assert b'WARC-Truncated: length' in warc
+
+def test_content_length_over_limit_is_rejected_before_reading():
+    page = "<html>" + "x" * 10000 + "</html>"
+    fetcher = make_fetcher(max_body_mb=4096 / (1024 * 1024), truncate_oversized=False)
+
+    content = asyncio.run(fetch_once(fetcher, html(page)))
+    assert content is None
+    assert counters(fetcher, "fetch_skipped_oversized", "fetch_bytes_saved") == [1, len(page)]
+
+def test_binary_signature_split_across_chunks_is_sniffed():
+    fetcher = make_fetcher()
+    content = asyncio.run(fetch_once(fetcher, trickle(b'%P', b'DF-1.4\n', b' ' * 2000)))
+    assert content is None
+
+    # Короче килобайта: решение по всему телу
+    fetcher = make_fetcher()
+    assert asyncio.run(fetch_once(fetcher, trickle(b'GI', b'F89a\x01\x00'))) is None
+    assert counters(fetcher, "fetch_skipped_binary") == [1]
+
+    fetcher = make_fetcher()
+    assert asyncio.run(fetch_once(fetcher, trickle(b'<ht', PAGE[3:].encode()))) == PAGE
+
+def test_non_html_content_type_is_dropped_but_xhtml_is_kept():
+    fetcher = make_fetcher()
+    assert asyncio.run(fetch_once(fetcher, html(PAGE, 'application/pdf'))) is None
+    assert counters(fetcher, "fetch_skipped_mime") == [1]
+
+    fetcher = make_fetcher()
+    assert asyncio.run(fetch_once(fetcher, html(PAGE, 'application/xhtml+xml'))) == PAGE
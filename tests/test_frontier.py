@@ -0,0 +1,68 @@
+import time
+import asyncio
+from crawler.frontier import HostFrontier, PrioritizedItem
+
+def wayback(domain, path):
+    return f"http://web.archive.org/web/20040101000000id_/http://{domain}/{path}"
+
+def test_round_robin_across_seed_domains():
+    async def scenario():
+        frontier = HostFrontier(default_interval=0.001, seed_domains=["2ch.net", "pya.cc"])
+        for i in range(5):
+            await frontier.put(PrioritizedItem(0, 0, wayback("news.2ch.net", i)))
+        await frontier.put(PrioritizedItem(0, 0, wayback("pya.cc", "a")))
+        first = [await frontier.get() for _ in range(3)]
+        return [frontier.fairness_key(item.url) for item in first]
+
+    assert asyncio.run(scenario()) == ["2ch.net", "pya.cc", "2ch.net"]
+
+def test_per_host_interval_does_not_block_other_hosts():
+    async def scenario():
+        frontier = HostFrontier(default_interval=0.001, host_intervals={"slow.jp": 0.2})
+        await frontier.put(PrioritizedItem(0, 0, "http://slow.jp/1"))
+        await frontier.put(PrioritizedItem(0, 0, "http://slow.jp/2"))
+        await frontier.put(PrioritizedItem(0, 0, "http://fast.jp/1"))
+        started = time.monotonic()
+        order = [(await frontier.get()).url for _ in range(3)]
+        return order, time.monotonic() - started
+
+    order, elapsed = asyncio.run(scenario())
+    assert order == ["http://slow.jp/1", "http://fast.jp/1", "http://slow.jp/2"]
+    assert elapsed >= 0.15
+
+def test_spills_to_disk_and_resumes_after_restart(tmp_path):
+    from crawler.frontier_store import FrontierStore
+    path = str(tmp_path / 'frontier.sqlite3')
+
+    async def first_run():
+        frontier = HostFrontier(maxsize=2, default_interval=0, store=FrontierStore(path))
+        for i in range(5):
+            await frontier.put(PrioritizedItem(i, 0, f"http://a.jp/{i}"))
+        assert frontier.qsize() == 5
+        done = await frontier.get()
+        frontier.task_done(done)
+        await frontier.get()  # взят, но не обработан до «сбоя»
+        await frontier.close()
+        await frontier.close_store()
+        return done.url
+
+    async def second_run():
+        frontier = HostFrontier(maxsize=2, default_interval=0, store=FrontierStore(path))
+        assert await frontier.restore() == 4
+        urls = [(await frontier.get()).url for _ in range(4)]
+        await frontier.close_store()
+        return urls
+
+    assert asyncio.run(first_run()) == "http://a.jp/0"
+    assert asyncio.run(second_run()) == [f"http://a.jp/{i}" for i in range(1, 5)]
+
+def test_retry_tokens_delay_queued_urls_of_the_same_host():
+    async def scenario():
+        frontier = HostFrontier(default_interval=0.2)
+        await frontier.put(PrioritizedItem(0, 0, "http://slow.jp/1"))
+        started = time.monotonic()
+        await frontier.acquire("http://slow.jp/retried")  # повтор забирает токен
+        await frontier.get()
+        return time.monotonic() - started
+
+    assert asyncio.run(scenario()) >= 0.15
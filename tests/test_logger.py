@@ -0,0 +1,7 @@
+from crawler.logger import LogSampler
+
+def test_log_sampler():
+    sampler = LogSampler(3)
+    assert [sampler.sample() for _ in range(6)] == [False, False, True, False, False, True]
+    assert all(LogSampler(1).sample() for _ in range(3))
+    assert not any(LogSampler(0).sample() for _ in range(3))
@@ -0,0 +1,30 @@
+import asyncio
+from crawler.metrics import MetricsRegistry, OVERFLOW_LABEL
+from crawler.stats import Stats
+
+def test_histogram_and_labels_render():
+    registry = MetricsRegistry()
+    hist = registry.histogram('fetch_duration_seconds', 'Fetch time', buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        hist.observe(value)
+    responses = registry.counter('fetch_responses_total', 'Responses', ('domain', 'status'), max_series=2)
+    responses.inc(1, 'a.jp', '200')
+    responses.inc(1, 'a.jp', '200')
+    responses.inc(1, 'b.jp', '404')
+    responses.inc(1, 'c.jp', '200')
+
+    text = registry.render()
+    assert 'jtk_fetch_duration_seconds_bucket{le="0.1"} 2' in text
+    assert 'jtk_fetch_duration_seconds_bucket{le="1"} 3' in text
+    assert 'jtk_fetch_duration_seconds_bucket{le="+Inf"} 4' in text
+    assert 'jtk_fetch_duration_seconds_count 4' in text
+    assert 'jtk_fetch_responses_total{domain="a.jp",status="200"} 2' in text
+    assert responses.get(OVERFLOW_LABEL, OVERFLOW_LABEL) == 1
+
+def test_stats_counters_exported():
+    stats = Stats()
+    asyncio.run(stats.increment('fetch_status_200', 3))
+    asyncio.run(stats.set_gauge('concurrency_window', 4))
+    text = stats.metrics.render()
+    assert 'jtk_fetch_status_200_total 3' in text
+    assert 'jtk_concurrency_window 4' in text
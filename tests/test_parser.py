@@ -0,0 +1,80 @@
+from crawler.keywords import KeywordMatcher
+
+def test_matcher_whitespace_and_case():
+    matcher = KeywordMatcher(["white face", "ghostly smile"])
+    found = matcher.findall("A dead WHITE\n  Face and ghostly smileys")
+    assert found == ["WHITE\n  Face"]
+
+def test_matcher_overlapping_keywords():
+    matcher = KeywordMatcher(["dead white face", "white face"])
+    assert matcher.findall("dead white face") == ["dead white face", "white face"]
+
+def test_matcher_cjk_without_word_boundaries():
+    matcher = KeywordMatcher(["白い顔", "2004怪しい画像"])
+    found = matcher.findall("これは白い顔です。2004怪しい画像を見た x2004怪しい画像")
+    assert found == ["白い顔", "2004怪しい画像"]
+
+PAGE = """<html><head><title>Pale Face archive</title>
+<meta name="description" content="a ghostly smile">
+<script>var s = "creepy grin";</script><style>.x { color: white }</style></head>
+<body><!-- 白い顔 --><p><b><i>white</i></b> face <a href="/next.html" title="eerie smile">next</a></p>
+<img src="pic.jpg" alt="doll face"><iframe src="http://other.jp/frame.html"></iframe>
+<link href="style.css"></body></html>"""
+
+def make_parser(backend):
+    from config import ParserConfig
+    from crawler.parser import Parser
+    cfg = ParserConfig(patterns_file='keywords.txt', url_filters='url_filters.txt',
+                       case_sensitive=False, backend=backend)
+    return Parser(cfg)
+
+def test_lxml_backend_matches_bs4():
+    base = "http://example.jp/dir/page.html"
+    matches_bs4, urls_bs4 = make_parser('bs4').parse(PAGE, base)
+    matches_lxml, urls_lxml = make_parser('lxml').parse(PAGE, base)
+    assert sorted(matches_lxml) == sorted(matches_bs4)
+    assert urls_lxml == urls_bs4
+    assert "Pale Face" in matches_lxml and "白い顔" in matches_lxml
+
+def test_url_filter_rules_and_scope():
+    from crawler.url_filter import UrlFilter
+    url_filter = UrlFilter.from_file('url_filters.txt', scope_domains=['2ch.net'])
+    snapshot = "http://web.archive.org/web/20040101000000id_/http:/www.2ch.net/"
+    urls = [snapshot + "a.html", snapshot + "b.JPG", snapshot + "feed/", "javascript:void(0)", "http://other.com/"]
+    assert url_filter.filter(urls) == [snapshot + "a.html"]
+    hits = url_filter.take_hits()
+    assert hits['feed'] == 1 and hits['javascript'] == 1 and hits['out_of_scope'] == 1
+    assert sum(hits.values()) == 4
+
+def test_parse_pool_matches_inline_parser_and_bounds_in_flight():
+    import asyncio
+    from crawler.parse_pool import ParsePool
+    parser = make_parser('lxml')
+    parser.cfg.workers, parser.cfg.queue_per_worker = 1, 1
+    pages = [(PAGE.replace('next.html', f'next{i}.html'), f"http://example.com/{i}/") for i in range(4)]
+
+    async def scenario():
+        pool = ParsePool(parser.cfg, parser)
+        loop = asyncio.get_running_loop()
+        run_in_executor, in_flight, peak = loop.run_in_executor, [0], [0]
+
+        async def counting(executor, func, *args):
+            in_flight[0] += 1
+            peak[0] = max(peak[0], in_flight[0])
+            try:
+                return await run_in_executor(executor, func, *args)
+            finally:
+                in_flight[0] -= 1
+
+        loop.run_in_executor = counting
+        try:
+            results = await asyncio.gather(*(pool.parse(html, url) for html, url in pages))
+            scanned = await pool.scan(*pages[0])
+        finally:
+            await pool.close()
+        return results, scanned, peak[0]
+
+    results, scanned, peak = asyncio.run(scenario())
+    assert results == [parser.parse(html, url) for html, url in pages]
+    assert scanned == parser.scan(*pages[0])
+    assert peak == 1
@@ -0,0 +1,210 @@
+import asyncio
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from config import load_config
+from crawler.dedup import ContentDedup
+from crawler.fetcher import Fetcher
+from crawler.parser import Parser
+from crawler.scheduler import Scheduler
+from crawler.stats import Stats
+from crawler.storage import Storage
+
+def make_scheduler(tmp_path, parse_pool=None, dedup=None, frontier_path=''):
+    cfg = load_config('config.yaml')
+    cfg.storage.cache_dir = str(tmp_path / 'cache')
+    cfg.storage.results_dir = str(tmp_path / 'results')
+    cfg.scheduler.seeds = []
+    cfg.scheduler.frontier_path = frontier_path
+    cfg.scheduler.log_every = 0
+    cfg.cdx.target_domains_file = str(tmp_path / 'domains.txt')
+    cfg.cdx.index_dir = str(tmp_path / 'cdx_index')
+    stats = Stats()
+    storage = Storage(cfg.storage, stats)
+    fetcher = Fetcher(cfg.fetch, None, stats)
+    return Scheduler(cfg.scheduler, cfg.cdx, storage, fetcher, Parser(cfg.parser), stats, parse_pool, dedup)
+
+def test_duplicate_body_links_resolve_against_its_own_url(tmp_path):
+    scheduler = make_scheduler(tmp_path, dedup=ContentDedup())
+    page = '<html><body>white face <a href="next.html">next</a></body></html>'
+
+    async def scenario():
+        first = await scheduler._parse_or_reuse(page, "http://a.jp/x/index.html")
+        second = await scheduler._parse_or_reuse(page, "http://a.jp/y/copy.html")
+        return first, second, await scheduler.stats.get("dedup_exact_hits")
+
+    first, second, hits = asyncio.run(scenario())
+    scheduler.storage.close()
+    assert first == (["white face"], ["http://a.jp/x/next.html"])
+    assert second == (["white face"], ["http://a.jp/y/next.html"])
+    assert hits == 1
+
+class FakeCDX:
+    """
+    Вместо CDXManager: отдаёт заданные порции семян, а при hang=True
+    после них зависает, как загрузка, прерванная сбоем.
+    """
+    batches = []
+    hang = False
+    emitted = None
+
+    def __init__(self, *args):
+        pass
+
+    async def initialize(self, session):
+        pass
+
+    async def stream_seed_urls(self, on_batch):
+        for batch in self.batches:
+            await on_batch(batch)
+        if self.hang:
+            FakeCDX.emitted.set()
+            await asyncio.Event().wait()
+
+def test_interrupted_bootstrap_is_resumed(tmp_path, monkeypatch):
+    import crawler.scheduler
+    monkeypatch.setattr(crawler.scheduler, 'CDXManager', FakeCDX)
+    frontier_path = str(tmp_path / 'frontier.sqlite3')
+    first = ["http://a.jp/1", "http://a.jp/2"]
+    second = ["http://b.jp/1"]
+
+    async def start(batches, hang):
+        FakeCDX.batches, FakeCDX.hang, FakeCDX.emitted = batches, hang, asyncio.Event()
+        scheduler = make_scheduler(tmp_path, frontier_path=frontier_path)
+        scheduler.storage.load_bloom_filter()
+        await scheduler._resume_or_bootstrap()
+        return scheduler
+
+    async def stop(scheduler):
+        await scheduler.queue.close()
+        await scheduler.queue.close_store()
+        scheduler.storage.close()
+
+    async def interrupted():
+        scheduler = await start([first], hang=True)
+        await FakeCDX.emitted.wait()
+        scheduler.bootstrap_task.cancel()
+        await stop(scheduler)
+
+    async def resumed():
+        scheduler = await start([first, second], hang=False)
+        assert scheduler.bootstrap_task is not None
+        await scheduler.bootstrap_task
+        size = scheduler.queue.qsize()
+        await stop(scheduler)
+        return size
+
+    async def finished():
+        scheduler = await start([first, second], hang=False)
+        started = scheduler.bootstrap_task is not None
+        size = scheduler.queue.qsize()
+        await stop(scheduler)
+        return started, size
+
+    asyncio.run(interrupted())
+    # Уже поставленные семена не дублируются, недостающие догружаются
+    assert asyncio.run(resumed()) == 3
+    assert asyncio.run(finished()) == (False, 3)
+
+def test_workers_start_while_seeds_stream_in(tmp_path):
+    (tmp_path / 'domains.txt').write_text("a.jp\n")
+
+    async def scenario():
+        release = asyncio.Event()
+
+        async def cdx(request):
+            offset = int(request.query.get('resumeKey', 0))
+            if offset:
+                await release.wait()  # вторая страница CDX задерживается
+            text = ''.join(f"jp,a)/ 2004010{offset + i}000000 http://a.jp/ 200 text/html D{offset + i}\n"
+                           for i in range(2))
+            if not offset:
+                text += "\n2\n"
+            return web.Response(text=text, content_type='text/plain')
+
+        app = web.Application()
+        app.router.add_get('/cdx', cdx)
+        async with TestServer(app) as server:
+            scheduler = make_scheduler(tmp_path)
+            scheduler.cdx_cfg.base_url = str(server.make_url('/cdx'))
+            scheduler.cdx_cfg.stream, scheduler.cdx_cfg.stream_batch = True, 2
+            scheduler.queue.default_interval = 0
+            fetched = []
+
+            async def fetch(url, host_gate=None):
+                fetched.append(url)
+                return None, url
+
+            scheduler.fetcher.fetch = fetch
+            await scheduler.fetcher._ensure_session()
+            running = asyncio.create_task(scheduler.run())
+
+            async with asyncio.timeout(5):
+                while len(fetched) < 2:
+                    await asyncio.sleep(0.01)
+            during = (scheduler.bootstrap_task.done(), await scheduler.stats.get_total_urls(), len(fetched))
+
+            release.set()
+            async with asyncio.timeout(5):
+                await scheduler.bootstrap_task
+                while len(fetched) < 4:
+                    await asyncio.sleep(0.01)
+            after = await scheduler.stats.get_total_urls()
+            await scheduler.shutdown()
+            await running
+        return during, after
+
+    during, after = asyncio.run(scenario())
+    # Первая страница CDX уже обрабатывается, пока вторая не пришла
+    assert during == (False, 2, 2)
+    assert after == 4
+
+class SlowRouter:
+    """
+    Вместо ShardRouter: свой единственный шард, а close() ждёт, как
+    барьер других шардов при завершении.
+    """
+    shard_id = 0
+
+    def start(self, enqueue):
+        pass
+
+    def owns(self, url):
+        return True
+
+    def owns_domain(self, domain):
+        return True
+
+    async def close(self, enqueue):
+        await asyncio.sleep(0.3)
+
+def test_run_returns_after_signal_shutdown_has_flushed(tmp_path, monkeypatch):
+    import signal
+    import crawler.scheduler
+    from crawler.results import iter_results
+    from crawler.signals import setup_signal_handlers
+    monkeypatch.setattr(crawler.scheduler, 'CDXManager', FakeCDX)
+    FakeCDX.batches, FakeCDX.hang = [["http://a.jp/1"]], False
+
+    async def scenario():
+        scheduler = make_scheduler(tmp_path, frontier_path=str(tmp_path / 'frontier.sqlite3'))
+        scheduler.router = SlowRouter()
+        scheduler.queue.default_interval = 0
+        fetched = asyncio.Event()
+
+        async def fetch(url, host_gate=None):
+            fetched.set()
+            return '<html><body>a white face</body></html>', url
+
+        scheduler.fetcher.fetch = fetch
+        setup_signal_handlers(scheduler.shutdown)
+        running = asyncio.create_task(scheduler.run())
+        async with asyncio.timeout(5):
+            await fetched.wait()
+            await asyncio.sleep(0.05)
+            signal.raise_signal(signal.SIGINT)
+            await running
+        return scheduler.queue.store, scheduler.stopped.is_set(), list(iter_results(str(tmp_path / 'results')))
+
+    store, stopped, rows = asyncio.run(scenario())
+    assert store is None and stopped
+    assert [row['url'] for row in rows] == ["http://a.jp/1"]
@@ -0,0 +1,24 @@
+from config import load_config
+from crawler.sharding import merge_reports, shard_config, shard_of
+
+def test_snapshots_follow_original_host():
+    shards = 4
+    owner = shard_of("http://www.2ch.net/a.html", shards)
+    assert shard_of("http://web.archive.org/web/20040101000000id_/http://www.2ch.net/b.html", shards) == owner
+    assert len({shard_of(f"http://host{i}.jp/", shards) for i in range(64)}) == shards
+
+def test_shard_config_splits_limits():
+    cfg = load_config('config.yaml')
+    sharded = shard_config(cfg, 1, 4)
+    assert sharded.storage.cache_dir != cfg.storage.cache_dir
+    assert sharded.scheduler.frontier_path != cfg.scheduler.frontier_path
+    assert sharded.fetch.host_rate_limits['web.archive.org'] == cfg.fetch.host_rate_limits['web.archive.org'] * 4
+    assert sharded.concurrency.max_window == cfg.concurrency.max_window // 4
+
+def test_merge_reports():
+    totals, failed = merge_reports([
+        {'shard': 0, 'stats': {'processed_urls': 3, 'match_count': 1}, 'failed_domains': ['a.jp']},
+        {'shard': 1, 'stats': {'processed_urls': 2}, 'failed_domains': ['b.jp', 'a.jp']},
+    ])
+    assert totals == {'processed_urls': 5, 'match_count': 1}
+    assert failed == ['a.jp', 'b.jp']
@@ -1,18 +1,117 @@
+import asyncio
 import pytest
+from config import StorageConfig
+from crawler.stats import Stats
 from crawler.storage import Storage
 
+def make_storage(cache_dir):
+    cfg = StorageConfig(cache_dir=str(cache_dir), bloom_capacity=1000, bloom_error_rate=0.01, cache_ttl_days=7,
+                        batch_size=2, results_dir=str(cache_dir / 'results'))
+    return Storage(cfg, Stats())
+
 @pytest.fixture
-def storage():
-    return Storage({'cache_dir': 'test_cache', 'bloom_capacity': 1000, 'bloom_error_rate': 0.01, 'cache_ttl_days': 7})
+def storage(tmp_path):
+    return make_storage(tmp_path / 'test_cache')
 
 def test_add_visited(storage):
     url = "http://example.com"
     storage.add_visited(url)
     assert storage.is_visited(url) is True
 
+def test_visited_survives_restart(tmp_path):
+    storage = make_storage(tmp_path / 'cache')
+    storage.add_visited("http://example.com/a")
+    storage.save_bloom_filter()
+    storage.add_visited("http://example.com/b")  # только в журнале
+    storage.visited.flush()
+
+    restored = make_storage(tmp_path / 'cache')
+    restored.load_bloom_filter()
+    assert restored.is_visited("http://example.com/a")
+    assert restored.is_visited("http://example.com/b")
+    assert not restored.is_visited("http://example.com/c")
+
 def test_cache(storage):
     url = "http://example.com"
     content = "<html>Test</html>"
     storage.save_to_cache(url, content)
     cached_content = storage.get_from_cache(url)
     assert cached_content == content
+
+def test_page_store_eviction(tmp_path):
+    from crawler.page_store import PageStore
+    store = PageStore(str(tmp_path / 'pages'), ttl_days=7)
+    store.put_sync("http://example.com/a", "<html>same</html>")
+    store.put_sync("http://example.com/b", "<html>same</html>", "http://example.com/b2")
+    store.put_sync("http://example.com/c", "<html>other</html>" * 100)
+    assert store.get_sync("http://example.com/b") == ("<html>same</html>", "http://example.com/b2")
+    store.close()
+
+    reopened = PageStore(str(tmp_path / 'pages'), ttl_days=7, max_bytes=store.total_bytes - 1)
+    assert len(reopened) == 3
+    reopened.sweep_sync()
+    # Самые старые записи (общий объект a/b) вытеснены целиком
+    assert reopened.get_sync("http://example.com/a") is None
+    assert reopened.get_sync("http://example.com/b") is None
+    assert reopened.get_sync("http://example.com/c") is not None
+
+def test_matches_are_flushed_in_batches(tmp_path):
+    from crawler.results import iter_results
+    storage = make_storage(tmp_path / 'cache')
+    results_dir = str(tmp_path / 'cache' / 'results')
+
+    async def run():
+        await storage.save_matches("http://example.com/1", ["白い顔"])
+        assert list(iter_results(results_dir)) == []
+        await storage.save_matches("http://example.com/2", ["white face"])
+        assert len(list(iter_results(results_dir))) == 2  # batch_size достигнут
+        await storage.save_matches("http://example.com/3", ["pale face"])
+        await storage.persist_matches()
+
+    asyncio.run(run())
+    rows = list(iter_results(results_dir))
+    assert [row['url'] for row in rows] == [f"http://example.com/{i}" for i in (1, 2, 3)]
+    assert rows[0]['matches'] == ["白い顔"]
+
+def test_visited_set_grows_past_capacity(tmp_path):
+    storage = make_storage(tmp_path / 'cache')  # bloom_capacity=1000
+    urls = [f"http://example.com/{i}" for i in range(5000)]
+    for url in urls:
+        storage.add_visited(url)
+    assert len(storage.visited.filters) > 1
+    storage.save_bloom_filter()
+
+    restored = make_storage(tmp_path / 'cache')
+    restored.load_bloom_filter()
+    assert all(restored.is_visited(url) for url in urls)
+    false_positives = sum(restored.is_visited(f"http://other.com/{i}") for i in range(5000))
+    assert false_positives <= 5000 * 0.01 * 2
+
+def test_digests_survive_restart(tmp_path):
+    storage = make_storage(tmp_path / 'cache')
+    assert storage.add_digest("AAAA")
+    assert not storage.add_digest("AAAA")
+    assert storage.add_digest("-") and storage.add_digest("-")
+    storage.save_bloom_filter()
+    storage.add_digest("BBBB")  # только в журнале
+    storage.close()
+
+    restored = make_storage(tmp_path / 'cache')
+    restored.load_bloom_filter()
+    assert not restored.add_digest("AAAA")
+    assert not restored.add_digest("BBBB")
+    assert restored.add_digest("CCCC")
+    restored.close()
+
+def test_page_cache_sweeper_runs_only_when_enabled(tmp_path):
+    async def started(page_cache):
+        storage = make_storage(tmp_path / f'cache_{page_cache}')
+        storage.cfg.page_cache = page_cache
+        storage.start()
+        running = storage.pages._sweeper is not None
+        await storage.persist_matches()
+        storage.close()
+        return running
+
+    assert asyncio.run(started(True)) is True
+    assert asyncio.run(started(False)) is False
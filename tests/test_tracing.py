@@ -0,0 +1,20 @@
+import json
+from crawler.metrics import MetricsRegistry
+from crawler.tracing import Tracer, span
+
+def test_trace_records_stages(tmp_path):
+    registry = MetricsRegistry()
+    tracer = Tracer(registry, str(tmp_path / 'trace.jsonl'), sample_rate=1.0)
+    with tracer.trace("http://example.com/"):
+        with span('fetch'):
+            pass
+        with span('parse'):
+            pass
+    with span('outside'):  # без трассы — ничего не делает
+        pass
+    tracer.close()
+
+    record = json.loads((tmp_path / 'trace.jsonl').read_text())
+    assert record['url'] == "http://example.com/"
+    assert {'fetch', 'parse', 'total_ms'} <= set(record)
+    assert 'jtk_stage_duration_seconds_count{stage="parse"} 1' in registry.render()
@@ -0,0 +1,23 @@
+from crawler.utils import canonicalize_url, is_valid_mime_type, looks_binary
+
+def test_canonicalize_url():
+    assert canonicalize_url("HTTP://Example.COM:80?b=2&a=1#top") == "http://example.com/?a=1&b=2"
+    assert canonicalize_url("https://example.com:8443/x") == "https://example.com:8443/x"
+    variants = [
+        "https://web.archive.org/web/20040101000000/http://Ex.jp/x#frag",
+        "http://web.archive.org/web/20040101000000if_/ex.jp/x",
+        "http://web.archive.org/web/20040101000000id_/http:/ex.jp/x",
+    ]
+    assert {canonicalize_url(url) for url in variants} == {
+        "http://web.archive.org/web/20040101000000id_/http://ex.jp/x"
+    }
+
+def test_looks_binary():
+    assert looks_binary(b'PK\x03\x04\x14\x00')
+    assert looks_binary(b'%PDF-1.4\n')
+    assert looks_binary(b'<html>\x00\x00')
+    assert not looks_binary('<html>白い顔</html>'.encode('shift_jis'))
+    assert not looks_binary('<html>'.encode('utf-16'))
+    assert is_valid_mime_type('Text/HTML; charset=Shift_JIS')
+    assert is_valid_mime_type('application/xhtml+xml; charset=utf-8')
+    assert not is_valid_mime_type('text/plain')
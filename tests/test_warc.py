@@ -0,0 +1,20 @@
+from crawler.warc import WarcWriter, iter_warc_responses, find_warc_files, decode_body
+
+def test_warc_roundtrip_with_rotation(tmp_path):
+    writer = WarcWriter(str(tmp_path), max_file_size=200)
+    body = "<html>白い顔</html>".encode('shift_jis')
+    for i in range(3):
+        writer.write_response(
+            f"http://example.com/{i}", 200, "OK", "1.1",
+            [("Content-Type", "text/html; charset=Shift_JIS"), ("Content-Encoding", "gzip")],
+            body
+        )
+    writer.close()
+
+    files = find_warc_files([str(tmp_path)])
+    assert len(files) == 3
+    records = [r for path in files for r in iter_warc_responses(path)]
+    assert [r.url for r in records] == [f"http://example.com/{i}" for i in range(3)]
+    assert records[0].status == 200
+    assert 'content-encoding' not in records[0].headers
+    assert decode_body(records[0].body, records[0].headers['content-type']) == "<html>白い顔</html>"
@@ -0,0 +1,190 @@
+import json
+import asyncio
+import aiohttp
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from config import load_config
+from crawler.cdx_index import CDXIndex
+from crawler.stats import Stats
+from crawler.storage import Storage
+from crawler.wayback_cdx import CDXManager, CDXRecord, InvalidCDXResponse, WaybackCDXClient
+
+def make_manager(tmp_path, **overrides):
+    config = load_config('config.yaml')
+    config.storage.cache_dir = str(tmp_path / 'cache')
+    config.storage.results_dir = str(tmp_path / 'results')
+    cfg = config.cdx
+    for name, value in overrides.items():
+        setattr(cfg, name, value)
+    manager = CDXManager(cfg, Storage(config.storage, Stats()))
+    manager.client = WaybackCDXClient(session=None, wayback_base="http://web.archive.org/web")
+    return manager
+
+def capture(timestamp, digest):
+    return CDXRecord("jp,a)/", timestamp, "http://a.jp/", "200", "text/html", digest)
+
+def test_json_page_is_mapped_by_header_row():
+    client = WaybackCDXClient(session=None)
+    data = [
+        ["original", "timestamp", "digest", "urlkey", "mimetype", "statuscode"],
+        ["http://a.jp/", "20040101000000", "AAAA", "jp,a)/", "text/html", "200"],
+        ["http://a.jp/short", "20040101000000"],
+    ]
+    assert client._process_cdx_response(data) == [
+        CDXRecord("jp,a)/", "20040101000000", "http://a.jp/", "200", "text/html", "AAAA")
+    ]
+    # Старый список полей без digest
+    old = [["urlkey", "timestamp", "original", "statuscode", "mimetype"],
+           ["jp,a)/", "20040101000000", "http://a.jp/", "200", "text/html"]]
+    assert client._process_cdx_response(old)[0].digest == "-"
+
+def test_unchanged_captures_are_not_seeded(tmp_path):
+    manager = make_manager(tmp_path)
+    records = [
+        capture("20040101000000", "AAAA"),
+        capture("20040201000000", "AAAA"),
+        capture("20040301000000", "BBBB"),
+        capture("20040401000000", "-"),
+        capture("20040501000000", "-"),
+    ]
+
+    async def run():
+        urls = await manager._filter_new_records(records)
+        again = await manager._filter_new_records([capture("20040601000000", "BBBB")])
+        return urls, again, await manager.storage.stats.get("cdx_digest_duplicates")
+
+    urls, again, duplicates = asyncio.run(run())
+    manager.storage.close()
+    assert [url.split('/')[4][:8] for url in urls] == ["20040101", "20040301", "20040401", "20040501"]
+    assert again == []
+    assert duplicates == 2
+
+def test_digest_dedup_can_be_disabled(tmp_path):
+    manager = make_manager(tmp_path, dedup_digests=False)
+    records = [capture("20040101000000", "AAAA"), capture("20040201000000", "AAAA")]
+    urls = asyncio.run(manager._filter_new_records(records))
+    manager.storage.close()
+    assert len(urls) == 2
+
+class PagedCDX:
+    """
+    CDX API из четырёх снимков a.jp по две строки на страницу; при broken
+    вторая страница приходит со статусом 200, но в виде HTML.
+    """
+
+    def __init__(self):
+        self.broken = False
+        self.requests = []
+
+    async def handle(self, request):
+        query = request.query
+        offset = int(query.get('resumeKey', 0))
+        self.requests.append(offset)
+        if self.broken and offset:
+            return web.Response(text='<html><body>Service unavailable</body></html>', content_type='text/html')
+        rows = [["jp,a)/", f"2004010{i}000000", "http://a.jp/", "200", "text/html", f"D{i}"] for i in range(4)]
+        page = rows[offset:offset + 2]
+        next_key = str(offset + 2) if offset + 2 < len(rows) else None
+        if query.get('output') == 'json':
+            data = [list(CDXRecord._fields)] + page + ([[], [next_key]] if next_key else [])
+            return web.Response(text=json.dumps(data), content_type='application/json')
+        text = ''.join(' '.join(row) + '\n' for row in page) + (f'\n{next_key}\n' if next_key else '')
+        return web.Response(text=text, content_type='text/plain')
+
+@pytest.mark.parametrize('stream', [False, True])
+def test_bad_page_keeps_index_resumable(tmp_path, stream):
+    cdx = PagedCDX()
+
+    async def crawl(manager):
+        app = web.Application()
+        app.router.add_get('/cdx', cdx.handle)
+        async with TestServer(app) as server, aiohttp.ClientSession() as session:
+            manager.cfg.base_url = str(server.make_url('/cdx'))
+            await manager.initialize(session)
+            timestamps = []
+            try:
+                async for records in manager._iter_record_batches("a.jp"):
+                    timestamps += [record.timestamp[:8] for record in records]
+            finally:
+                manager.storage.close()
+            return timestamps
+
+    def index(manager):
+        return CDXIndex(manager.cfg.index_dir, "a.jp", manager.cfg.from_date, manager.cfg.to_date)
+
+    options = dict(stream=stream, stream_batch=1, page_size=2, max_retries=0, collapse="urlkey",
+                   index_dir=str(tmp_path / 'cdx_index'))
+    cdx.broken = True
+    manager = make_manager(tmp_path, **options)
+    with pytest.raises(InvalidCDXResponse):
+        asyncio.run(crawl(manager))
+    assert index(manager).resume_key == "2"
+    assert not index(manager).is_fresh(30)
+
+    cdx.broken = False
+    cdx.requests.clear()
+    manager = make_manager(tmp_path, **options)
+    timestamps = asyncio.run(crawl(manager))
+    assert timestamps == ["20040100", "20040101", "20040102", "20040103"]
+    assert cdx.requests == [2]  # первая страница взята из журнала
+    assert index(manager).is_fresh(30)
+
+def stream_records(handler, **options):
+    async def scenario():
+        app = web.Application()
+        app.router.add_get('/cdx', handler)
+        async with TestServer(app) as server, aiohttp.ClientSession() as session:
+            client = WaybackCDXClient(session, base_url=str(server.make_url('/cdx')), **options)
+            keys = []
+            records = [record async for record in client.stream_snapshots("a.jp", on_resume_key=keys.append)]
+        return records, keys
+    return asyncio.run(scenario())
+
+LINES = [f"jp,a)/{i} 2004010{i}000000 http://a.jp/{i} 200 text/html D{i}\n" for i in range(4)]
+
+def test_stream_parses_lines_and_follows_trailer_key():
+    requests = []
+
+    async def cdx(request):
+        offset = int(request.query.get('resumeKey', 0))
+        requests.append(offset)
+        if offset == 0:
+            # Ключ в конце тела после пустой строки важнее заголовка
+            text = LINES[0] + "broken line\n" + LINES[1] + "\n2\n"
+            return web.Response(text=text, headers={'Resume-Key': 'stale'})
+        if offset == 2:
+            # Без ключа в теле используется заголовок Resume-Key
+            return web.Response(text=LINES[2], headers={'Resume-Key': '3'})
+        return web.Response(text=LINES[3])
+
+    records, keys = stream_records(cdx)
+    assert records == [CDXRecord(*line.split()) for line in LINES]
+    assert requests == [0, 2, 3]
+    assert keys == ["2", "3", None]
+
+def test_stream_max_pages_ends_pagination():
+    async def cdx(request):
+        return web.Response(text=LINES[0] + "\n2\n")
+
+    records, keys = stream_records(cdx, max_pages=1)
+    assert len(records) == 1 and keys == [None]
+
+def test_retried_page_does_not_repeat_records():
+    attempts = []
+
+    async def cdx(request):
+        attempts.append(request.query.get('resumeKey'))
+        response = web.StreamResponse()
+        await response.prepare(request)
+        await response.write((LINES[0] + LINES[1]).encode())
+        if len(attempts) == 1:
+            raise ConnectionResetError("connection dropped mid-page")
+        await response.write((LINES[2] + LINES[3]).encode())
+        await response.write_eof()
+        return response
+
+    records, keys = stream_records(cdx, max_retries=1)
+    assert [record.timestamp for record in records] == [f"2004010{i}000000" for i in range(4)]
+    assert attempts == [None, None]
+    assert keys == [None]